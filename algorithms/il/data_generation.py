@@ -1,4 +1,6 @@
 """Extract expert states and actions from Waymo Open Dataset."""
+import os
+import glob
 import torch
 import numpy as np
 import imageio
@@ -20,47 +22,92 @@ def parse_args():
         default="delta_local",
         choices=["delta_local", "bicycle", "classic"],
     )
+    parser.add_argument(
+        "--shard-dir",
+        type=str,
+        default=None,
+        help="Stream (obs, action, next_obs, done) shards to this directory",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=100_000,
+        help="Number of transitions per shard",
+    )
     args = parser.parse_args()
     return args
 
 
-def map_to_closest_discrete_value(grid, cont_actions):
-    """
-    Find the nearest value in the action grid for a given expert action.
+class ExpertShardWriter:
+    """Buffers expert transitions and writes them to disk in shards.
+
+    Each shard is a `torch.save`d dict with the keys "obs", "actions",
+    "next_obs" and "dones", holding at most `shard_size` transitions.
     """
-    # Calculate the absolute differences and find the indices of the minimum values
-    abs_diff = torch.abs(grid.unsqueeze(0) - cont_actions.unsqueeze(-1))
-    indx = torch.argmin(abs_diff, dim=-1)
 
-    # Gather the closest values based on the indices
-    closest_values = grid[indx]
+    def __init__(self, shard_dir, shard_size):
+        self.shard_dir = shard_dir
+        self.shard_size = shard_size
+        self.shard_paths = []
+        self._buffer = {"obs": [], "actions": [], "next_obs": [], "dones": []}
+        self._num_buffered = 0
+        os.makedirs(shard_dir, exist_ok=True)
+
+    def add(self, obs, actions, next_obs, dones):
+        """Add a batch of transitions, flushing full shards to disk."""
+        for key, value in zip(
+            self._buffer.keys(), (obs, actions, next_obs, dones)
+        ):
+            self._buffer[key].append(value.cpu())
+        self._num_buffered += obs.shape[0]
+
+        while self._num_buffered >= self.shard_size:
+            self._write(self.shard_size)
+
+    def close(self):
+        """Write the remaining transitions and return all shard paths."""
+        if self._num_buffered > 0:
+            self._write(self._num_buffered)
+        return self.shard_paths
+
+    def _write(self, num_rows):
+        shard, remainder = {}, {}
+        for key, values in self._buffer.items():
+            values = torch.cat(values, dim=0)
+            shard[key] = values[:num_rows].clone()
+            remainder[key] = [values[num_rows:]]
+        self._buffer = remainder
+        self._num_buffered -= num_rows
+
+        path = os.path.join(
+            self.shard_dir, f"shard_{len(self.shard_paths):05d}.pt"
+        )
+        torch.save(shard, path)
+        self.shard_paths.append(path)
 
-    return closest_values, indx
 
+def load_expert_shards(shard_dir):
+    """Iterate over the shards written by `ExpertShardWriter` in order."""
+    for path in sorted(glob.glob(os.path.join(shard_dir, "shard_*.pt"))):
+        yield torch.load(path)
 
-def generate_state_action_pairs(
+
+def _rollout_expert(
     env,
     device,
+    add_transitions,
     action_space_type="discrete",
     use_action_indices=False,
     make_video=False,
     render_index=[0],
     save_path="output_video.mp4",
 ):
-    """Generate pairs of states and actions from the Waymo Open Dataset.
-
-    Args:
-        env (GPUDriveTorchEnv): Initialized environment class.
-        device (str): Where to run the simulation (cpu or cuda).
-        action_space_type (str): discrete, multi-discrete, continuous
-        use_action_indices (bool): Whether to return action indices instead of action values.
-        make_video (bool): Whether to save a video of the expert trajectory.
-        render_index (int): Index of the world to render (must be <= num_worlds).
+    """Step all worlds with the expert actions and pass the (obs, action,
+    next_obs, done) transitions of the alive controlled agents of every step
+    to `add_transitions`.
 
     Returns:
-        expert_actions: Expert actions for the controlled agents. An action is a
-            tuple with (acceleration, steering, heading).
-        obs_tensor: Expert observations for the controlled agents.
+        goal_rate, collision_rate of the controlled agents.
     """
     frames = [[] for _ in range(render_index[1] - render_index[0])]
 
@@ -75,63 +122,19 @@ def generate_state_action_pairs(
     expert_actions, expert_speeds, expert_positions = env.get_expert_actions()
     if action_space_type == "discrete":
         # Discretize the expert actions: map every value to the closest
-        # value in the action grid.
-        disc_expert_actions = expert_actions.clone()
-        if env.config.dynamics_model == "delta_local":
-            disc_expert_actions[:, :, :, 0], _ = map_to_closest_discrete_value(
-                grid=env.dx, cont_actions=expert_actions[:, :, :, 0]
-            )
-            disc_expert_actions[:, :, :, 1], _ = map_to_closest_discrete_value(
-                grid=env.dy, cont_actions=expert_actions[:, :, :, 1]
-            )
-            disc_expert_actions[:, :, :, 2], _ = map_to_closest_discrete_value(
-                grid=env.dyaw, cont_actions=expert_actions[:, :, :, 2]
-            )
-        else:
-            # Acceleration
-            disc_expert_actions[:, :, :, 0], _ = map_to_closest_discrete_value(
-                grid=env.accel_actions, cont_actions=expert_actions[:, :, :, 0]
-            )
-            # Steering
-            disc_expert_actions[:, :, :, 1], _ = map_to_closest_discrete_value(
-                grid=env.steer_actions, cont_actions=expert_actions[:, :, :, 1]
-            )
+        # value in the action grid, for all worlds, agents and steps at once.
+        expert_action_indices = env.encode_actions(expert_actions)
 
         if use_action_indices:  # Map action values to joint action index
             logging.info("Mapping expert actions to joint action index... \n")
-            expert_action_indices = torch.zeros(
-                expert_actions.shape[0],
-                expert_actions.shape[1],
-                expert_actions.shape[2],
-                1,
-                dtype=torch.int32,
-            ).to(device)
-            for world_idx in range(disc_expert_actions.shape[0]):
-                for agent_idx in range(disc_expert_actions.shape[1]):
-                    for time_idx in range(disc_expert_actions.shape[2]):
-                        action_val_tuple = tuple(
-                            round(x, 3)
-                            for x in disc_expert_actions[
-                                     world_idx, agent_idx, time_idx, :
-                                     ].tolist()
-                        )
-                        if not env.config.dynamics_model == "delta_local":
-                            action_val_tuple = (
-                                action_val_tuple[0],
-                                action_val_tuple[1],
-                                0.0,
-                            )
-
-                        action_idx = env.values_to_action_key.get(
-                            action_val_tuple
-                        )
-                        expert_action_indices[
-                            world_idx, agent_idx, time_idx
-                        ] = action_idx
-
-            expert_actions = expert_action_indices
+            expert_actions = (
+                expert_action_indices.unsqueeze(-1).to(torch.int32).to(device)
+            )
         else:
-            # Map action values to joint action index
+            disc_expert_actions = env.decode_actions(expert_action_indices)
+            if env.config.dynamics_model != "delta_local":
+                # Only acceleration and steering are discretized
+                disc_expert_actions[..., 2] = expert_actions[..., 2]
             expert_actions = disc_expert_actions
     elif action_space_type == "multi_discrete":
         """will be update"""
@@ -139,12 +142,6 @@ def generate_state_action_pairs(
     else:
         logging.info("Using continuous expert actions... \n")
 
-    # Storage
-    expert_observations_lst = []
-    expert_actions_lst = []
-    expert_next_obs_lst = []
-    expert_dones_lst = []
-
     # Initialize dead agent mask
 
     dead_agent_mask = ~env.cont_agent_mask.clone()
@@ -160,14 +157,14 @@ def generate_state_action_pairs(
         infos = env.get_infos()
 
         # Unpack and store (obs, action, next_obs, dones) pairs for controlled agents
-        expert_observations_lst.append(obs[~dead_agent_mask, :])
-        expert_actions_lst.append(
-            expert_actions[~dead_agent_mask][:, time_step, :]
+        alive = ~dead_agent_mask
+        add_transitions(
+            obs[alive, :],
+            expert_actions[:, :, time_step, :][alive],
+            next_obs[alive, :],
+            dones[alive],
         )
 
-        expert_next_obs_lst.append(next_obs[~dead_agent_mask, :])
-        expert_dones_lst.append(dones[~dead_agent_mask])
-
         # Update
         obs = next_obs
         dead_agent_mask = torch.logical_or(dead_agent_mask, dones)
@@ -201,6 +198,55 @@ def generate_state_action_pairs(
                 fps=30,
             )
 
+    return goal_rate, collision_rate
+
+
+def generate_state_action_pairs(
+    env,
+    device,
+    action_space_type="discrete",
+    use_action_indices=False,
+    make_video=False,
+    render_index=[0],
+    save_path="output_video.mp4",
+):
+    """Generate pairs of states and actions from the Waymo Open Dataset.
+
+    Args:
+        env (GPUDriveTorchEnv): Initialized environment class.
+        device (str): Where to run the simulation (cpu or cuda).
+        action_space_type (str): discrete, multi-discrete, continuous
+        use_action_indices (bool): Whether to return action indices instead of action values.
+        make_video (bool): Whether to save a video of the expert trajectory.
+        render_index (int): Index of the world to render (must be <= num_worlds).
+
+    Returns:
+        expert_actions: Expert actions for the controlled agents. An action is a
+            tuple with (acceleration, steering, heading).
+        obs_tensor: Expert observations for the controlled agents.
+    """
+    expert_observations_lst = []
+    expert_actions_lst = []
+    expert_next_obs_lst = []
+    expert_dones_lst = []
+
+    def add_transitions(obs, actions, next_obs, dones):
+        expert_observations_lst.append(obs)
+        expert_actions_lst.append(actions)
+        expert_next_obs_lst.append(next_obs)
+        expert_dones_lst.append(dones)
+
+    goal_rate, collision_rate = _rollout_expert(
+        env,
+        device,
+        add_transitions,
+        action_space_type=action_space_type,
+        use_action_indices=use_action_indices,
+        make_video=make_video,
+        render_index=render_index,
+        save_path=save_path,
+    )
+
     flat_expert_obs = torch.cat(expert_observations_lst, dim=0)
     flat_expert_actions = torch.cat(expert_actions_lst, dim=0)
     flat_next_expert_obs = torch.cat(expert_next_obs_lst, dim=0)
@@ -216,6 +262,42 @@ def generate_state_action_pairs(
     )
 
 
+def generate_state_action_shards(
+    env,
+    device,
+    shard_dir,
+    shard_size=100_000,
+    action_space_type="discrete",
+    use_action_indices=False,
+    make_video=False,
+    render_index=[0],
+    save_path="output_video.mp4",
+):
+    """Like `generate_state_action_pairs`, but stream the (obs, action,
+    next_obs, done) transitions to shards in `shard_dir` instead of keeping
+    them in memory. Read them back with `load_expert_shards`.
+
+    Args:
+        shard_dir (str): Directory to write the shards to.
+        shard_size (int): Number of transitions per shard.
+
+    Returns:
+        shard_paths, goal_rate, collision_rate
+    """
+    shard_writer = ExpertShardWriter(shard_dir, shard_size)
+    goal_rate, collision_rate = _rollout_expert(
+        env,
+        device,
+        shard_writer.add,
+        action_space_type=action_space_type,
+        use_action_indices=use_action_indices,
+        make_video=make_video,
+        render_index=render_index,
+        save_path=save_path,
+    )
+    return shard_writer.close(), goal_rate, collision_rate
+
+
 if __name__ == "__main__":
     import argparse
 
@@ -258,14 +340,7 @@ if __name__ == "__main__":
         action_type="continuous"
     )
     # Generate expert actions and observations
-    (
-        expert_obs,
-        expert_actions,
-        next_expert_obs,
-        expert_dones,
-        goal_rate,
-        collision_rate,
-    ) = generate_state_action_pairs(
+    generation_kwargs = dict(
         env=env,
         device="cpu",
         action_space_type="continuous",  # Discretize the expert actions
@@ -274,6 +349,22 @@ if __name__ == "__main__":
         render_index=[0, 1],  # start_idx, end_idx
         save_path="use_discr_actions_fix",
     )
+    if args.shard_dir is not None:
+        shard_paths, goal_rate, collision_rate = generate_state_action_shards(
+            **generation_kwargs,
+            shard_dir=args.shard_dir,
+            shard_size=args.shard_size,
+        )
+        print(f"Wrote {len(shard_paths)} shards to {args.shard_dir}")
+    else:
+        (
+            expert_obs,
+            expert_actions,
+            next_expert_obs,
+            expert_dones,
+            goal_rate,
+            collision_rate,
+        ) = generate_state_action_pairs(**generation_kwargs)
     env.close()
     del env
     del env_config
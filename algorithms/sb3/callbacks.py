@@ -1,4 +1,3 @@
-from collections import deque
 import os
 import numpy as np
 import torch
@@ -6,9 +5,31 @@ import wandb
 from stable_baselines3.common.callbacks import BaseCallback
 from time import perf_counter
 
+from algorithms.sb3 import distributed
+
 
 class MultiAgentCallback(BaseCallback):
-    """Stable Baselines3 callback for multi-agent gpudrive env."""
+    """Stable Baselines3 callback for multi-agent gpudrive env.
+
+    The statistics of the last `logging_collection_window` finished episodes
+    are kept in a ring buffer on the env's device and only read back when
+    they are logged, every `log_freq` steps.
+
+    In distributed training, the logged metrics are aggregated over the
+    episodes of all ranks, so the callback must run on every rank.
+    """
+
+    # Columns of the episode statistics ring buffer
+    _episode_stat_names = (
+        "num_controlled_agents",
+        "off_road",
+        "veh_collisions",
+        "non_veh_collision",
+        "goal_achieved",
+        "truncated",
+        "obs_max",
+        "obs_min",
+    )
 
     def __init__(self, config, wandb_run=None, **kwargs) -> None:
         super().__init__(**kwargs)
@@ -18,22 +39,9 @@ class MultiAgentCallback(BaseCallback):
         self.step_counter = 0
         self.policy_base_path = os.path.join(wandb.run.dir, "policies")
         os.makedirs(self.policy_base_path, exist_ok=True)
-        self.perc_goal_achieved = deque(
-            maxlen=config.logging_collection_window
-        )
-        self.perc_off_road = deque(maxlen=config.logging_collection_window)
-        self.perc_veh_collisions = deque(
-            maxlen=config.logging_collection_window
-        )
-        self.perc_non_veh_collision = deque(
-            maxlen=config.logging_collection_window
-        )
-        self.num_agent_rollouts = deque(
-            maxlen=config.logging_collection_window
-        )
-        self.perc_truncated = deque(maxlen=config.logging_collection_window)
-        self.max_obs = deque(maxlen=config.logging_collection_window)
-        self.min_obs = deque(maxlen=config.logging_collection_window)
+        # Allocated on the env's device at the first step
+        self.episode_stats = None
+        self.num_episode_stats = 0
 
         self._define_wandb_metrics()
 
@@ -69,62 +77,111 @@ class MultiAgentCallback(BaseCallback):
     def _on_step(self) -> bool:
         """Will be called by the model after each call to `env.step()`."""
         self.step_counter += 1
-        env_info = self.locals["env"].info_dict
-
-        if env_info:
-            self.num_agent_rollouts.append(env_info["num_controlled_agents"])
-            self.perc_off_road.append(env_info["off_road"])
-            self.perc_veh_collisions.append(env_info["veh_collisions"])
-            self.perc_non_veh_collision.append(env_info["non_veh_collision"])
-            self.perc_goal_achieved.append(env_info["goal_achieved"])
-            self.perc_truncated.append(env_info["truncated"])
-            self.max_obs.append(self.locals["env"].obs_alive.max().item())
-            self.min_obs.append(self.locals["env"].obs_alive.min().item())
-
-            if self.step_counter % self.config.log_freq == 0:
-                self._log_metrics()
-                self._log_obs_stats()
+        env = self.locals["env"]
+
+        if env.info_dict:
+            self._record_episode_stats(env)
+
+        if self.step_counter % self.config.log_freq == 0:
+            stats = self._read_episode_stats()
+            if stats is None:
+                return
+            self._log_metrics(stats)
+            self._log_obs_stats(stats)
 
             if self.config.track_time_to_solve:
-                self._log_time_to_solve()
+                self._log_time_to_solve(stats)
+
+    def _record_episode_stats(self, env):
+        """Write the stats of the episodes finished in this step to the ring
+        buffer, without reading anything back from the device."""
+        window = self.config.logging_collection_window
+        if self.episode_stats is None:
+            self.episode_stats = torch.zeros(
+                (window, len(self._episode_stat_names)), device=env.device
+            )
+
+        obs_min, obs_max = env.obs_alive_extrema()
+        stats = {**env.info_dict, "obs_max": obs_max, "obs_min": obs_min}
+        self.episode_stats[self.num_episode_stats % window] = torch.stack(
+            [
+                torch.as_tensor(
+                    stats[name], dtype=torch.float32, device=env.device
+                )
+                for name in self._episode_stat_names
+            ]
+        )
+        self.num_episode_stats += 1
 
-    def _log_metrics(self):
+    def _read_episode_stats(self):
+        """Aggregate the ring buffer, read it back in one transfer and
+        aggregate it over all ranks.
+
+        All ranks must call this at the same step. Returns None if no rank
+        has finished an episode yet.
+        """
+        num_sums = len(self._episode_stat_names) - 2
+        if self.episode_stats is None:
+            # Neutral for the sums and the maxima
+            local = torch.tensor([0.0] * (num_sums + 1) + [-np.inf] * 2)
+        else:
+            window = self.config.logging_collection_window
+            episode_stats = self.episode_stats[
+                : min(self.num_episode_stats, window)
+            ]
+            local = torch.cat(
+                [
+                    episode_stats[:, :-2].sum(dim=0),
+                    episode_stats.new_tensor([len(episode_stats)]),
+                    episode_stats[:, -2].max().unsqueeze(0),
+                    -episode_stats[:, -1].min().unsqueeze(0),
+                ]
+            ).cpu()
+        *sums, num_episodes = distributed.all_reduce_sum(
+            local[: num_sums + 1]
+        ).tolist()
+        if num_episodes == 0:
+            return None
+        obs_max, neg_obs_min = distributed.all_reduce_max(
+            local[num_sums + 1 :]
+        ).tolist()
+        return dict(
+            zip(self._episode_stat_names, sums + [obs_max, -neg_obs_min])
+        )
+
+    def _log_metrics(self, stats):
         """Log performance metrics to wandb."""
-        total_agents = sum(self.num_agent_rollouts)
+        total_agents = stats["num_controlled_agents"]
         metrics = {
             "metrics/wallclock_time (s)": perf_counter() - self.start_training,
             "metrics/global_step": self.num_timesteps,
-            "metrics/perc_off_road": sum(self.perc_off_road)
-            / total_agents
-            * 100,
-            "metrics/perc_veh_collisions": sum(self.perc_veh_collisions)
-            / total_agents
-            * 100,
-            "metrics/perc_non_veh_collision": sum(self.perc_non_veh_collision)
+            "metrics/perc_off_road": stats["off_road"] / total_agents * 100,
+            "metrics/perc_veh_collisions": stats["veh_collisions"]
             / total_agents
             * 100,
-            "metrics/perc_goal_achieved": sum(self.perc_goal_achieved)
+            "metrics/perc_non_veh_collision": stats["non_veh_collision"]
             / total_agents
             * 100,
-            "metrics/perc_truncated": sum(self.perc_truncated)
+            "metrics/perc_goal_achieved": stats["goal_achieved"]
             / total_agents
             * 100,
+            "metrics/perc_truncated": stats["truncated"] / total_agents * 100,
         }
         wandb.log(metrics)
 
-    def _log_obs_stats(self):
+    def _log_obs_stats(self, stats):
         """Log observation statistics to wandb."""
         wandb.log(
             {
-                "charts/obs_max": np.array(self.max_obs).max(),
-                "charts/obs_min": np.array(self.min_obs).min(),
+                "charts/obs_max": stats["obs_max"],
+                "charts/obs_min": stats["obs_min"],
             }
         )
 
-    def _log_time_to_solve(self):
+    def _log_time_to_solve(self, stats):
         """Log the time and steps taken to achieve 95% goal achievement."""
         if (
-            sum(self.perc_goal_achieved) / sum(self.num_agent_rollouts) >= 0.95
+            stats["goal_achieved"] / stats["num_controlled_agents"] >= 0.95
             and self.log_first_to_95
         ):
             wandb.log(
@@ -137,45 +194,62 @@ class MultiAgentCallback(BaseCallback):
 
     def _on_rollout_end(self) -> None:
         """Triggered before updating the policy."""
-        rewards = (
-            torch.nan_to_num(self.locals["rollout_buffer"].rewards, nan=0)
-            .sum()
-            .item()
+        rewards, completions = self._rollout_totals(
+            self.locals["rollout_buffer"]
         )
-        completions = torch.nan_to_num(
-            self.locals["rollout_buffer"].episode_starts
-        ).sum()
 
+        # Rendering steps the env, so the rollouts wait until it is done
         if (
             self.config.render
             and self.num_rollouts % self.config.render_freq == 0
         ):
-            for world_idx in range(self.config.render_n_worlds):
-                self._create_and_log_video(
-                    render_world_idx=world_idx,
-                    video_title=f"Global step: {self.num_timesteps:,}",
-                    caption=f"Env: {world_idx}",
-                )
+            self.model.run_between_updates(self._log_videos, blocking=True)
 
         if (
             self.config.save_policy
             and self.num_rollouts % self.config.save_policy_freq == 0
         ):
-            self._save_policy_checkpoint()
+            num_timesteps = self.num_timesteps
+            self.model.run_between_updates(
+                lambda: self._save_policy_checkpoint(num_timesteps)
+            )
 
         self.num_rollouts += 1
         wandb.log(
             {
                 "global_step": self.num_timesteps,
-                "metrics/mean_episode_reward_per_agent": rewards / completions,
+                "metrics/mean_episode_reward_per_agent": (
+                    rewards / completions if completions else np.nan
+                ),
             }
         )
 
+    @staticmethod
+    def _rollout_totals(rollout_buffer):
+        """Total reward and number of finished episodes of the rollout,
+        summed over all ranks."""
+        rewards = torch.nan_to_num(rollout_buffer.rewards, nan=0).sum()
+        return distributed.all_reduce_sum(
+            torch.stack(
+                [rewards, rollout_buffer.num_episode_starts.to(rewards.device)]
+            )
+        ).tolist()
+
+    def _log_videos(self):
+        """Log a video of each of the first `render_n_worlds` worlds."""
+        for world_idx in range(self.config.render_n_worlds):
+            self._create_and_log_video(
+                render_world_idx=world_idx,
+                video_title=f"Global step: {self.num_timesteps:,}",
+                caption=f"Env: {world_idx}",
+            )
+
     def _create_and_log_video(
         self, render_world_idx=0, video_title="Global step", caption="Env"
     ):
-        """Make a video and log to wandb."""
-        policy = self.model
+        """Make a video with the policy that collected the last rollout and
+        log to wandb."""
+        policy = self.model.rollout_policy
         base_env = self.locals["env"]._env
         action_tensor = torch.zeros(
             (base_env.num_worlds, base_env.max_agent_count)
@@ -222,12 +296,14 @@ class MultiAgentCallback(BaseCallback):
             }
         )
 
-    def _save_policy_checkpoint(self) -> None:
+    def _save_policy_checkpoint(self, num_timesteps=None) -> None:
         """Save the policy locally and to wandb."""
+        if num_timesteps is None:
+            num_timesteps = self.num_timesteps
         path = os.path.join(
-            self.policy_base_path, f"policy_{self.num_timesteps}.zip"
+            self.policy_base_path, f"policy_{num_timesteps}.zip"
         )
         self.model.save(path)
         if self.wandb_run is not None:
             wandb.save(path, base_path=self.policy_base_path)
-        print(f"Saved policy on step {self.num_timesteps:,} at: {path}")
+        print(f"Saved policy on step {num_timesteps:,} at: {path}")
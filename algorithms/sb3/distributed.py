@@ -0,0 +1,107 @@
+"""Helpers for data parallel training with torch.distributed.
+
+All helpers are no-ops when no process group with more than one rank is
+initialized, so single process training is unaffected.
+"""
+import numbers
+
+import torch
+import torch.distributed as dist
+
+
+def is_distributed() -> bool:
+    return (
+        dist.is_available()
+        and dist.is_initialized()
+        and dist.get_world_size() > 1
+    )
+
+
+def is_main_process() -> bool:
+    """Whether this process writes logs, checkpoints and renders."""
+    return not is_distributed() or dist.get_rank() == 0
+
+
+def all_reduce_sum(tensor: torch.Tensor) -> torch.Tensor:
+    """Sum of `tensor` (or an array) over all ranks, on the CPU."""
+    tensor = torch.as_tensor(tensor).detach().cpu().clone()
+    if is_distributed():
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
+
+
+def all_reduce_max(tensor: torch.Tensor) -> torch.Tensor:
+    """Elementwise maximum of `tensor` (or an array) over all ranks, on the
+    CPU."""
+    tensor = torch.as_tensor(tensor).detach().cpu().clone()
+    if is_distributed():
+        dist.all_reduce(tensor, op=dist.ReduceOp.MAX)
+    return tensor
+
+
+def all_reduce_mean(tensor: torch.Tensor) -> torch.Tensor:
+    """Mean of `tensor` over all ranks, on the CPU."""
+    if not is_distributed():
+        return tensor
+    return all_reduce_sum(tensor).float() / dist.get_world_size()
+
+
+def all_reduce_min(value: int) -> int:
+    """Minimum of an integer over all ranks."""
+    if not is_distributed():
+        return value
+    tensor = torch.tensor(value, dtype=torch.long)
+    dist.all_reduce(tensor, op=dist.ReduceOp.MIN)
+    return int(tensor)
+
+
+def broadcast_parameters(module: torch.nn.Module) -> None:
+    """Copy the parameters and buffers of rank 0 to all ranks."""
+    if not is_distributed():
+        return
+    for tensor in module.state_dict().values():
+        dist.broadcast(tensor, src=0)
+
+
+def all_reduce_gradients(parameters) -> None:
+    """Average the gradients over all ranks in one collective."""
+    if not is_distributed():
+        return
+    grads = [param.grad for param in parameters if param.grad is not None]
+    flat = torch.cat([grad.flatten() for grad in grads])
+    dist.all_reduce(flat, op=dist.ReduceOp.SUM)
+    flat /= dist.get_world_size()
+    offset = 0
+    for grad in grads:
+        grad.copy_(flat[offset : offset + grad.numel()].view_as(grad))
+        offset += grad.numel()
+
+
+class RankAveragingLogger:
+    """SB3 logger proxy that averages the numeric records over all ranks
+    when dumping. Every rank must dump at the same time, which holds as long
+    as the ranks run the same number of iterations."""
+
+    def __init__(self, logger):
+        self._logger = logger
+
+    def dump(self, step: int = 0) -> None:
+        records = {
+            key: float(value)
+            for key, value in self._logger.name_to_value.items()
+            if isinstance(value, numbers.Number)
+            or (isinstance(value, torch.Tensor) and value.numel() == 1)
+        }
+        gathered = [None] * dist.get_world_size()
+        dist.all_gather_object(gathered, records)
+        for key in records:
+            values = [
+                rank_records[key]
+                for rank_records in gathered
+                if key in rank_records
+            ]
+            self._logger.name_to_value[key] = sum(values) / len(values)
+        self._logger.dump(step)
+
+    def __getattr__(self, name):
+        return getattr(self._logger, name)
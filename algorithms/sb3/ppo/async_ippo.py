@@ -0,0 +1,391 @@
+"""IPPO with decoupled rollout collection and training."""
+import copy
+import queue
+import threading
+import time
+
+import torch
+from gymnasium import spaces
+
+from algorithms.sb3 import distributed
+from algorithms.sb3.ppo.ippo import IPPO
+from algorithms.sb3.rollout_buffer import MaskedRolloutBuffer, compute_vtrace
+
+
+class _LockedLogger:
+    """Logger proxy that serializes the records of the collector and the
+    learner thread, so a dump never sees a half written record."""
+
+    def __init__(self, logger, lock):
+        self._logger = logger
+        self._lock = lock
+
+    def record(self, *args, **kwargs):
+        with self._lock:
+            self._logger.record(*args, **kwargs)
+
+    def record_mean(self, *args, **kwargs):
+        with self._lock:
+            self._logger.record_mean(*args, **kwargs)
+
+    def dump(self, *args, **kwargs):
+        with self._lock:
+            self._logger.dump(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._logger, name)
+
+
+def _record_event(device):
+    """Event marking the work queued so far on the current CUDA stream, None
+    on the CPU."""
+    if device.type != "cuda":
+        return None
+    event = torch.cuda.Event()
+    event.record()
+    return event
+
+
+class _LearnerTask:
+    """Work the collector hands over to run on the learner thread between
+    two updates.
+
+    The task runs after the work the collector queued on its stream before
+    handing it over. A blocking task holds the collector until it is done,
+    e.g. to let it use the environment.
+    """
+
+    def __init__(self, fn, device, blocking):
+        self.fn = fn
+        self.device = device
+        self.ready = _record_event(device)
+        self.done = None
+        self.finished = threading.Event() if blocking else None
+
+    def run(self) -> None:
+        if self.ready is not None:
+            torch.cuda.current_stream().wait_event(self.ready)
+        try:
+            self.fn()
+        finally:
+            self.done = _record_event(self.device)
+            if self.finished is not None:
+                self.finished.set()
+
+    def wait(self) -> None:
+        """Wait on the collector until a blocking task is done."""
+        self.finished.wait()
+        if self.done is not None:
+            torch.cuda.current_stream().wait_event(self.done)
+
+
+class AsyncIPPO(IPPO):
+    """IPPO in which a collector thread keeps stepping the environment while
+    the learner trains on the previous rollout.
+
+    The collector acts with a copy of the policy that is refreshed at the
+    start of every rollout, so rollouts lag one update behind the learner.
+    Before training on a rollout, the advantages and returns are recomputed
+    with V-trace for the current learner policy. Two rollout buffers are used
+    in turn, one being filled while the other is trained on.
+
+    Callback work that needs a consistent policy, such as checkpointing, is
+    handed to the learner thread with `run_between_updates`.
+
+    Args:
+        rho_bar (float): Truncation of the V-trace importance weights.
+        c_bar (float): Truncation of the V-trace trace coefficients.
+    """
+
+    def __init__(
+        self, *args, rho_bar: float = 1.0, c_bar: float = 1.0, **kwargs
+    ):
+        self.rho_bar = rho_bar
+        self.c_bar = c_bar
+        super().__init__(*args, **kwargs)
+
+    def _setup_model(self) -> None:
+        if self.ragged_buffer:
+            raise ValueError(
+                "AsyncIPPO recomputes the advantages of dense rollouts, "
+                "ragged_buffer is not supported."
+            )
+        if distributed.is_distributed():
+            raise ValueError(
+                "AsyncIPPO issues collectives from two threads, which cannot "
+                "be ordered across ranks; use IPPO for distributed training."
+            )
+        if self.diagnose_syncs:
+            raise ValueError(
+                "The sync debug mode of torch is global, so the syncs of the "
+                "learner thread would be counted as the collector's; use "
+                "IPPO to diagnose syncs."
+            )
+        super()._setup_model()
+
+        self.actor_policy = copy.deepcopy(self.policy)
+        self._policy_lock = threading.Lock()
+        self._pending_policy_state = None
+        self._policy_version = 0
+        self._actor_version = 0
+        self._collector = None
+
+        # Rollout buffers cycle from the free queue to the collector, then
+        # through the full queue to the learner and back
+        self._free_buffers = queue.Queue()
+        self._full_buffers = queue.Queue()
+        self._free_buffers.put(self.rollout_buffer)
+        self._free_buffers.put(self._make_rollout_buffer())
+
+    @property
+    def rollout_policy(self):
+        return self.actor_policy
+
+    def _excluded_save_params(self):
+        return super()._excluded_save_params() + [
+            "actor_policy",
+            "_policy_lock",
+            "_pending_policy_state",
+            "_free_buffers",
+            "_full_buffers",
+            "_collector",
+            "_collector_error",
+        ]
+
+    def run_between_updates(self, fn, blocking: bool = False) -> None:
+        """Run `fn` on the learner thread between two updates.
+
+        Called from the collector thread, `fn` is queued ahead of the rollout
+        that is being collected. With `blocking`, the collector waits until
+        `fn` is done, so `fn` may use the environment.
+        """
+        if threading.current_thread() is not self._collector:
+            fn()
+            return
+        task = _LearnerTask(fn, self.device, blocking)
+        self._full_buffers.put(task)
+        if blocking:
+            task.wait()
+
+    def learn(
+        self,
+        total_timesteps: int,
+        callback=None,
+        log_interval: int = 1,
+        tb_log_name: str = "AsyncIPPO",
+        reset_num_timesteps: bool = True,
+        progress_bar: bool = False,
+    ):
+        iteration = 0
+
+        total_timesteps, callback = self._setup_learn(
+            total_timesteps,
+            callback,
+            reset_num_timesteps,
+            tb_log_name,
+            progress_bar,
+        )
+        self._logger = _LockedLogger(self._logger, threading.Lock())
+
+        callback.on_training_start(locals(), globals())
+
+        self._collector_error = None
+        self._collector = threading.Thread(
+            target=self._collector_loop,
+            args=(callback, total_timesteps),
+            daemon=True,
+        )
+        self._collector.start()
+
+        while True:
+            rollout = self._full_buffers.get()
+            if rollout is None:
+                break
+            if isinstance(rollout, _LearnerTask):
+                rollout.run()
+                continue
+            rollout_buffer, version, collected = rollout
+            if collected is not None:
+                torch.cuda.current_stream().wait_event(collected)
+
+            iteration += 1
+            self._update_current_progress_remaining(
+                self.num_timesteps, total_timesteps
+            )
+            self.logger.record(
+                "async/policy_lag", self._policy_version - version
+            )
+
+            # Display training infos
+            if log_interval is not None and iteration % log_interval == 0:
+                self._dump_logs(iteration)
+
+            time_learn = time.perf_counter()
+            self.rollout_buffer = rollout_buffer
+            self._compute_vtrace_targets(rollout_buffer)
+            self.train()
+            self._publish_policy()
+            self.logger.record(
+                "async/learner_sps",
+                rollout_buffer.valid_samples("rewards").numel()
+                / (time.perf_counter() - time_learn),
+            )
+            self._free_buffers.put(rollout_buffer)
+
+        self._collector.join()
+        if self._collector_error is not None:
+            raise self._collector_error
+
+        callback.on_training_end()
+
+        return self
+
+    def _collector_loop(self, callback, total_timesteps: int) -> None:
+        """Fill the free rollout buffers until `total_timesteps` is reached."""
+        stream = (
+            torch.cuda.Stream(self.device)
+            if self.device.type == "cuda"
+            else None
+        )
+        try:
+            with torch.cuda.stream(stream):
+                while self.num_timesteps < total_timesteps:
+                    rollout_buffer = self._free_buffers.get()
+                    self._load_published_policy()
+                    version = self._actor_version
+
+                    # The number of agents may have changed since the buffer
+                    # was last used
+                    rollout_buffer.n_envs = self.n_envs
+                    time_collect = time.perf_counter()
+                    if not self.collect_rollouts(
+                        self.env, callback, rollout_buffer, self.n_steps
+                    ):
+                        break
+
+                    # The last step bootstraps the V-trace targets
+                    rollout_buffer.bootstrap_obs = self._last_obs.clone()
+                    rollout_buffer.bootstrap_dones = (
+                        self._last_episode_starts.clone()
+                    )
+                    self.logger.record(
+                        "async/collector_sps",
+                        self._rollout_num_samples
+                        / (time.perf_counter() - time_collect),
+                    )
+
+                    collected = None
+                    if stream is not None:
+                        collected = torch.cuda.Event()
+                        collected.record(stream)
+                    self._full_buffers.put(
+                        (rollout_buffer, version, collected)
+                    )
+        except Exception as error:
+            self._collector_error = error
+        finally:
+            self._full_buffers.put(None)
+
+    def _publish_policy(self) -> None:
+        """Hand a snapshot of the learner policy to the collector."""
+        state = {
+            name: tensor.detach().clone()
+            for name, tensor in self.policy.state_dict().items()
+        }
+        copied = None
+        if self.device.type == "cuda":
+            copied = torch.cuda.Event()
+            copied.record()
+        with self._policy_lock:
+            self._policy_version += 1
+            self._pending_policy_state = (state, self._policy_version, copied)
+
+    def _load_published_policy(self) -> None:
+        """Refresh the actor with the latest learner snapshot, if any."""
+        with self._policy_lock:
+            pending, self._pending_policy_state = (
+                self._pending_policy_state,
+                None,
+            )
+        if pending is not None:
+            state, self._actor_version, copied = pending
+            if copied is not None:
+                # The snapshot was taken on the learner's stream
+                torch.cuda.current_stream().wait_event(copied)
+            self.actor_policy.load_state_dict(state)
+
+    @torch.no_grad()
+    def _compute_vtrace_targets(
+        self, rollout_buffer: MaskedRolloutBuffer
+    ) -> None:
+        """Recompute the advantages and returns of a rollout collected with
+        the actor policy for the current learner policy."""
+        self.policy.set_training_mode(False)
+        (
+            observations,
+            actions,
+            _,
+            behavior_log_probs,
+            _,
+            _,
+        ) = rollout_buffer._flat_samples()
+        storage_device = behavior_log_probs.device
+        num_samples = behavior_log_probs.numel()
+        values = torch.full(
+            (num_samples,), float("nan"), device=storage_device
+        )
+        log_rhos = torch.full(
+            (num_samples,), float("nan"), device=storage_device
+        )
+
+        # Evaluate the valid samples in minibatches
+        valid_indices = rollout_buffer._valid_sample_indices()
+        for start in range(0, len(valid_indices), self.batch_size):
+            batch_inds = valid_indices[start : start + self.batch_size]
+            batch_actions = actions[batch_inds].to(self.device)
+            if isinstance(self.action_space, spaces.Discrete):
+                batch_actions = batch_actions.long().flatten()
+            elif isinstance(self.action_space, spaces.MultiDiscrete):
+                batch_actions = batch_actions.long()
+
+            with self._autocast():
+                (
+                    batch_values,
+                    batch_log_probs,
+                    _,
+                ) = self.policy.evaluate_actions(
+                    observations[batch_inds].to(self.device), batch_actions
+                )
+            values[batch_inds] = (
+                batch_values.float().flatten().to(storage_device)
+            )
+            log_rhos[batch_inds] = (
+                batch_log_probs.float().to(storage_device)
+                - behavior_log_probs[batch_inds]
+            )
+
+        bootstrap_obs = rollout_buffer.bootstrap_obs
+        if bootstrap_obs.is_cuda:
+            # Allocated on the collector stream
+            bootstrap_obs.record_stream(torch.cuda.current_stream())
+        with self._autocast():
+            last_values = self.policy.predict_values(bootstrap_obs)
+
+        shape = (rollout_buffer.buffer_size, rollout_buffer.n_envs)
+        advantages, returns = compute_vtrace(
+            rollout_buffer.rewards,
+            values.view(shape),
+            rollout_buffer.episode_starts,
+            last_values.float().flatten().to(storage_device),
+            rollout_buffer.bootstrap_dones.flatten().to(storage_device),
+            log_rhos.view(shape),
+            self.gamma,
+            self.gae_lambda,
+            self.rho_bar,
+            self.c_bar,
+        )
+        rollout_buffer.advantages.copy_(advantages)
+        rollout_buffer.returns.copy_(returns)
+        self.logger.record(
+            "async/mean_rho", log_rhos[valid_indices].exp().mean().item()
+        )
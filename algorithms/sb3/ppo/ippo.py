@@ -1,9 +1,13 @@
+import contextlib
+import itertools
 import logging
+import math
 import time
 import wandb
 import torch
 from torch.nn import functional as F
 import numpy as np
+from typing import Optional
 from gymnasium import spaces
 from stable_baselines3 import PPO
 from stable_baselines3.common.callbacks import BaseCallback
@@ -12,7 +16,12 @@ from stable_baselines3.common.vec_env import VecEnv
 from torch import nn
 
 # Import masked rollout buffer class
-from algorithms.sb3.rollout_buffer import MaskedRolloutBuffer
+from algorithms.sb3.rollout_buffer import (
+    MaskedRolloutBuffer,
+    RaggedRolloutBuffer,
+)
+from algorithms.sb3 import distributed
+from algorithms.sb3.utils import DeviceSyncCounter, DeviceTimer
 from networks.perm_eq_late_fusion import LateFusionNet
 
 # From stable baselines
@@ -47,12 +56,29 @@ class IPPO(PPO):
         exp_config=None,
         mlp_class: nn.Module = LateFusionNet,
         mlp_config=None,
+        compile_gae: bool = False,
+        ragged_buffer: bool = False,
+        async_transfer: bool = False,
+        rollout_buffer_capacity: Optional[int] = None,
+        diagnose_syncs: bool = False,
+        autocast: bool = False,
+        compile_policy: bool = False,
+        fused_optimizer: bool = False,
         **kwargs,
     ):
         self.env_config = env_config
         self.exp_config = exp_config
         self.mlp_class = mlp_class
         self.mlp_config = mlp_config
+        self.compile_gae = compile_gae
+        self.ragged_buffer = ragged_buffer
+        self.async_transfer = async_transfer
+        self.rollout_buffer_capacity = rollout_buffer_capacity
+        self.diagnose_syncs = diagnose_syncs
+        self.autocast = autocast
+        self.compile_policy = compile_policy
+        self.fused_optimizer = fused_optimizer
+        self.learner_times = []
         self.resample_counter = 0
         super().__init__(*args, **kwargs)
 
@@ -95,139 +121,138 @@ class IPPO(PPO):
                     f"Resampling criterion {self.env.exp_config.resample_criterion} not implemented"
                 )
 
+        policy = self.rollout_policy
+
         # Switch to eval mode (this affects batch norm / dropout)
-        self.policy.set_training_mode(False)
+        policy.set_training_mode(False)
 
         n_steps = 0
         rollout_buffer.reset()
         # Sample new weights for the state dependent exploration
         if self.use_sde:
-            self.policy.reset_noise(env.num_envs)
+            policy.reset_noise(env.num_envs)
 
         callback.on_rollout_start()
 
         time_rollout = time.perf_counter()
 
+        # Counters stay on the device and are read back once per rollout
+        num_valid_samples = torch.zeros(
+            (), dtype=torch.long, device=self.device
+        )
+        policy_timer = DeviceTimer(self.device)
+        sync_counter = (
+            DeviceSyncCounter()
+            if self.diagnose_syncs and self.device.type == "cuda"
+            else None
+        )
+
         while n_steps < n_rollout_steps:
-            if (
-                self.use_sde
-                and self.sde_sample_freq > 0
-                and n_steps % self.sde_sample_freq == 0
-            ):
-                # Sample a new noise matrix
-                self.policy.reset_noise(env.num_envs)
-
-            with torch.no_grad():
-                obs_tensor = self._last_obs
-
-                # EDIT_1: Mask out invalid observations (NaN axes and/or dead agents)
-                # Create dummy actions, values and log_probs (NaN)
-                actions = torch.full(
-                    fill_value=float("nan"), size=(self.n_envs,)
-                ).to(self.device)
-                log_probs = torch.full(
-                    fill_value=float("nan"),
-                    size=(self.n_envs,),
-                    dtype=torch.float32,
-                ).to(self.device)
-                values = (
-                    torch.full(
-                        fill_value=float("nan"),
-                        size=(self.n_envs,),
-                        dtype=torch.float32,
-                    )
-                    .unsqueeze(dim=1)
-                    .to(self.device)
-                )
+            with sync_counter or contextlib.nullcontext():
+                if (
+                    self.use_sde
+                    and self.sde_sample_freq > 0
+                    and n_steps % self.sde_sample_freq == 0
+                ):
+                    # Sample a new noise matrix
+                    policy.reset_noise(env.num_envs)
+
+                with torch.no_grad():
+                    obs_tensor = self._last_obs
+
+                    # EDIT_1: Mask out invalid observations (NaN axes and/or dead agents)
+                    # The policy is run on all controlled agents, with zeroed
+                    # observations for dead agents, whose actions, values and
+                    # log_probs are then set to NaN. Unlike boolean indexing,
+                    # this does not need the number of alive agents on the host.
+                    alive_agent_mask = ~env.dead_agent_mask.flatten()[
+                        env.controlled_agent_idx
+                    ]
+                    alive = alive_agent_mask.unsqueeze(dim=1)
+
+                    with policy_timer, self._autocast():
+                        actions, values, log_probs = policy(
+                            torch.where(alive, obs_tensor, 0.0)
+                        )
 
-                # Get indices of alive agent ids
-                # Convert env_dead_agent_mask to boolean tensor with the same shape as obs_tensor
-                alive_agent_mask = ~(
-                    env.dead_agent_mask[env.controlled_agent_mask].reshape(
-                        env.num_envs, 1
+                    actions = torch.where(
+                        alive_agent_mask.view(
+                            -1, *([1] * (actions.dim() - 1))
+                        ),
+                        actions.float(),
+                        float("nan"),
+                    )
+                    values = torch.where(alive, values.float(), float("nan"))
+                    log_probs = torch.where(
+                        alive_agent_mask, log_probs.float(), float("nan")
                     )
-                )
 
-                # Use boolean indexing to select elements in obs_tensor
-                obs_tensor_alive = obs_tensor[
-                    alive_agent_mask.expand_as(obs_tensor)
-                ].reshape(-1, obs_tensor.shape[-1])
+                # Rescale and perform action
+                clipped_actions = actions
 
-                # Predict actions, vals and log_probs given obs
-                time_actions = time.perf_counter()
-                actions_tmp, values_tmp, log_prob_tmp = self.policy(
-                    obs_tensor_alive
-                )
-                nn_fps = actions_tmp.shape[0] / (
-                    time.perf_counter() - time_actions
-                )
-                self.logger.record("rollout/nn_fps", nn_fps)
-
-                # Predict actions, vals and log_probs given obs
-                (
-                    actions[alive_agent_mask.squeeze(dim=1)],
-                    values[alive_agent_mask.squeeze(dim=1)],
-                    log_probs[alive_agent_mask.squeeze(dim=1)],
-                ) = (
-                    actions_tmp.float(),
-                    values_tmp.float(),
-                    log_prob_tmp.float(),
-                )
+                if isinstance(self.action_space, spaces.Box):
+                    if policy.squash_output:
+                        # Unscale the actions to match env bounds
+                        # if they were previously squashed (scaled in [-1, 1])
+                        clipped_actions = policy.unscale_action(
+                            clipped_actions
+                        )
+                    else:
+                        # Otherwise, clip the actions to avoid out of bound error
+                        # as we are sampling from an unbounded Gaussian distribution
+                        clipped_actions = torch.clamp(
+                            actions,
+                            self.action_space.low,
+                            self.action_space.high,
+                        )
 
-            # Rescale and perform action
-            clipped_actions = actions
+                # The env writes its outputs in place to buffers that may
+                # still be copied to the rollout buffer
+                rollout_buffer.wait_for_pending_copies()
+                new_obs, rewards, dones, infos = env.step(clipped_actions)
 
-            if isinstance(self.action_space, spaces.Box):
-                if self.policy.squash_output:
-                    # Unscale the actions to match env bounds
-                    # if they were previously squashed (scaled in [-1, 1])
-                    clipped_actions = self.policy.unscale_action(
-                        clipped_actions
-                    )
-                else:
-                    # Otherwise, clip the actions to avoid out of bound error
-                    # as we are sampling from an unbounded Gaussian distribution
-                    clipped_actions = torch.clamp(
-                        actions, self.action_space.low, self.action_space.high
-                    )
+                # EDIT_2: Count the valid samples in rollout step, the global
+                # step is incremented at the end of the rollout
+                num_valid_samples += (~rewards.isnan()).sum()
 
-            new_obs, rewards, dones, infos = env.step(clipped_actions)
+                # Give access to local variables
+                callback.update_locals(locals())
+                if callback.on_step() is False:
+                    self._record_rollout_counters(
+                        num_valid_samples, n_steps + 1, policy_timer, sync_counter
+                    )
+                    return False
+                n_steps += 1
 
-            # EDIT_2: Increment the global step by the number of valid samples in rollout step
-            self.num_timesteps += int((~rewards.isnan()).float().sum().item())
-            self.resample_counter += int(
-                (~rewards.isnan()).float().sum().item()
-            )
-            # Give access to local variables
-            callback.update_locals(locals())
-            if callback.on_step() is False:
-                return False
-            n_steps += 1
-
-            if isinstance(self.action_space, spaces.Discrete):
-                # Reshape in case of discrete action
-                actions = actions.reshape(-1, 1)
-
-            rollout_buffer.add(
-                self._last_obs,  # type: ignore[arg-type]
-                actions,
-                rewards,
-                torch.Tensor(self._last_episode_starts),  # type: ignore[arg-type]
-                values,
-                log_probs,
-            )
-            self._last_obs = new_obs  # type: ignore[assignment]
-            self._last_episode_starts = dones
+                if isinstance(self.action_space, spaces.Discrete):
+                    # Reshape in case of discrete action
+                    actions = actions.reshape(-1, 1)
+
+                rollout_buffer.add(
+                    self._last_obs,  # type: ignore[arg-type]
+                    actions,
+                    rewards,
+                    torch.Tensor(self._last_episode_starts),  # type: ignore[arg-type]
+                    values,
+                    log_probs,
+                )
+                self._last_obs = new_obs  # type: ignore[assignment]
+                self._last_episode_starts = dones
 
         # # # # # END LOOP # # # # #
+        self._record_rollout_counters(
+            num_valid_samples, n_steps, policy_timer, sync_counter
+        )
+
         total_steps = self.n_envs * n_rollout_steps
         elapsed_time = time.perf_counter() - time_rollout
+        self._rollout_time = elapsed_time
         fps = total_steps / elapsed_time
         self.logger.record("charts/fps", fps)
 
-        with torch.no_grad():
+        with torch.no_grad(), self._autocast():
             # Compute value for the last timestep
-            values = self.policy.predict_values(new_obs)  # type: ignore[arg-type]
+            values = policy.predict_values(new_obs).float()  # type: ignore[arg-type]
 
         rollout_buffer.compute_returns_and_advantage(
             last_values=values, dones=dones
@@ -238,14 +263,105 @@ class IPPO(PPO):
 
         return True
 
-    def _setup_model(self) -> None:
-        self._setup_lr_schedule()
-        self.set_random_seed(self.seed)
+    def _record_rollout_counters(
+        self, num_valid_samples, n_steps, policy_timer, sync_counter
+    ) -> None:
+        """Read back the on-device rollout counters, the only sync of the
+        rollout besides the simulator resets."""
+        # Count the samples of all ranks, so they run the same iterations
+        num_valid_samples = int(distributed.all_reduce_sum(num_valid_samples))
+        self._rollout_num_samples = num_valid_samples
+        self.num_timesteps += num_valid_samples
+        self.resample_counter += num_valid_samples
+
+        policy_time = policy_timer.total_seconds()
+        if policy_time > 0:
+            self.logger.record(
+                "rollout/nn_fps", self.n_envs * n_steps / policy_time
+            )
+        if sync_counter is not None and sync_counter.counts:
+            self.logger.record(
+                "rollout/syncs_per_step", np.mean(sync_counter.counts)
+            )
 
-        # Change buffer to our own masked version
-        buffer_cls = MaskedRolloutBuffer
+    def _autocast(self):
+        """Autocast context for the policy passes, a no-op unless enabled.
 
-        self.rollout_buffer = buffer_cls(
+        Uses bfloat16 on the CPU and on GPUs that support it, float16 otherwise.
+        """
+        return torch.autocast(
+            self.device.type,
+            dtype=self._autocast_dtype,
+            enabled=self.autocast,
+        )
+
+    def _optimizer_step(self, loss) -> None:
+        """Backward pass and clipped optimizer step.
+
+        The loss is scaled when training in float16 to avoid underflowing
+        gradients, in which case the gradients are unscaled before clipping.
+        """
+        self.policy.optimizer.zero_grad()
+        self._grad_scaler.scale(loss).backward()
+        self._grad_scaler.unscale_(self.policy.optimizer)
+        distributed.all_reduce_gradients(self.policy.parameters())
+        # Clip grad norm
+        torch.nn.utils.clip_grad_norm_(
+            self.policy.parameters(), self.max_grad_norm
+        )
+        self._grad_scaler.step(self.policy.optimizer)
+        self._grad_scaler.update()
+
+    def _record_learner_time(self, time_train) -> None:
+        """Log the time of the last update and the steps per second of the
+        last rollout and update together."""
+        learner_time = time.perf_counter() - time_train
+        self.learner_times.append(learner_time)
+        self.logger.record("train/learner_time", learner_time)
+        self.logger.record(
+            "charts/sps",
+            self._rollout_num_samples / (self._rollout_time + learner_time),
+        )
+
+    def _num_minibatches(self):
+        """Number of minibatches per epoch, None for all of them.
+
+        With several ranks, every rank takes the number of minibatches of
+        the rank with the fewest valid samples, as each optimizer step
+        all-reduces the gradients.
+        """
+        if not distributed.is_distributed():
+            return None
+        num_samples = self.rollout_buffer.valid_samples("rewards").numel()
+        return distributed.all_reduce_min(
+            math.ceil(num_samples / self.batch_size)
+        )
+
+    def _setup_learn(self, *args, **kwargs):
+        total_timesteps, callback = super()._setup_learn(*args, **kwargs)
+        if distributed.is_distributed():
+            self._logger = distributed.RankAveragingLogger(self._logger)
+        return total_timesteps, callback
+
+    @property
+    def rollout_policy(self):
+        """Policy that acts in `collect_rollouts`."""
+        return self.policy
+
+    def run_between_updates(self, fn, blocking: bool = False) -> None:
+        """Run `fn` where no policy update is in progress.
+
+        Callbacks use this for work that needs a consistent policy, such as
+        saving checkpoints. Rollouts and updates alternate here, so `fn` runs
+        right away.
+        """
+        fn()
+
+    def _make_rollout_buffer(self) -> MaskedRolloutBuffer:
+        buffer_cls = (
+            RaggedRolloutBuffer if self.ragged_buffer else MaskedRolloutBuffer
+        )
+        return buffer_cls(
             self.n_steps,
             self.observation_space,  # type: ignore[arg-type]
             self.action_space,
@@ -253,8 +369,38 @@ class IPPO(PPO):
             gamma=self.gamma,
             gae_lambda=self.gae_lambda,
             n_envs=self.n_envs,
+            compile_gae=self.compile_gae,
+            async_transfer=self.async_transfer,
+            max_n_envs=self.rollout_buffer_capacity,
+        )
+
+    def _setup_model(self) -> None:
+        self._setup_lr_schedule()
+        self.set_random_seed(self.seed)
+
+        # Mixed precision
+        if self.device.type == "cpu" or torch.cuda.is_bf16_supported():
+            self._autocast_dtype = torch.bfloat16
+        else:
+            self._autocast_dtype = torch.float16
+        self._grad_scaler = torch.amp.GradScaler(
+            self.device.type,
+            enabled=self.autocast and self._autocast_dtype == torch.float16,
         )
 
+        # Fused optimizer steps (multi-tensor steps on the CPU)
+        if self.fused_optimizer:
+            optimizer_kwargs = self.policy_kwargs.setdefault(
+                "optimizer_kwargs", {}
+            )
+            if self.device.type == "cuda":
+                optimizer_kwargs["fused"] = True
+            else:
+                optimizer_kwargs["foreach"] = True
+
+        # Change buffer to our own masked version
+        self.rollout_buffer = self._make_rollout_buffer()
+
         if self.mlp_class == LateFusionNet:
             self.policy = self.policy_class(
                 observation_space=self.observation_space,
@@ -279,6 +425,13 @@ class IPPO(PPO):
 
         self.policy = self.policy.to(self.device)
 
+        # Start all ranks from the same weights
+        distributed.broadcast_parameters(self.policy)
+
+        if self.compile_policy:
+            # Compile in place to keep the parameter names of saved policies
+            self.policy.mlp_extractor.compile()
+
         # Initialize schedules for policy/value clipping
         self.clip_range = get_schedule_fn(self.clip_range)
         if self.clip_range_vf is not None:
@@ -304,29 +457,43 @@ class IPPO(PPO):
         if self.clip_range_vf is not None:
             clip_range_vf = self.clip_range_vf(self._current_progress_remaining)  # type: ignore[operator]
 
+        time_train = time.perf_counter()
         entropy_losses = []
         pg_losses, value_losses = [], []
         clip_fractions = []
 
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+
         continue_training = True
+        num_minibatches = self._num_minibatches()
         # train for n_epochs epochs
         for epoch in range(self.n_epochs):
             approx_kl_divs = []
             # Do a complete pass on the rollout buffer
-            for rollout_data in self.rollout_buffer.get(self.batch_size):
+            for rollout_data in itertools.islice(
+                self.rollout_buffer.get(self.batch_size), num_minibatches
+            ):
                 actions = rollout_data.actions
                 if isinstance(self.action_space, spaces.Discrete):
                     # Convert discrete action from float to long
                     actions = rollout_data.actions.long().flatten()
+                elif isinstance(self.action_space, spaces.MultiDiscrete):
+                    actions = rollout_data.actions.long()
 
                 # Re-sample the noise matrix because the log_std has changed
                 if self.use_sde:
                     self.policy.reset_noise(self.batch_size)
 
-                values, log_prob, entropy = self.policy.evaluate_actions(
-                    rollout_data.observations, actions
-                )
-                values = values.flatten()
+                with self._autocast():
+                    values, log_prob, entropy = self.policy.evaluate_actions(
+                        rollout_data.observations, actions
+                    )
+                # Compute the losses in float32
+                values = values.float().flatten()
+                log_prob = log_prob.float()
+                if entropy is not None:
+                    entropy = entropy.float()
                 # Normalize advantage
                 advantages = rollout_data.advantages
                 # Normalization does not make sense if mini batchsize == 1, see GH issue #325
@@ -391,6 +558,7 @@ class IPPO(PPO):
                     approx_kl_div = torch.mean(
                         (torch.exp(log_ratio) - 1) - log_ratio
                     ).cpu()
+                    approx_kl_div = distributed.all_reduce_mean(approx_kl_div)
                     approx_kl_divs.append(approx_kl_div)
 
                 if (
@@ -405,21 +573,15 @@ class IPPO(PPO):
                     break
 
                 # Optimization step
-                self.policy.optimizer.zero_grad()
-                loss.backward()
-                # Clip grad norm
-                torch.nn.utils.clip_grad_norm_(
-                    self.policy.parameters(), self.max_grad_norm
-                )
-                self.policy.optimizer.step()
+                self._optimizer_step(loss)
 
             self._n_updates += 1
             if not continue_training:
                 break
 
         explained_var = explained_variance(
-            self.rollout_buffer.values.flatten(),
-            self.rollout_buffer.returns.flatten(),
+            self.rollout_buffer.valid_samples("values"),
+            self.rollout_buffer.valid_samples("returns"),
         )
 
         # Logs
@@ -431,6 +593,12 @@ class IPPO(PPO):
         self.logger.record("train/approx_kl", np.mean(approx_kl_divs))
         self.logger.record("train/clip_fraction", np.mean(clip_fractions))
         self.logger.record("train/loss", loss.item())
+        self._record_learner_time(time_train)
+        if self.device.type == "cuda":
+            self.logger.record(
+                "train/peak_memory_mb",
+                torch.cuda.max_memory_allocated(self.device) / 2**20,
+            )
         if hasattr(self.policy, "log_std"):
             self.logger.record(
                 "train/std", torch.exp(self.policy.log_std).mean().item()
@@ -1,4 +1,6 @@
+import itertools
 import logging
+import time
 
 import numpy as np
 from stable_baselines3.common.utils import explained_variance
@@ -7,6 +9,7 @@ import torch
 from torch.nn import functional as F
 from gymnasium import spaces
 
+from algorithms.sb3 import distributed
 from algorithms.sb3.ppo.ippo import IPPO
 
 logging.getLogger(__name__)
@@ -70,20 +73,29 @@ class RegularizedIPPO(IPPO):
         if self.clip_range_vf is not None:
             clip_range_vf = self.clip_range_vf(self._current_progress_remaining)  # type: ignore[operator]
 
+        time_train = time.perf_counter()
         entropy_losses = []
         pg_losses, value_losses = [], []
         clip_fractions = []
 
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+
         continue_training = True
+        num_minibatches = self._num_minibatches()
         # train for n_epochs epochs
         for epoch in range(self.n_epochs):
             approx_kl_divs = []
             # Do a complete pass on the rollout buffer
-            for rollout_data in self.rollout_buffer.get(self.batch_size):
+            for rollout_data in itertools.islice(
+                self.rollout_buffer.get(self.batch_size), num_minibatches
+            ):
                 actions = rollout_data.actions
                 if isinstance(self.action_space, spaces.Discrete):
                     # Convert discrete action from float to long
                     actions = rollout_data.actions.long().flatten()
+                elif isinstance(self.action_space, spaces.MultiDiscrete):
+                    actions = rollout_data.actions.long()
 
                 # Re-sample the noise matrix because the log_std has changed
                 if self.use_sde:
@@ -92,15 +104,16 @@ class RegularizedIPPO(IPPO):
                 # # # # # # # # # HR_PPO EDIT # # # # # # # # #
                 if self.reg_weight is not None and self.reg_policy is not None:
 
-                    # Get human policy action distributions conditioned on observations
-                    reg_policy_action_dist = self.reg_policy.get_distribution(
-                        rollout_data.observations
-                    ).distribution.probs
+                    with self._autocast():
+                        # Get human policy action distributions conditioned on observations
+                        reg_policy_action_dist = self.reg_policy.get_distribution(
+                            rollout_data.observations
+                        ).distribution.probs.float()
 
-                    # Get RL policy action distributions conditioned on observations
-                    policy_action_dist = self.policy.get_distribution(
-                        rollout_data.observations
-                    ).distribution.probs
+                        # Get RL policy action distributions conditioned on observations
+                        policy_action_dist = self.policy.get_distribution(
+                            rollout_data.observations
+                        ).distribution.probs.float()
 
                     # Compute loss
                     loss_reg = self.reg_loss(
@@ -108,10 +121,15 @@ class RegularizedIPPO(IPPO):
                     )
 
                 # # # # # # # # # HR_PPO EDIT # # # # # # # # #
-                values, log_prob, entropy = self.policy.evaluate_actions(
-                    rollout_data.observations, actions
-                )
-                values = values.flatten()
+                with self._autocast():
+                    values, log_prob, entropy = self.policy.evaluate_actions(
+                        rollout_data.observations, actions
+                    )
+                # Compute the losses in float32
+                values = values.float().flatten()
+                log_prob = log_prob.float()
+                if entropy is not None:
+                    entropy = entropy.float()
                 # Normalize advantage
                 advantages = rollout_data.advantages
                 # Normalization does not make sense if mini batchsize == 1, see GH issue #325
@@ -205,6 +223,7 @@ class RegularizedIPPO(IPPO):
                         .cpu()
                         .numpy()
                     )
+                    approx_kl_div = distributed.all_reduce_mean(approx_kl_div)
                     approx_kl_divs.append(approx_kl_div)
 
                 if (
@@ -219,21 +238,15 @@ class RegularizedIPPO(IPPO):
                     break
 
                 # Optimization step
-                self.policy.optimizer.zero_grad()
-                loss.backward()
-                # Clip grad norm
-                torch.nn.utils.clip_grad_norm_(
-                    self.policy.parameters(), self.max_grad_norm
-                )
-                self.policy.optimizer.step()
+                self._optimizer_step(loss)
 
             self._n_updates += 1
             if not continue_training:
                 break
 
         explained_var = explained_variance(
-            self.rollout_buffer.values.flatten(),
-            self.rollout_buffer.returns.flatten(),
+            self.rollout_buffer.valid_samples("values"),
+            self.rollout_buffer.valid_samples("returns"),
         )
 
         # Logs
@@ -255,6 +268,12 @@ class RegularizedIPPO(IPPO):
         self.logger.record("train/approx_kl", np.mean(approx_kl_divs))
         self.logger.record("train/clip_fraction", np.mean(clip_fractions))
         self.logger.record("train/loss", loss.item())
+        self._record_learner_time(time_train)
+        if self.device.type == "cuda":
+            self.logger.record(
+                "train/peak_memory_mb",
+                torch.cuda.max_memory_allocated(self.device) / 2**20,
+            )
         self.logger.record("train/explained_variance", explained_var)
         if hasattr(self.policy, "log_std"):
             self.logger.record(
@@ -1,11 +1,9 @@
 """Module containing regularized PPO algorithm."""
 import logging
-from typing import Generator, Optional
+from typing import Generator, Optional, Tuple
 import gymnasium as gym
-import numpy as np
 import torch
 from typing import Union, NamedTuple
-from stable_baselines3.common.vec_env import VecNormalize
 from stable_baselines3.common.buffers import BaseBuffer
 
 logging.getLogger(__name__)
@@ -20,8 +18,216 @@ class RolloutBufferSamples(NamedTuple):
     returns: torch.Tensor
 
 
+def compute_gae_loop(
+    rewards: torch.Tensor,
+    values: torch.Tensor,
+    episode_starts: torch.Tensor,
+    last_values: torch.Tensor,
+    dones: torch.Tensor,
+    gamma: float,
+    gae_lambda: float,
+) -> torch.Tensor:
+    """Step by step GAE, kept as the reference for `compute_gae`.
+
+    Invalid (NaN) rewards and values count as zero and NaN episode starts or
+    dones as terminal.
+    """
+    buffer_size = rewards.shape[0]
+    advantages = torch.zeros_like(rewards)
+    last_gae_lam = 0
+    for step in reversed(range(buffer_size)):
+        if step == buffer_size - 1:
+            # EDIT_1: Map NaNs to 1
+            next_non_terminal = 1.0 - torch.nan_to_num(dones, nan=1.0)
+            next_values = last_values
+        else:
+            # EDIT_1: Map NaNs to 1
+            episode_starts_next = torch.nan_to_num(
+                episode_starts[step + 1], nan=1.0
+            )
+            next_non_terminal = 1.0 - episode_starts_next
+            next_values = values[step + 1]
+
+        delta = (
+            torch.nan_to_num(
+                rewards[step], nan=0
+            )  # EDIT_2: Set invalid rewards to zero
+            + torch.nan_to_num(
+                gamma * next_values * next_non_terminal, nan=0
+            )  # EDIT_3: Set invalid rewards to zero
+            - torch.nan_to_num(
+                values[step], nan=0
+            )  # EDIT_4: Set invalid values to zero
+        )
+
+        last_gae_lam = (
+            delta + gamma * gae_lambda * next_non_terminal * last_gae_lam
+        )
+        advantages[step] = last_gae_lam
+    return advantages
+
+
+def compute_gae(
+    rewards: torch.Tensor,
+    values: torch.Tensor,
+    episode_starts: torch.Tensor,
+    last_values: torch.Tensor,
+    dones: torch.Tensor,
+    gamma: float,
+    gae_lambda: float,
+) -> torch.Tensor:
+    """GAE as a reverse scan over all steps and envs at once.
+
+    Same semantics as `compute_gae_loop`. The advantages follow the linear
+    recurrence A[t] = delta[t] + c[t] * A[t + 1], which is solved with
+    log2(buffer_size) vectorized doubling steps instead of one step per
+    time step.
+
+    Args:
+        rewards, values, episode_starts: Tensors of shape (buffer_size, n_envs).
+        last_values, dones: Tensors of shape (n_envs,) for the step after the
+            buffer.
+
+    Returns:
+        torch.Tensor: Advantages of shape (buffer_size, n_envs).
+    """
+    next_values = torch.cat([values[1:], last_values.unsqueeze(0)])
+    next_non_terminal = 1.0 - torch.nan_to_num(
+        torch.cat([episode_starts[1:], dones.unsqueeze(0)]), nan=1.0
+    )
+
+    advantages = (
+        torch.nan_to_num(rewards, nan=0)
+        + torch.nan_to_num(gamma * next_values * next_non_terminal, nan=0)
+        - torch.nan_to_num(values, nan=0)
+    )
+    coefs = gamma * gae_lambda * next_non_terminal
+    return _reverse_linear_scan(advantages, coefs)
+
+
+def _reverse_linear_scan(
+    deltas: torch.Tensor, coefs: torch.Tensor
+) -> torch.Tensor:
+    """Solve x[t] = deltas[t] + coefs[t] * x[t + 1] along the first axis,
+    with x[buffer_size] = 0."""
+    # After the step with offset k, x[t] sums the terms t .. t+2k-1
+    # and coefs[t] is the discount from t to t+2k.
+    buffer_size = deltas.shape[0]
+    offset = 1
+    while offset < buffer_size:
+        deltas = torch.cat(
+            [
+                deltas[:-offset] + coefs[:-offset] * deltas[offset:],
+                deltas[-offset:],
+            ]
+        )
+        coefs = torch.cat(
+            [coefs[:-offset] * coefs[offset:], coefs[-offset:]]
+        )
+        offset *= 2
+    return deltas
+
+
+def compute_vtrace(
+    rewards: torch.Tensor,
+    values: torch.Tensor,
+    episode_starts: torch.Tensor,
+    last_values: torch.Tensor,
+    dones: torch.Tensor,
+    log_rhos: torch.Tensor,
+    gamma: float,
+    gae_lambda: float,
+    rho_bar: float = 1.0,
+    c_bar: float = 1.0,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """V-trace targets for samples collected with a stale behavior policy.
+
+    See Espeholt et al. (2018), "IMPALA". NaN handling follows
+    `compute_gae`. The importance weights of the policy gradient are left to
+    the PPO ratio, which is taken against the behavior log probs, so the
+    advantages are not multiplied by the clipped rhos. With `log_rhos` zero,
+    the returns equal the GAE returns.
+
+    Args:
+        rewards, values, episode_starts: Tensors of shape (buffer_size, n_envs),
+            `values` from the target (learner) policy.
+        last_values, dones: Tensors of shape (n_envs,) for the step after the
+            buffer.
+        log_rhos: Log ratios of the target and behavior action probabilities,
+            shape (buffer_size, n_envs).
+        rho_bar, c_bar: Truncation levels of the importance weights.
+
+    Returns:
+        Tuple of the advantages and the value targets (returns), both of
+        shape (buffer_size, n_envs).
+    """
+    next_values = torch.cat([values[1:], last_values.unsqueeze(0)])
+    next_non_terminal = 1.0 - torch.nan_to_num(
+        torch.cat([episode_starts[1:], dones.unsqueeze(0)]), nan=1.0
+    )
+    rhos = torch.exp(torch.nan_to_num(log_rhos, nan=0))
+    clipped_rhos = torch.clamp(rhos, max=rho_bar)
+    cs = gae_lambda * torch.clamp(rhos, max=c_bar)
+
+    rewards = torch.nan_to_num(rewards, nan=0)
+    deltas = clipped_rhos * (
+        rewards
+        + torch.nan_to_num(gamma * next_values * next_non_terminal, nan=0)
+        - torch.nan_to_num(values, nan=0)
+    )
+    vs_minus_values = _reverse_linear_scan(
+        deltas, gamma * cs * next_non_terminal
+    )
+    returns = values + vs_minus_values
+
+    next_vs = torch.cat([returns[1:], last_values.unsqueeze(0)])
+    advantages = (
+        rewards
+        + torch.nan_to_num(gamma * next_vs * next_non_terminal, nan=0)
+        - torch.nan_to_num(values, nan=0)
+    )
+    return advantages, returns
+
+
+def _rollout_samples(name: str) -> property:
+    """Property viewing a flat storage tensor as (buffer_size, n_envs, ...)."""
+
+    def get(self):
+        storage = self._storage[name]
+        return storage[: self.buffer_size * self.n_envs].view(
+            self.buffer_size, self.n_envs, *storage.shape[1:]
+        )
+
+    return property(get, doc=f"{name} of the rollout.")
+
+
 class MaskedRolloutBuffer(BaseBuffer):
-    """Custom SB3 RolloutBuffer class that filters out invalid samples."""
+    """Custom SB3 RolloutBuffer class that filters out invalid samples.
+
+    The storage holds up to `max_n_envs` envs (by default the initial
+    `n_envs`) and is reused across rollouts, so changing `n_envs`, e.g.
+    after resampling the scenarios, does not reallocate it.
+    """
+
+    _storage_names = (
+        "observations",
+        "actions",
+        "rewards",
+        "episode_starts",
+        "values",
+        "log_probs",
+        "advantages",
+        "returns",
+    )
+
+    observations = _rollout_samples("observations")
+    actions = _rollout_samples("actions")
+    rewards = _rollout_samples("rewards")
+    episode_starts = _rollout_samples("episode_starts")
+    values = _rollout_samples("values")
+    log_probs = _rollout_samples("log_probs")
+    advantages = _rollout_samples("advantages")
+    returns = _rollout_samples("returns")
 
     def __init__(
         self,
@@ -33,61 +239,83 @@ class MaskedRolloutBuffer(BaseBuffer):
         gae_lambda: float = 1,
         gamma: float = 0.99,
         n_envs: int = 1,
+        compile_gae: bool = False,
+        async_transfer: bool = False,
+        max_n_envs: Optional[int] = None,
     ):
         super().__init__(
             buffer_size, observation_space, action_space, device, n_envs=n_envs
         )
         self.gae_lambda = gae_lambda
         self.gamma = gamma
+        self._compute_gae = (
+            torch.compile(compute_gae) if compile_gae else compute_gae
+        )
         self.generator_ready = False
         self.storage_device = storage_device
+        # Copy CUDA samples to pinned CPU storage on a side stream
+        self.async_transfer = (
+            async_transfer
+            and torch.device(storage_device).type == "cpu"
+            and torch.cuda.is_available()
+        )
+        if self.async_transfer:
+            self._transfer_stream = torch.cuda.Stream()
+            self._transfer_done = torch.cuda.Event()
+        self._storage = {}
+        self.max_n_envs = n_envs if max_n_envs is None else max_n_envs
         self.reset()
 
     def reset(self) -> None:
-        """Reset the buffer."""
-        self.observations = torch.zeros(
-            (self.buffer_size, self.n_envs, *self.obs_shape),
-            device=self.storage_device,
-            dtype=torch.float32,
-        )
-        self.actions = torch.zeros(
-            (self.buffer_size, self.n_envs, self.action_dim),
-            device=self.storage_device,
-            dtype=torch.float32,
-        )
-        self.rewards = torch.zeros(
-            (self.buffer_size, self.n_envs),
-            device=self.storage_device,
-            dtype=torch.float32,
-        )
-        self.returns = torch.zeros(
-            (self.buffer_size, self.n_envs),
-            device=self.storage_device,
-            dtype=torch.float32,
-        )
-        self.episode_starts = torch.zeros(
-            (self.buffer_size, self.n_envs),
-            device=self.storage_device,
-            dtype=torch.float32,
-        )
-        self.values = torch.zeros(
-            (self.buffer_size, self.n_envs),
-            device=self.storage_device,
-            dtype=torch.float32,
-        )
-        self.log_probs = torch.zeros(
-            (self.buffer_size, self.n_envs),
-            device=self.storage_device,
-            dtype=torch.float32,
-        )
-        self.advantages = torch.zeros(
-            (self.buffer_size, self.n_envs),
-            device=self.storage_device,
-            dtype=torch.float32,
-        )
+        """Reset the buffer.
+
+        The storage is kept, and only reallocated when the number of envs
+        grows beyond the capacity (`max_n_envs`).
+        """
+        if not self._storage or self.n_envs > self.max_n_envs:
+            if self._storage:
+                logging.warning(
+                    f"Reallocating the rollout buffer for {self.n_envs} envs, "
+                    f"its capacity is {self.max_n_envs}."
+                )
+            self.max_n_envs = max(self.max_n_envs, self.n_envs)
+            self._allocate_storage()
         self.generator_ready = False
+        self._reset_episode_start_count()
         super().reset()
 
+    def _reset_episode_start_count(self) -> None:
+        # Counted before any samples are filtered out, on the device
+        self.num_episode_starts = torch.zeros((), device=self.device)
+
+    def _count_episode_starts(self, episode_start: torch.Tensor) -> None:
+        self.num_episode_starts += torch.nan_to_num(
+            episode_start.to(self.device), nan=0
+        ).sum()
+
+    def _allocate_storage(self) -> None:
+        """Allocate flat storage for `max_n_envs` envs.
+
+        The fields are views of the first buffer_size * n_envs rows, so they
+        stay contiguous for any number of envs up to the capacity.
+        """
+        feature_shapes = {
+            "observations": self.obs_shape,
+            "actions": (self.action_dim,),
+        }
+        self._storage = {
+            name: torch.zeros(
+                (
+                    self.buffer_size * self.max_n_envs,
+                    *feature_shapes.get(name, ()),
+                ),
+                device=self.storage_device,
+                dtype=torch.float32,
+                pin_memory=self.async_transfer,
+            )
+            for name in self._storage_names
+        }
+
     def add(
         self,
         obs: torch.Tensor,
@@ -111,139 +339,358 @@ class MaskedRolloutBuffer(BaseBuffer):
 
         # Reshape to handle multi-dim and discrete action spaces, see GH #970 #1392
         action = action.reshape((self.n_envs, self.action_dim))
+        self._count_episode_starts(episode_start)
 
-        self.observations[self.pos] = obs.to(self.storage_device)
-        self.actions[self.pos] = action.to(self.storage_device)
-        self.rewards[self.pos] = reward.to(self.storage_device)
-        self.episode_starts[self.pos] = episode_start.to(self.storage_device)
-        self.values[self.pos] = value.flatten().to(self.storage_device)
-        self.log_probs[self.pos] = log_prob.clone().to(self.storage_device)
+        samples = (
+            (self.observations, obs),
+            (self.actions, action),
+            (self.rewards, reward),
+            (self.episode_starts, episode_start),
+            (self.values, value.flatten()),
+            (self.log_probs, log_prob),
+        )
+        if self.async_transfer:
+            self._copy_async(samples)
+        else:
+            for storage, sample in samples:
+                storage[self.pos] = sample.to(self.storage_device)
         self.pos += 1
         if self.pos == self.buffer_size:
             self.full = True
 
+    def _copy_async(self, samples) -> None:
+        """Copy one step of samples to the pinned storage without blocking.
+
+        The copies run on a side stream after the work that produced the
+        samples, so the samples must not be overwritten in place before
+        `wait_for_pending_copies` is called.
+        """
+        self._transfer_stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(self._transfer_stream):
+            for storage, sample in samples:
+                if sample.is_cuda:
+                    storage[self.pos].copy_(sample, non_blocking=True)
+                    # Keep the allocator from reusing the memory of the
+                    # sample before the copy is done
+                    sample.record_stream(self._transfer_stream)
+                else:
+                    storage[self.pos] = sample
+        self._transfer_done.record(self._transfer_stream)
+
+    def wait_for_pending_copies(self) -> None:
+        """Make the current stream wait for the copies of the added samples,
+        without blocking the host.
+
+        Call this before work on the current stream overwrites tensors that
+        were passed to `add`, e.g. the reused output buffers of the env.
+        """
+        if self.async_transfer:
+            torch.cuda.current_stream().wait_event(self._transfer_done)
+
+    def _wait_for_transfers(self) -> None:
+        """Block until all samples are in the storage."""
+        if self.async_transfer:
+            self._transfer_done.synchronize()
+
     def compute_returns_and_advantage(
         self, last_values: torch.Tensor, dones: torch.Tensor
     ) -> None:
         """GAE (General Advantage Estimation) to compute advantages and returns."""
+        self._wait_for_transfers()
+
         # Convert to numpy
         last_values = last_values.clone().flatten().to(self.storage_device)
         dones = dones.clone().flatten().to(self.storage_device)
 
-        last_gae_lam = 0
-        for step in reversed(range(self.buffer_size)):
-            if step == self.buffer_size - 1:
-                # EDIT_1: Map NaNs to 1
-                dones = torch.nan_to_num(dones, nan=1.0)
-
-                next_non_terminal = 1.0 - dones
-                next_values = last_values
-
-            else:
-                # EDIT_1: Map NaNs to 1
-                episode_starts = torch.nan_to_num(
-                    self.episode_starts[step + 1], nan=1.0
-                )
-
-                next_non_terminal = 1.0 - episode_starts
-                next_values = self.values[step + 1]
-
-            delta = (
-                torch.nan_to_num(
-                    self.rewards[step], nan=0
-                )  # EDIT_2: Set invalid rewards to zero
-                + torch.nan_to_num(
-                    self.gamma * next_values * next_non_terminal, nan=0
-                )  # EDIT_3: Set invalid rewards to zero
-                - torch.nan_to_num(
-                    self.values[step], nan=0
-                )  # EDIT_4: Set invalid values to zero
+        self.advantages.copy_(
+            self._compute_gae(
+                self.rewards,
+                self.values,
+                self.episode_starts,
+                last_values,
+                dones,
+                self.gamma,
+                self.gae_lambda,
             )
-
-            last_gae_lam = (
-                delta
-                + self.gamma
-                * self.gae_lambda
-                * next_non_terminal
-                * last_gae_lam
-            )
-            self.advantages[step] = last_gae_lam
+        )
         # TD(lambda) estimator, see Github PR #375 or "Telescoping in TD(lambda)"
         # in David Silver Lecture 4: https://www.youtube.com/watch?v=PnHCvfgC_ZA
-        self.returns = self.advantages + self.values
+        torch.add(self.advantages, self.values, out=self.returns)
 
         assert not torch.isnan(
             self.advantages
         ).any(), "Advantages arr contains NaN values: Check GAE computation"
 
+    def _flat_samples(self):
+        """Storage viewed as one row per sample, ordered like
+        RolloutBufferSamples. Views only, nothing is copied."""
+        num_samples = self.buffer_size * self.n_envs
+        return (
+            self.observations.view(num_samples, *self.obs_shape),
+            self.actions.view(num_samples, self.action_dim),
+            self.values.view(num_samples),
+            self.log_probs.view(num_samples),
+            self.advantages.view(num_samples),
+            self.returns.view(num_samples),
+        )
+
+    def _valid_sample_indices(self) -> torch.Tensor:
+        """Rows of `_flat_samples` that hold valid (non NaN reward) samples."""
+        return torch.nonzero(~torch.isnan(self.rewards.flatten())).flatten()
+
+    def valid_samples(self, name: str) -> torch.Tensor:
+        """Flat tensor `name` (e.g. "values") of the valid samples."""
+        flat = getattr(self, name).flatten(0, 1)
+        return flat[self._valid_sample_indices()]
+
     def get(
         self, batch_size: Optional[int] = None
     ) -> Generator[RolloutBufferSamples, None, None]:
+        """Yield shuffled minibatches of the valid samples.
+
+        EDIT_5: The storage stays in place. Every minibatch is gathered by
+        index into output buffers that are reused by the next minibatch, so
+        the samples must be consumed before advancing the generator.
+        """
         assert self.full, ""
 
-        # Prepare the data
         if not self.generator_ready:
-            _tensor_names = [
-                "observations",
-                "actions",
-                "values",
-                "log_probs",
-                "advantages",
-                "returns",
-                "rewards",
-            ]
-            # Create mask
-            self.valid_samples_mask = ~torch.isnan(
-                self.swap_and_flatten(self.__dict__["rewards"])
-            )
-
-            # Flatten data
-            # EDIT_5: And mask out invalid samples
-            for tensor in _tensor_names:
-                if tensor == "observations":
-                    self.__dict__[tensor] = self.swap_and_flatten(
-                        self.__dict__[tensor]
-                    )[self.valid_samples_mask.flatten(), :]
-                else:
-                    self.__dict__[tensor] = self.swap_and_flatten(
-                        self.__dict__[tensor]
-                    )[self.valid_samples_mask]
-
-                assert not torch.isnan(
-                    self.__dict__[tensor]
-                ).any(), f"{tensor} tensor contains NaN values; something went wrong"
-
+            self.sample_indices = self._valid_sample_indices()
             self.generator_ready = True
 
-        # EDIT_6: Compute total number of samples and create indices
-        total_num_samples = self.valid_samples_mask.sum()
-        indices = torch.randperm(total_num_samples)
-
-        # if self.__dict__["observations"].max() > 1 or self.__dict__["observations"].min() < -1:
-        #     print("Observations are out of range")
+        # EDIT_6: Compute total number of samples and shuffle the indices
+        total_num_samples = len(self.sample_indices)
+        indices = self.sample_indices[
+            torch.randperm(total_num_samples, device=self.sample_indices.device)
+        ]
 
         # Return everything, don't create minibatches
         if batch_size is None:
             batch_size = total_num_samples
 
+        samples = self._flat_samples()
+        self._allocate_minibatch_buffers(samples, batch_size)
         start_idx = 0
         while start_idx < total_num_samples:
             yield self._get_samples(
-                indices[start_idx : start_idx + batch_size]
+                indices[start_idx : start_idx + batch_size], samples
             )
             start_idx += batch_size
 
+    def _allocate_minibatch_buffers(self, samples, batch_size: int) -> None:
+        """Allocate the minibatch outputs, unless the current ones fit."""
+        shapes = [(batch_size, *field.shape[1:]) for field in samples]
+        if getattr(self, "_minibatch_shapes", None) == shapes:
+            return
+
+        device = torch.device(self.device)
+        storage_device = torch.device(self.storage_device)
+        pin_memory = storage_device.type == "cpu" and device.type == "cuda"
+        # Gather on the storage device, then copy once to the training device
+        self._minibatch_staging = [
+            torch.empty(shape, device=storage_device, pin_memory=pin_memory)
+            for shape in shapes
+        ]
+        self._minibatch_outputs = (
+            self._minibatch_staging
+            if storage_device == device
+            else [torch.empty(shape, device=device) for shape in shapes]
+        )
+        self._staging_copied = torch.cuda.Event() if pin_memory else None
+        self._minibatch_shapes = shapes
+
     def _get_samples(
         self,
-        batch_inds: np.ndarray,
-        env: Optional[VecNormalize] = None,
+        batch_inds: torch.Tensor,
+        samples,
     ) -> RolloutBufferSamples:  # type: ignore[signature-mismatch]
-        data = (
-            self.observations[batch_inds],
-            self.actions[batch_inds],
-            self.values[batch_inds].flatten(),
-            self.log_probs[batch_inds].flatten(),
-            self.advantages[batch_inds].flatten(),
-            self.returns[batch_inds].flatten(),
-        )
-        return RolloutBufferSamples(*tuple(map(self.to_torch, data)))
+        num = len(batch_inds)
+        if self._staging_copied is not None:
+            # The previous minibatch may still be copied from the staging buffers
+            self._staging_copied.synchronize()
+
+        data = []
+        for field, staging, output in zip(
+            samples, self._minibatch_staging, self._minibatch_outputs
+        ):
+            torch.index_select(field, 0, batch_inds, out=staging[:num])
+            if output is not staging:
+                output[:num].copy_(staging[:num], non_blocking=True)
+            data.append(output[:num])
+
+        if self._staging_copied is not None:
+            self._staging_copied.record()
+        return RolloutBufferSamples(*data)
+
+
+def _stored_samples(name: str) -> property:
+    """Property exposing the filled rows of a ragged storage tensor."""
+    return property(
+        lambda self: self._storage[name][: self.num_samples],
+        doc=f"{name} of the stored samples.",
+    )
+
+
+class RaggedRolloutBuffer(MaskedRolloutBuffer):
+    """Rollout buffer that only stores the samples of alive agents.
+
+    Valid samples (non NaN rewards) are appended to flat storage tensors with
+    one row per agent step, and their (step, env) position is recorded in
+    `sample_index`. The storage doubles when it is full and is kept across
+    rollouts, so memory follows the number of valid agent steps rather than
+    buffer_size * n_envs.
+    """
+
+    observations = _stored_samples("observations")
+    actions = _stored_samples("actions")
+    rewards = _stored_samples("rewards")
+    episode_starts = _stored_samples("episode_starts")
+    values = _stored_samples("values")
+    log_probs = _stored_samples("log_probs")
+    advantages = _stored_samples("advantages")
+    returns = _stored_samples("returns")
+
+    def __init__(self, *args, initial_capacity: int = 0, **kwargs):
+        if kwargs.get("async_transfer"):
+            raise ValueError(
+                "async_transfer is not supported by RaggedRolloutBuffer: "
+                "appending the valid samples needs their count on the host."
+            )
+        self._storage = {}
+        self.capacity = 0
+        self.num_samples = 0
+        self.initial_capacity = initial_capacity
+        super().__init__(*args, **kwargs)
+
+    def reset(self) -> None:
+        """Reset the buffer, keeping the allocated storage."""
+        if self.capacity == 0:
+            self._grow(max(self.initial_capacity, self.n_envs))
+        # Storage row of every (step, env) sample, -1 for invalid samples
+        self.sample_index = torch.full(
+            (self.buffer_size, self.n_envs),
+            fill_value=-1,
+            device=self.storage_device,
+            dtype=torch.long,
+        )
+        self.num_samples = 0
+        self.generator_ready = False
+        self._reset_episode_start_count()
+        BaseBuffer.reset(self)
+
+    def _grow(self, capacity: int) -> None:
+        """Reallocate the storage with room for `capacity` samples."""
+        feature_shapes = {
+            "observations": self.obs_shape,
+            "actions": (self.action_dim,),
+        }
+        for name in self._storage_names:
+            storage = torch.zeros(
+                (capacity, *feature_shapes.get(name, ())),
+                device=self.storage_device,
+                dtype=torch.float32,
+            )
+            if name in self._storage:
+                storage[: self.num_samples] = self._storage[name][
+                    : self.num_samples
+                ]
+            self._storage[name] = storage
+        self.capacity = capacity
+
+    def add(
+        self,
+        obs: torch.Tensor,
+        action: torch.Tensor,
+        reward: torch.Tensor,
+        episode_start: torch.Tensor,
+        value: torch.Tensor,
+        log_prob: torch.Tensor,
+    ) -> None:
+        """Append the samples with a valid reward."""
+        # The episode start of an agent that is done comes with a NaN reward
+        self._count_episode_starts(episode_start)
+        valid = ~torch.isnan(reward)
+        env_idx = torch.nonzero(valid).flatten().to(self.storage_device)
+        num_new = env_idx.numel()
+
+        start = self.num_samples
+        end = start + num_new
+        if end > self.capacity:
+            self._grow(max(2 * self.capacity, end))
+
+        obs = obs.reshape((self.n_envs, *self.obs_shape))
+        action = action.reshape((self.n_envs, self.action_dim))
+        new_samples = {
+            "observations": obs[valid],
+            "actions": action[valid],
+            "rewards": reward[valid],
+            "episode_starts": episode_start.to(valid.device)[valid],
+            "values": value.flatten()[valid],
+            "log_probs": log_prob.flatten()[valid],
+        }
+        for name, samples in new_samples.items():
+            self._storage[name][start:end] = samples.to(self.storage_device)
+
+        self.sample_index[self.pos, env_idx] = torch.arange(
+            start, end, device=self.storage_device
+        )
+        self.num_samples = end
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+
+    def _to_dense(self, samples: torch.Tensor) -> torch.Tensor:
+        """Scatter per-sample scalars to (buffer_size, n_envs), NaN padded."""
+        dense = torch.full(
+            (self.buffer_size, self.n_envs),
+            fill_value=float("nan"),
+            device=self.storage_device,
+        )
+        valid = self.sample_index >= 0
+        dense[valid] = samples[self.sample_index[valid]]
+        return dense
+
+    def compute_returns_and_advantage(
+        self, last_values: torch.Tensor, dones: torch.Tensor
+    ) -> None:
+        """GAE over the stored samples.
+
+        Only the scalar fields are expanded to (buffer_size, n_envs), with NaN
+        for invalid samples, so the result matches MaskedRolloutBuffer.
+        """
+        last_values = last_values.clone().flatten().to(self.storage_device)
+        dones = dones.clone().flatten().to(self.storage_device)
+
+        dense_advantages = self._compute_gae(
+            self._to_dense(self.rewards),
+            self._to_dense(self.values),
+            self._to_dense(self.episode_starts),
+            last_values,
+            dones,
+            self.gamma,
+            self.gae_lambda,
+        )
+        valid = self.sample_index >= 0
+        self.advantages[self.sample_index[valid]] = dense_advantages[valid]
+        self.returns[:] = self.advantages + self.values
+
+        assert not torch.isnan(
+            self.advantages
+        ).any(), "Advantages arr contains NaN values: Check GAE computation"
+
+    def _flat_samples(self):
+        return (
+            self.observations,
+            self.actions,
+            self.values,
+            self.log_probs,
+            self.advantages,
+            self.returns,
+        )
+
+    def _valid_sample_indices(self) -> torch.Tensor:
+        # The storage only holds valid samples
+        return torch.arange(self.num_samples, device=self.storage_device)
+
+    def valid_samples(self, name: str) -> torch.Tensor:
+        return getattr(self, name)
@@ -1,3 +1,6 @@
+import time
+import warnings
+
 import torch
 
 # From stable baselines, adapted np to torch
@@ -20,3 +23,69 @@ def explained_variance(
     assert y_true.ndim == 1 and y_pred.ndim == 1
     var_y = torch.var(y_true)
     return torch.nan if var_y == 0 else 1 - torch.var(y_true - y_pred) / var_y
+
+
+class DeviceTimer:
+    """Accumulates the time spent in `with timer:` blocks.
+
+    On CUDA the blocks are timed with events, so timing does not wait for the
+    device; the device is only synchronized when `total_seconds` is read.
+    """
+
+    def __init__(self, device: torch.device):
+        self.use_events = torch.device(device).type == "cuda"
+        self.events = []
+        self.seconds = 0.0
+
+    def __enter__(self):
+        if self.use_events:
+            start = torch.cuda.Event(enable_timing=True)
+            start.record()
+            self.events.append([start, None])
+        else:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.use_events:
+            end = torch.cuda.Event(enable_timing=True)
+            end.record()
+            self.events[-1][1] = end
+        else:
+            self.seconds += time.perf_counter() - self.start
+
+    def total_seconds(self) -> float:
+        if self.events:
+            self.events[-1][1].synchronize()
+            self.seconds += sum(
+                start.elapsed_time(end) for start, end in self.events
+            ) / 1000
+            self.events = []
+        return self.seconds
+
+
+class DeviceSyncCounter:
+    """Counts the synchronizing CUDA operations made by torch in `with` blocks.
+
+    Uses torch's sync debug mode, so only host-device synchronizations issued
+    through torch (e.g. `.item()`, `.tolist()`, boolean indexing) are seen,
+    not the ones made inside the simulator.
+    """
+
+    def __init__(self):
+        self.counts = []
+
+    def __enter__(self):
+        self._previous_mode = torch.cuda.get_sync_debug_mode()
+        self._catcher = warnings.catch_warnings(record=True)
+        self._caught = self._catcher.__enter__()
+        warnings.simplefilter("always")
+        torch.cuda.set_sync_debug_mode("warn")
+        return self
+
+    def __exit__(self, *exc):
+        torch.cuda.set_sync_debug_mode(self._previous_mode)
+        self._catcher.__exit__(*exc)
+        self.counts.append(
+            sum("synchronizing" in str(w.message) for w in self._caught)
+        )
@@ -1,6 +1,7 @@
 from networks.perm_eq_late_fusion import LateFusionNet, LateFusionPolicy
 from networks.basic_ffn import FFN, FeedForwardPolicy
 from dataclasses import dataclass
+from typing import Optional
 import gpudrive
 from pygpudrive.env.config import SelectionDiscipline
 
@@ -20,12 +21,19 @@ class ExperimentConfig:
     k_unique_scenes: int = 3
     device: str = "cuda"  # or "cpu"
 
+    # ACTION SPACE
+    # "discrete": one categorical over the joint action grid
+    # "multi_discrete": one categorical per action component
+    action_type: str = "discrete"
+
     # Set the weights for the reward components
     # R = a * collided + b * goal_achieved + c * off_road
     reward_type: str = "weighted_combination"
     collision_weight: float = 0.0
     goal_achieved_weight: float = 1.0
     off_road_weight: float = 0.0
+    progress_weight: float = 0.0
+    expert_distance_weight: float = 0.0
 
     # RESAMPLE TRAFFIC SCENARIOS
     resample_scenarios: bool = False
@@ -77,6 +85,20 @@ class ExperimentConfig:
     vf_coef: float = 0.5
     lr: float = 3e-4
     n_epochs: int = 5
+    compile_gae: bool = False  # torch.compile the GAE reverse scan
+    ragged_buffer: bool = False  # Only store the samples of alive agents
+    async_transfer: bool = False  # Copy rollouts to pinned storage without blocking
+    # Max number of controlled agents the rollout buffer is allocated for,
+    # defaults to the initial number. Resampling never shrinks the buffer.
+    rollout_buffer_capacity: Optional[int] = None
+    # Log host-device syncs per rollout step (not with async_actor_learner)
+    diagnose_syncs: bool = False
+    autocast: bool = False  # Mixed precision policy passes (bf16 on CPU)
+    compile_policy: bool = False  # torch.compile the policy network
+    fused_optimizer: bool = False  # Fused optimizer steps
+    # Collect rollouts with a one update old policy while training,
+    # corrected with V-trace (see AsyncIPPO)
+    async_actor_learner: bool = False
 
     # NETWORK
     mlp_class = LateFusionNet
@@ -89,3 +111,7 @@ class ExperimentConfig:
     dropout = 0.0
     last_layer_dim_pi = 64
     last_layer_dim_vf = 64
+    # Only embed the partners and road points that are not padding
+    masked_encoders: bool = False
+    # Share the entity encoders between the actor and critic heads
+    shared_encoder: bool = False
@@ -1,10 +1,14 @@
+import time
+import numpy as np
 import wandb
 import pyrallis
 from typing import Callable
 from datetime import datetime
 import dataclasses
 from algorithms.sb3.ppo.ippo import IPPO
+from algorithms.sb3.ppo.async_ippo import AsyncIPPO
 from algorithms.sb3.callbacks import MultiAgentCallback
+from algorithms.sb3.distributed import is_main_process
 from baselines.ippo.config import ExperimentConfig
 from pygpudrive.env.config import EnvConfig, SceneConfig
 from pygpudrive.env.wrappers.sb3_wrapper import SB3MultiAgentEnv
@@ -41,6 +45,8 @@ def train(exp_config: ExperimentConfig, scene_config: SceneConfig):
         collision_weight=exp_config.collision_weight,
         goal_achieved_weight=exp_config.goal_achieved_weight,
         off_road_weight=exp_config.off_road_weight,
+        progress_weight=exp_config.progress_weight,
+        expert_distance_weight=exp_config.expert_distance_weight,
     )
 
     # MAKE SB3-COMPATIBLE ENVIRONMENT
@@ -68,7 +74,8 @@ def train(exp_config: ExperimentConfig, scene_config: SceneConfig):
         group=exp_config.group_name,
         sync_tensorboard=exp_config.sync_tensorboard,
         tags=exp_config.tags,
-        mode=exp_config.wandb_mode,
+        # Only the first rank logs in distributed training
+        mode=exp_config.wandb_mode if is_main_process() else "disabled",
         config={**exp_config.__dict__, **env_config.__dict__},
     )
 
@@ -79,7 +86,8 @@ def train(exp_config: ExperimentConfig, scene_config: SceneConfig):
     )
 
     # INITIALIZE IPPO
-    model = IPPO(
+    algorithm = AsyncIPPO if exp_config.async_actor_learner else IPPO
+    model = algorithm(
         n_steps=exp_config.n_steps,
         batch_size=exp_config.batch_size,
         env=env,
@@ -87,7 +95,7 @@ def train(exp_config: ExperimentConfig, scene_config: SceneConfig):
         verbose=exp_config.verbose,
         device=exp_config.device,
         tensorboard_log=f"runs/{run_id}"
-        if run_id is not None
+        if run_id is not None and is_main_process()
         else None,  # Sync with wandb
         mlp_class=exp_config.mlp_class,
         policy=exp_config.policy,
@@ -98,15 +106,31 @@ def train(exp_config: ExperimentConfig, scene_config: SceneConfig):
         learning_rate=linear_schedule(exp_config.lr),
         ent_coef=exp_config.ent_coef,
         n_epochs=exp_config.n_epochs,
+        compile_gae=exp_config.compile_gae,
+        ragged_buffer=exp_config.ragged_buffer,
+        async_transfer=exp_config.async_transfer,
+        rollout_buffer_capacity=exp_config.rollout_buffer_capacity,
+        diagnose_syncs=exp_config.diagnose_syncs,
+        autocast=exp_config.autocast,
+        compile_policy=exp_config.compile_policy,
+        fused_optimizer=exp_config.fused_optimizer,
         env_config=env_config,
         exp_config=exp_config,
     )
 
     # LEARN
+    time_learn = time.perf_counter()
     model.learn(
         total_timesteps=exp_config.total_timesteps,
         callback=custom_callback,
     )
+    time_learn = time.perf_counter() - time_learn
+
+    if is_main_process():
+        print(
+            f"SPS: {model.num_timesteps / time_learn:,.0f} | "
+            f"learner time per update: {np.mean(model.learner_times):.3f} s"
+        )
 
     run.finish()
     env.close()
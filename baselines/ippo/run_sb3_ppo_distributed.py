@@ -0,0 +1,59 @@
+"""Data parallel IPPO training on CPU with torch.distributed (gloo).
+
+Launch one process per rank with torchrun, e.g. 8 ranks on each of 2 nodes:
+
+    torchrun --nnodes 2 --nproc_per_node 8 \
+        --rdzv_backend c10d --rdzv_endpoint HOST:29500 \
+        baselines/ippo/run_sb3_ppo_distributed.py --num_worlds 50
+
+Every rank runs its own simulator with `num_worlds` worlds, drawn from its
+own disjoint shard of the scenes in `data_dir`, and all-reduces the
+gradients of every optimizer step. Only rank 0 logs, renders and saves
+checkpoints; the logger records are averaged over the ranks and the episode
+metrics are computed from the episodes of all ranks.
+"""
+import dataclasses
+import os
+
+import pyrallis
+import torch
+import torch.distributed as dist
+
+from baselines.ippo.config import ExperimentConfig
+from baselines.ippo.run_sb3_ppo import train
+from pygpudrive.env.config import SceneConfig
+
+
+if __name__ == "__main__":
+
+    dist.init_process_group(backend="gloo")
+    rank = dist.get_rank()
+    world_size = dist.get_world_size()
+
+    # Split the cores of a node between its ranks
+    local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", 1))
+    torch.set_num_threads(max(1, os.cpu_count() // local_world_size))
+
+    exp_config = pyrallis.parse(config_class=ExperimentConfig)
+    exp_config = dataclasses.replace(
+        exp_config,
+        device="cpu",
+        seed=exp_config.seed + rank,
+    )
+    if rank != 0:
+        exp_config = dataclasses.replace(
+            exp_config, render=False, save_policy=False, verbose=0
+        )
+
+    scene_config = SceneConfig(
+        path=exp_config.data_dir,
+        num_scenes=exp_config.num_worlds,
+        discipline=exp_config.selection_discipline,
+        k_unique_scenes=exp_config.k_unique_scenes,
+        shard_index=rank,
+        num_shards=world_size,
+    )
+
+    train(exp_config, scene_config)
+
+    dist.destroy_process_group()
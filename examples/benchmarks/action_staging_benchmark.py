@@ -0,0 +1,109 @@
+"""Per-step allocations and time of feeding actions to the simulator.
+
+Compares the previous `_apply_actions` path (nan_to_num, cast, fancy index and
+a fresh view of the simulator's action tensor every step) with the staged path
+of `GPUDriveTorchEnv`, for actions produced on the device and on the host.
+
+Allocations are counted with the CUDA caching allocator statistics on the GPU
+and with the profiler's memory events on the CPU.
+"""
+
+import time
+
+import pandas as pd
+import torch
+
+from pygpudrive.env.config import EnvConfig, SceneConfig
+from pygpudrive.env.env_torch import GPUDriveTorchEnv
+
+MAX_CONT_AGENTS = 128
+NUM_STEPS = 100
+WARMUP_STEPS = 10
+
+
+def legacy_apply_actions(env, actions):
+    """The action path before staging, kept for reference."""
+    actions = torch.nan_to_num(actions, nan=0).long().to(env.device)
+    action_value_tensor = env.action_keys_tensor[actions]
+    env.sim.action_tensor().to_torch()[:, :, :3].copy_(action_value_tensor)
+
+
+def staged_apply_actions(env, actions):
+    env._apply_actions(actions)
+
+
+def count_allocations(apply_fn, env, actions):
+    """Number of tensor allocations made by a single call of `apply_fn`."""
+    if torch.device(env.device).type == "cuda":
+        torch.cuda.synchronize()
+        before = torch.cuda.memory_stats()["allocation.all.allocated"]
+        apply_fn(env, actions)
+        torch.cuda.synchronize()
+        return torch.cuda.memory_stats()["allocation.all.allocated"] - before
+
+    with torch.profiler.profile(
+        activities=[torch.profiler.ProfilerActivity.CPU], profile_memory=True
+    ) as prof:
+        apply_fn(env, actions)
+    return sum(
+        1
+        for event in prof.events()
+        if event.name == "[memory]" and event.cpu_memory_usage > 0
+    )
+
+
+def run_bench(env, apply_fn, action_device):
+    actions = torch.randint(
+        0, env.action_space.n, (env.num_worlds, env.max_agent_count)
+    ).float()
+    actions[~env.cont_agent_mask] = float("nan")
+    actions = actions.to(action_device)
+
+    for _ in range(WARMUP_STEPS):
+        apply_fn(env, actions)
+
+    allocations = count_allocations(apply_fn, env, actions)
+
+    start = time.perf_counter()
+    for _ in range(NUM_STEPS):
+        apply_fn(env, actions)
+    if torch.device(env.device).type == "cuda":
+        torch.cuda.synchronize()
+    step_time = (time.perf_counter() - start) / NUM_STEPS
+
+    return allocations, step_time
+
+
+if __name__ == "__main__":
+
+    DATA_FOLDER = "data/processed/examples"
+    NUM_WORLDS = 50
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+    env = GPUDriveTorchEnv(
+        config=EnvConfig(),
+        scene_config=SceneConfig(path=DATA_FOLDER, num_scenes=NUM_WORLDS),
+        max_cont_agents=MAX_CONT_AGENTS,
+        device=DEVICE,
+    )
+
+    action_devices = ["cpu", "cuda"] if DEVICE == "cuda" else ["cpu"]
+    rows = []
+    for action_device in action_devices:
+        for name, apply_fn in (
+            ("legacy", legacy_apply_actions),
+            ("staged", staged_apply_actions),
+        ):
+            allocations, step_time = run_bench(env, apply_fn, action_device)
+            rows.append(
+                {
+                    "path": name,
+                    "env_device": DEVICE,
+                    "action_device": action_device,
+                    "allocations_per_step": allocations,
+                    "apply_time (us)": step_time * 1e6,
+                }
+            )
+
+    print(pd.DataFrame(rows).to_string(index=False))
+    env.close()
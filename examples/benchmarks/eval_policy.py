@@ -6,7 +6,6 @@ from pygpudrive.env.config import (
 )
 from pygpudrive.env.env_torch import GPUDriveTorchEnv
 from pygpudrive.agents.policy_actor import PolicyActor
-from pygpudrive.agents.core import merge_actions
 import mediapy
 
 if __name__ == "__main__":
@@ -59,14 +58,8 @@ if __name__ == "__main__":
         print(f"Step {time_step}/{env_config.episode_len}")
 
         # SELECT ACTIONS
-        policy_actions = policy_actor.select_action(obs)
-        
-        actions = merge_actions(
-            actor_actions_dict={"policy": policy_actions},
-            actor_ids_dict={"policy": policy_actor.actor_ids},
-            reference_action_tensor=env.cont_agent_mask,
-            device=DEVICE,
-        )
+        # One forward pass for the agents of all worlds
+        actions = policy_actor.select_action_tensor(obs)
         
         # STEP
         env.step_dynamics(actions)
@@ -0,0 +1,82 @@
+"""Time of computing GAE advantages for a full rollout.
+
+Compares the step by step loop with the vectorized reverse scan, eagerly and
+with torch.compile, for rollouts of `n_steps` steps and a growing number of
+agents. Reports the mean time per call and the max deviation from the loop.
+"""
+
+import time
+
+import pandas as pd
+import torch
+
+from algorithms.sb3.rollout_buffer import compute_gae, compute_gae_loop
+
+N_STEPS = 91
+GAMMA = 0.99
+GAE_LAMBDA = 0.95
+NUM_REPEATS = 20
+WARMUP = 3
+
+
+def make_rollout(n_envs, device):
+    rewards = torch.randn(N_STEPS, n_envs, device=device)
+    values = torch.randn(N_STEPS, n_envs, device=device)
+    episode_starts = (torch.rand(N_STEPS, n_envs, device=device) < 0.02).float()
+    last_values = torch.randn(n_envs, device=device)
+    dones = torch.zeros(n_envs, device=device)
+
+    # Dead agents are NaN padded
+    dead = torch.rand(N_STEPS, n_envs, device=device) < 0.3
+    for tensor in (rewards, values, episode_starts):
+        tensor[dead] = float("nan")
+    return rewards, values, episode_starts, last_values, dones
+
+
+def time_fn(fn, rollout, device):
+    for _ in range(WARMUP):
+        fn(*rollout, GAMMA, GAE_LAMBDA)
+    if device == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(NUM_REPEATS):
+        advantages = fn(*rollout, GAMMA, GAE_LAMBDA)
+    if device == "cuda":
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / NUM_REPEATS, advantages
+
+
+if __name__ == "__main__":
+
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    NUM_ENVS = [1_000, 10_000, 50_000]
+
+    implementations = {
+        "loop": compute_gae_loop,
+        "scan": compute_gae,
+        "scan_compiled": torch.compile(compute_gae),
+    }
+
+    rows = []
+    for n_envs in NUM_ENVS:
+        rollout = make_rollout(n_envs, DEVICE)
+        reference = None
+        for name, fn in implementations.items():
+            step_time, advantages = time_fn(fn, rollout, DEVICE)
+            if reference is None:
+                reference = advantages
+            rows.append(
+                {
+                    "impl": name,
+                    "device": DEVICE,
+                    "n_envs": n_envs,
+                    "time (ms)": step_time * 1000,
+                    "max_abs_diff": (advantages - reference).abs().max().item(),
+                }
+            )
+
+    df = pd.DataFrame(rows)
+    df["speedup"] = df.groupby("n_envs")["time (ms)"].transform(
+        lambda t: t.iloc[0] / t
+    )
+    print(df.to_string(index=False))
@@ -0,0 +1,108 @@
+"""Lidar throughput with and without the static lidar grid.
+
+Simulates the densest scenes with lidar-only observations, once tracing every
+lidar ray through the physics BVH and once tracing the road rays through the
+per-world lidar grid. Reports step time and agent steps per second.
+"""
+
+import time
+from multiprocessing import Process, Queue
+
+import pandas as pd
+import torch
+
+import gpudrive
+
+from road_grid_benchmark import densest_scenes
+
+MAX_CONT_AGENTS = 128
+EPISODE_LENGTH = 80
+WARMUP_STEPS = 10
+
+
+def make_sim(scenes, device, enable_lidar_grid):
+    """Make the gpudrive simulator."""
+    reward_params = gpudrive.RewardParams()
+    reward_params.rewardType = gpudrive.RewardType.OnGoalAchieved
+    reward_params.distanceToGoalThreshold = 1.0
+    reward_params.distanceToExpertThreshold = 1.0
+
+    params = gpudrive.Parameters()
+    params.polylineReductionThreshold = 0.5
+    params.observationRadius = 10.0
+    params.collisionBehaviour = gpudrive.CollisionBehaviour.Ignore
+    params.rewardParams = reward_params
+    params.maxNumControlledAgents = MAX_CONT_AGENTS
+    params.enableLidar = True
+    params.disableClassicalObs = True
+    params.enableLidarGrid = enable_lidar_grid
+
+    return gpudrive.SimManager(
+        exec_mode=gpudrive.madrona.ExecMode.CPU
+        if device == "cpu"
+        else gpudrive.madrona.ExecMode.CUDA,
+        gpu_id=0,
+        scenes=scenes,
+        params=params,
+    )
+
+
+def run_bench(scenes, device, enable_lidar_grid, q):
+    sim = make_sim(scenes, device, enable_lidar_grid)
+    sim.reset(list(range(len(scenes))))
+
+    for _ in range(WARMUP_STEPS):
+        sim.step()
+
+    actions = torch.zeros_like(sim.action_tensor().to_torch())
+    total_step_time = 0.0
+    total_agent_frames = 0
+    for _ in range(EPISODE_LENGTH):
+        start = time.perf_counter()
+        sim.action_tensor().to_torch().copy_(actions)
+        sim.step()
+        sim.lidar_tensor().to_torch()
+        if device == "cuda":
+            torch.cuda.synchronize()
+        total_step_time += time.perf_counter() - start
+
+        total_agent_frames += (
+            (sim.controlled_state_tensor().to_torch() == 1).sum().item()
+        )
+
+    q.put((total_step_time / EPISODE_LENGTH, total_agent_frames / total_step_time))
+
+
+def run_in_process(*args):
+    # Fresh process per configuration so that simulators do not share state
+    q = Queue()
+    p = Process(target=run_bench, args=(*args, q))
+    p.start()
+    p.join()
+    return q.get()
+
+
+if __name__ == "__main__":
+
+    DATA_FOLDER = "data/processed/examples"
+    NUM_SCENES = 3
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+    scenes = densest_scenes(DATA_FOLDER, NUM_SCENES)
+
+    rows = []
+    for enable_lidar_grid in (False, True):
+        step_time, agent_fps = run_in_process(scenes, DEVICE, enable_lidar_grid)
+        rows.append(
+            {
+                "road_rays": "lidar_grid" if enable_lidar_grid else "bvh",
+                "device": DEVICE,
+                "num_worlds": len(scenes),
+                "step_time (ms)": step_time * 1000,
+                "controlled_agent_fps": agent_fps,
+            }
+        )
+
+    df = pd.DataFrame(rows)
+    df["speedup"] = df["step_time (ms)"].iloc[0] / df["step_time (ms)"]
+    print(df.to_string(index=False))
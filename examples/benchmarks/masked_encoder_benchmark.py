@@ -0,0 +1,125 @@
+"""Throughput of the dense and the padding-aware (masked) encoders of
+LateFusionNet on observations of real scenes.
+
+Observations of the controlled agents are collected while stepping DATA_FOLDER
+scenes with random actions, then grouped into quartiles by the fraction of
+partner and road point slots that hold a valid entity. For each group and for
+the mixed batch, reports the forward time of both encoder modes, the speedup
+and the max deviation of the masked outputs from the dense ones.
+"""
+
+import dataclasses
+import time
+
+import pandas as pd
+import torch
+
+from baselines.ippo.config import ExperimentConfig
+from networks.perm_eq_late_fusion import LateFusionNet
+from pygpudrive.env import constants
+from pygpudrive.env.config import EnvConfig, SceneConfig
+from pygpudrive.env.env_torch import GPUDriveTorchEnv
+
+MAX_CONT_AGENTS = 128
+NUM_STEPS = 80
+BATCH_SIZE = 4096
+NUM_REPEATS = 20
+WARMUP = 3
+
+
+def collect_observations(env, num_steps):
+    """Observations of the controlled agents at every step."""
+    observations = [env.reset()[env.cont_agent_mask]]
+    for _ in range(num_steps):
+        actions = torch.randint(
+            0,
+            env.action_space.n,
+            (env.num_worlds, env.max_agent_count),
+            device=env.device,
+        )
+        env.step_dynamics(actions)
+        observations.append(env.get_obs()[env.cont_agent_mask])
+    return torch.cat(observations)
+
+
+def valid_fraction(net, obs):
+    """Fraction of partner and road point slots that are not padding."""
+    _, road_objects, road_graph = net._unpack_obs(obs)
+    entities = torch.cat(
+        [
+            road_objects[..., : constants.ENTITY_CONT_FEAT_DIM + 1],
+            road_graph[..., : constants.ENTITY_CONT_FEAT_DIM + 1],
+        ],
+        dim=1,
+    )
+    padding = (entities[..., :-1] == 0).all(dim=-1) & (entities[..., -1] == 1)
+    return (~padding).float().mean(dim=1)
+
+
+@torch.no_grad()
+def time_forward(net, obs, masked_encoders):
+    net.masked_encoders = masked_encoders
+    sync = torch.cuda.synchronize if obs.is_cuda else (lambda: None)
+    for _ in range(WARMUP):
+        outputs = net(obs)
+    sync()
+    start = time.perf_counter()
+    for _ in range(NUM_REPEATS):
+        net(obs)
+    sync()
+    return (time.perf_counter() - start) / NUM_REPEATS, outputs
+
+
+def run_bench(net, obs, group):
+    dense_time, dense_outputs = time_forward(net, obs, masked_encoders=False)
+    masked_time, masked_outputs = time_forward(net, obs, masked_encoders=True)
+    max_deviation = max(
+        (dense - masked).abs().max().item()
+        for dense, masked in zip(dense_outputs, masked_outputs)
+    )
+    return {
+        "group": group,
+        "batch_size": len(obs),
+        "mean_valid_fraction": valid_fraction(net, obs).mean().item(),
+        "dense (ms)": dense_time * 1000,
+        "masked (ms)": masked_time * 1000,
+        "speedup": dense_time / masked_time,
+        "max_deviation": max_deviation,
+    }
+
+
+if __name__ == "__main__":
+
+    DATA_FOLDER = "data/processed/examples"
+    NUM_WORLDS = 50
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+    env_config = EnvConfig()
+    env = GPUDriveTorchEnv(
+        config=env_config,
+        scene_config=SceneConfig(path=DATA_FOLDER, num_scenes=NUM_WORLDS),
+        max_cont_agents=MAX_CONT_AGENTS,
+        device=DEVICE,
+    )
+    obs = collect_observations(env, NUM_STEPS)
+    env.close()
+
+    exp_config = dataclasses.replace(ExperimentConfig(), device=DEVICE)
+    net = LateFusionNet(None, env_config, exp_config).to(DEVICE).eval()
+
+    # Group the observations by scene density
+    fractions = valid_fraction(net, obs)
+    quartiles = torch.quantile(
+        fractions, torch.tensor([0.25, 0.5, 0.75], device=fractions.device)
+    )
+    groups = torch.bucketize(fractions, quartiles)
+
+    rows = []
+    for group in range(4):
+        group_obs = obs[groups == group]
+        group_obs = group_obs[torch.randperm(len(group_obs))[:BATCH_SIZE]]
+        rows.append(run_bench(net, group_obs, f"density Q{group + 1}"))
+    mixed_obs = obs[torch.randperm(len(obs))[:BATCH_SIZE]]
+    rows.append(run_bench(net, mixed_obs, "mixed"))
+
+    print(pd.DataFrame(rows).to_string(index=False))
@@ -0,0 +1,97 @@
+"""CPU inference throughput of a trained policy in float32 and with its
+linear layers dynamically quantized to int8.
+
+Observations of the controlled agents are collected on the CPU while stepping
+DATA_FOLDER scenes with the float policy. For a range of batch sizes, reports
+the agents per second of `policy._predict` for both policies and the fraction
+of observations on which they select the same action.
+"""
+
+import time
+
+import pandas as pd
+import torch
+
+from algorithms.sb3.ppo.ippo import IPPO
+from pygpudrive.agents.policy_actor import action_agreement, quantize_policy
+from pygpudrive.env.config import EnvConfig, SceneConfig
+from pygpudrive.env.env_torch import GPUDriveTorchEnv
+
+MAX_CONT_AGENTS = 128
+NUM_STEPS = 80
+NUM_REPEATS = 20
+WARMUP = 3
+
+
+@torch.no_grad()
+def collect_observations(env, policy, num_steps):
+    """Observations of the controlled agents when acting with `policy`."""
+    obs = env.reset()
+    observations = []
+    actions = torch.zeros(env.num_worlds, env.max_agent_count)
+    for _ in range(num_steps):
+        controlled_obs = obs[env.cont_agent_mask]
+        observations.append(controlled_obs)
+        actions[env.cont_agent_mask] = policy._predict(
+            controlled_obs, deterministic=True
+        ).float()
+        env.step_dynamics(actions)
+        obs = env.get_obs()
+    return torch.cat(observations)
+
+
+@torch.no_grad()
+def agents_per_second(policy, obs):
+    for _ in range(WARMUP):
+        policy._predict(obs, deterministic=True)
+    start = time.perf_counter()
+    for _ in range(NUM_REPEATS):
+        policy._predict(obs, deterministic=True)
+    return len(obs) * NUM_REPEATS / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+
+    DATA_FOLDER = "data/processed/examples"
+    TRAINED_POLICY_PATH = "models/learned_sb3_policy.zip"
+    NUM_WORLDS = 50
+    BATCH_SIZES = [1, 64, 1024, 8192]
+    NUM_THREADS = [1, torch.get_num_threads()]
+
+    env = GPUDriveTorchEnv(
+        config=EnvConfig(),
+        scene_config=SceneConfig(path=DATA_FOLDER, num_scenes=NUM_WORLDS),
+        max_cont_agents=MAX_CONT_AGENTS,
+        device="cpu",
+    )
+    policy = IPPO.load(path=TRAINED_POLICY_PATH, device="cpu").policy
+    policy.set_training_mode(False)
+    quantized = quantize_policy(policy)
+
+    obs = collect_observations(env, policy, NUM_STEPS)
+    env.close()
+    obs = obs[torch.randperm(len(obs))]
+
+    rows = []
+    for num_threads in NUM_THREADS:
+        torch.set_num_threads(num_threads)
+        for batch_size in BATCH_SIZES:
+            batch = obs[:batch_size]
+            float_sps = agents_per_second(policy, batch)
+            int8_sps = agents_per_second(quantized, batch)
+            rows.append(
+                {
+                    "num_threads": num_threads,
+                    "batch_size": len(batch),
+                    "float32 (agents/s)": float_sps,
+                    "int8 (agents/s)": int8_sps,
+                    "speedup": int8_sps / float_sps,
+                }
+            )
+
+    df = pd.DataFrame(rows)
+    print(df.to_string(index=False))
+    print(
+        f"Action agreement on {len(obs):,} observations: "
+        f"{action_agreement(policy, quantized, obs):.2%}"
+    )
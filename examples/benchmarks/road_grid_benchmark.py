@@ -0,0 +1,129 @@
+"""Compare step time with and without the per-world road grid.
+
+The densest scenes (by number of road points) are selected from DATA_FOLDER
+and simulated with both road observation algorithms, once scanning every road
+and once querying the spatial grid.
+"""
+
+import json
+import os
+import time
+from multiprocessing import Process, Queue
+
+import pandas as pd
+import torch
+
+import gpudrive
+
+MAX_CONT_AGENTS = 128
+EPISODE_LENGTH = 80
+WARMUP_STEPS = 10
+
+ROAD_OBS_ALGORITHMS = {
+    "linear": gpudrive.FindRoadObservationsWith.AllEntitiesWithRadiusFiltering,
+    "k_nearest_roadpoints": gpudrive.FindRoadObservationsWith.KNearestEntitiesWithRadiusFiltering,
+}
+
+
+def count_road_points(scene_path):
+    """Number of road points in a scene json."""
+    with open(scene_path) as f:
+        scene = json.load(f)
+    return sum(len(road["geometry"]) for road in scene["roads"])
+
+
+def densest_scenes(data_folder, num_scenes):
+    """Return the `num_scenes` scenes with the most road points."""
+    scenes = [
+        os.path.join(data_folder, scene)
+        for scene in os.listdir(data_folder)
+        if scene.endswith(".json")
+    ]
+    scenes.sort(key=count_road_points, reverse=True)
+    return scenes[:num_scenes]
+
+
+def make_sim(scenes, device, road_obs_algorithm, enable_road_grid):
+    """Make the gpudrive simulator."""
+    reward_params = gpudrive.RewardParams()
+    reward_params.rewardType = gpudrive.RewardType.OnGoalAchieved
+    reward_params.distanceToGoalThreshold = 1.0
+    reward_params.distanceToExpertThreshold = 1.0
+
+    params = gpudrive.Parameters()
+    params.polylineReductionThreshold = 0.5
+    params.observationRadius = 100.0
+    params.collisionBehaviour = gpudrive.CollisionBehaviour.Ignore
+    params.rewardParams = reward_params
+    params.maxNumControlledAgents = MAX_CONT_AGENTS
+    params.roadObservationAlgorithm = ROAD_OBS_ALGORITHMS[road_obs_algorithm]
+    params.enableRoadGrid = enable_road_grid
+
+    return gpudrive.SimManager(
+        exec_mode=gpudrive.madrona.ExecMode.CPU
+        if device == "cpu"
+        else gpudrive.madrona.ExecMode.CUDA,
+        gpu_id=0,
+        scenes=scenes,
+        params=params,
+    )
+
+
+def run_bench(scenes, device, road_obs_algorithm, enable_road_grid, q):
+    sim = make_sim(scenes, device, road_obs_algorithm, enable_road_grid)
+    sim.reset(list(range(len(scenes))))
+
+    for _ in range(WARMUP_STEPS):
+        sim.step()
+
+    actions = torch.zeros_like(sim.action_tensor().to_torch())
+    total_step_time = 0.0
+    for _ in range(EPISODE_LENGTH):
+        start = time.perf_counter()
+        sim.action_tensor().to_torch().copy_(actions)
+        sim.step()
+        sim.agent_roadmap_tensor().to_torch()
+        if device == "cuda":
+            torch.cuda.synchronize()
+        total_step_time += time.perf_counter() - start
+
+    q.put(total_step_time / EPISODE_LENGTH)
+
+
+def run_in_process(*args):
+    # Fresh process per configuration so that simulators do not share state
+    q = Queue()
+    p = Process(target=run_bench, args=(*args, q))
+    p.start()
+    p.join()
+    return q.get()
+
+
+if __name__ == "__main__":
+
+    DATA_FOLDER = "data/processed/examples"
+    NUM_SCENES = 3
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+    scenes = densest_scenes(DATA_FOLDER, NUM_SCENES)
+
+    rows = []
+    for road_obs_algorithm in ROAD_OBS_ALGORITHMS:
+        step_times = {
+            enable_road_grid: run_in_process(
+                scenes, DEVICE, road_obs_algorithm, enable_road_grid
+            )
+            for enable_road_grid in (False, True)
+        }
+        rows.append(
+            {
+                "road_obs_algorithm": road_obs_algorithm,
+                "device": DEVICE,
+                "num_worlds": len(scenes),
+                "scan_step_time (ms)": step_times[False] * 1000,
+                "grid_step_time (ms)": step_times[True] * 1000,
+                "speedup": step_times[False] / step_times[True],
+            }
+        )
+
+    print(pd.DataFrame(rows).to_string(index=False))
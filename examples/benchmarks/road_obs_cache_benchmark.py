@@ -0,0 +1,133 @@
+"""Speed and accuracy of cached road observations.
+
+For a range of cache distances the simulator is stepped once without and
+once with the road observation cache. Reports the mean step time and the
+recall of the uncached road observations (fraction of them that are also
+present in the cached observations, matched by road id and position), which
+should be 1 since the cache selects among candidates that cover the radius.
+"""
+
+import time
+from multiprocessing import Process, Queue
+
+import pandas as pd
+import torch
+
+import gpudrive
+
+from road_grid_benchmark import densest_scenes
+
+MAX_CONT_AGENTS = 128
+EPISODE_LENGTH = 80
+OBS_RADIUS = 50.0
+POSITION_DECIMALS = 2
+
+
+def make_sim(scenes, device, cache_distance):
+    """Make the gpudrive simulator."""
+    reward_params = gpudrive.RewardParams()
+    reward_params.rewardType = gpudrive.RewardType.OnGoalAchieved
+    reward_params.distanceToGoalThreshold = 1.0
+    reward_params.distanceToExpertThreshold = 1.0
+
+    params = gpudrive.Parameters()
+    params.polylineReductionThreshold = 0.5
+    params.observationRadius = OBS_RADIUS
+    params.collisionBehaviour = gpudrive.CollisionBehaviour.Ignore
+    params.rewardParams = reward_params
+    params.maxNumControlledAgents = MAX_CONT_AGENTS
+    params.roadObservationAlgorithm = (
+        gpudrive.FindRoadObservationsWith.AllEntitiesWithRadiusFiltering
+    )
+    params.roadObservationCacheDistance = cache_distance
+
+    return gpudrive.SimManager(
+        exec_mode=gpudrive.madrona.ExecMode.CPU
+        if device == "cpu"
+        else gpudrive.madrona.ExecMode.CUDA,
+        gpu_id=0,
+        scenes=scenes,
+        params=params,
+    )
+
+
+def road_obs_keys(road_obs):
+    """Set of (world, agent, id, x, y) keys of all valid road observations."""
+    valid = road_obs[..., 6] != float(gpudrive.EntityType._None)
+    world_idx, agent_idx, _ = torch.nonzero(valid, as_tuple=True)
+    rows = road_obs[valid]
+    xy = torch.round(rows[:, :2], decimals=POSITION_DECIMALS)
+    keys = torch.stack(
+        [world_idx.float(), agent_idx.float(), rows[:, 7], xy[:, 0], xy[:, 1]],
+        dim=1,
+    )
+    return set(map(tuple, keys.cpu().tolist()))
+
+
+def run_bench(scenes, device, cache_distance, q):
+    reference = make_sim(scenes, device, cache_distance=0.0)
+    sim = make_sim(scenes, device, cache_distance=cache_distance)
+    for s in (reference, sim):
+        s.reset(list(range(len(scenes))))
+
+    # Random but identical actions for both simulators
+    torch.manual_seed(0)
+    actions = torch.randint(
+        0, 9, size=sim.action_tensor().to_torch().shape, dtype=torch.float32
+    )
+
+    total_step_time = 0.0
+    matched, total = 0, 0
+    for _ in range(EPISODE_LENGTH):
+        reference.action_tensor().to_torch().copy_(actions)
+        reference.step()
+
+        start = time.perf_counter()
+        sim.action_tensor().to_torch().copy_(actions)
+        sim.step()
+        road_obs = sim.agent_roadmap_tensor().to_torch()
+        if device == "cuda":
+            torch.cuda.synchronize()
+        total_step_time += time.perf_counter() - start
+
+        expected = road_obs_keys(reference.agent_roadmap_tensor().to_torch())
+        matched += len(expected & road_obs_keys(road_obs))
+        total += len(expected)
+
+    q.put((total_step_time / EPISODE_LENGTH, matched / max(total, 1)))
+
+
+def run_in_process(*args):
+    # Fresh process per configuration so that simulators do not share state
+    q = Queue()
+    p = Process(target=run_bench, args=(*args, q))
+    p.start()
+    p.join()
+    return q.get()
+
+
+if __name__ == "__main__":
+
+    DATA_FOLDER = "data/processed/examples"
+    NUM_SCENES = 3
+    CACHE_DISTANCES = [0.0, 0.5, 1.0, 2.0, 5.0]
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+    scenes = densest_scenes(DATA_FOLDER, NUM_SCENES)
+
+    rows = []
+    for cache_distance in CACHE_DISTANCES:
+        step_time, recall = run_in_process(scenes, DEVICE, cache_distance)
+        rows.append(
+            {
+                "cache_distance (m)": cache_distance,
+                "device": DEVICE,
+                "num_worlds": len(scenes),
+                "step_time (ms)": step_time * 1000,
+                "road_obs_recall": recall,
+            }
+        )
+
+    df = pd.DataFrame(rows)
+    df["speedup"] = df["step_time (ms)"].iloc[0] / df["step_time (ms)"]
+    print(df.to_string(index=False))
@@ -0,0 +1,108 @@
+"""Rollout inference and training step time of LateFusionPolicy with separate
+and with shared actor and critic entity encoders.
+
+Rollout inference is one policy forward (actions, values and log probs) over
+the observations of all agents, without gradients. A training step is one
+PPO minibatch update: evaluate the actions, backpropagate a surrogate loss
+and step the optimizer.
+"""
+
+import dataclasses
+import time
+
+import gymnasium as gym
+import numpy as np
+import pandas as pd
+import torch
+
+from baselines.ippo.config import ExperimentConfig
+from networks.perm_eq_late_fusion import LateFusionPolicy
+from pygpudrive.env import constants
+from pygpudrive.env.config import EnvConfig
+
+NUM_AGENTS = 4096
+MINIBATCH_SIZE = 4096
+NUM_ACTIONS = 91
+NUM_REPEATS = 20
+WARMUP = 3
+
+
+def make_policy(env_config, exp_config, obs_dim, device):
+    observation_space = gym.spaces.Box(
+        low=-np.inf, high=np.inf, shape=(obs_dim,), dtype=np.float32
+    )
+    return LateFusionPolicy(
+        observation_space=observation_space,
+        env_config=env_config,
+        exp_config=exp_config,
+        action_space=gym.spaces.Discrete(NUM_ACTIONS),
+        lr_schedule=lambda _: 3e-4,
+    ).to(device)
+
+
+def time_call(fn, device):
+    sync = torch.cuda.synchronize if device == "cuda" else (lambda: None)
+    for _ in range(WARMUP):
+        fn()
+    sync()
+    start = time.perf_counter()
+    for _ in range(NUM_REPEATS):
+        fn()
+    sync()
+    return (time.perf_counter() - start) / NUM_REPEATS
+
+
+def run_bench(policy, obs, actions, device):
+    @torch.no_grad()
+    def rollout_inference():
+        policy(obs[:NUM_AGENTS])
+
+    def training_step():
+        values, log_prob, entropy = policy.evaluate_actions(
+            obs[:MINIBATCH_SIZE], actions[:MINIBATCH_SIZE]
+        )
+        loss = -log_prob.mean() + 0.5 * values.pow(2).mean() - entropy.mean()
+        policy.optimizer.zero_grad()
+        loss.backward()
+        policy.optimizer.step()
+
+    return {
+        "num_parameters": sum(p.numel() for p in policy.parameters()),
+        "rollout_inference (ms)": time_call(rollout_inference, device) * 1000,
+        "training_step (ms)": time_call(training_step, device) * 1000,
+    }
+
+
+if __name__ == "__main__":
+
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+    env_config = EnvConfig()
+    obs_dim = (
+        constants.EGO_FEAT_DIM
+        + constants.PARTNER_FEAT_DIM * (env_config.max_num_agents_in_scene - 1)
+        + constants.ROAD_GRAPH_FEAT_DIM * env_config.roadgraph_top_k
+    )
+    num_samples = max(NUM_AGENTS, MINIBATCH_SIZE)
+    obs = torch.rand(num_samples, obs_dim, device=DEVICE)
+    actions = torch.randint(0, NUM_ACTIONS, (num_samples,), device=DEVICE)
+
+    rows = []
+    for shared_encoder in [False, True]:
+        exp_config = dataclasses.replace(
+            ExperimentConfig(), shared_encoder=shared_encoder
+        )
+        torch.manual_seed(0)
+        policy = make_policy(env_config, exp_config, obs_dim, DEVICE)
+        rows.append(
+            {
+                "layout": "shared" if shared_encoder else "separate",
+                "device": DEVICE,
+                **run_bench(policy, obs, actions, DEVICE),
+            }
+        )
+
+    df = pd.DataFrame(rows)
+    for column in ["rollout_inference (ms)", "training_step (ms)"]:
+        df[f"{column.split(' ')[0]}_speedup"] = df[column].iloc[0] / df[column]
+    print(df.to_string(index=False))
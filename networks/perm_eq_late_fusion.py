@@ -47,6 +47,12 @@ class LateFusionNet(nn.Module):
             nn.Tanh() if self.net_config.act_func == "tanh" else nn.ReLU()
         )
         self.dropout = self.net_config.dropout
+        # Only embed the partners and road points that are not padding
+        self.masked_encoders = getattr(
+            self.net_config, "masked_encoders", False
+        )
+        # Let the critic use the actor's entity encoders
+        self.shared_encoder = getattr(self.net_config, "shared_encoder", False)
 
         # Save output dimensions, used to create the action distribution & value
         self.latent_dim_pi = self.net_config.last_layer_dim_pi
@@ -80,9 +86,10 @@ class LateFusionNet(nn.Module):
         )
 
         # Value network
-        self.val_ego_state_net = copy.deepcopy(self.actor_ego_state_net)
-        self.val_ro_net = copy.deepcopy(self.actor_ro_net)
-        self.val_rg_net = copy.deepcopy(self.actor_rg_net)
+        if not self.shared_encoder:
+            self.val_ego_state_net = copy.deepcopy(self.actor_ego_state_net)
+            self.val_ro_net = copy.deepcopy(self.actor_ro_net)
+            self.val_rg_net = copy.deepcopy(self.actor_rg_net)
         self.val_out_net = self._build_out_network(
             input_dim=self.shared_net_input_dim,
             output_dim=self.latent_dim_vf,
@@ -134,60 +141,108 @@ class LateFusionNet(nn.Module):
             (torch.Tensor, torch.Tensor) latent_policy, latent_value of the specified network.
             If all layers are shared, then ``latent_policy == latent_value``
         """
+        if self.shared_encoder:
+            # Encode the observation once for both heads
+            embedding = self._actor_embedding(features)
+            return self.actor_out_net(embedding), self.val_out_net(embedding)
         return self.forward_actor(features), self.forward_critic(features)
 
     def forward_actor(self, features: torch.Tensor) -> torch.Tensor:
         """Forward step for the actor network."""
+        return self.actor_out_net(self._actor_embedding(features))
+
+    def forward_critic(self, features: torch.Tensor) -> torch.Tensor:
+        """Forward step for the value network."""
+        return self.val_out_net(self._critic_embedding(features))
+
+    def _actor_embedding(self, features: torch.Tensor) -> torch.Tensor:
+        return self._embed(
+            features,
+            self.actor_ego_state_net,
+            self.actor_ro_net,
+            self.actor_rg_net,
+        )
+
+    def _critic_embedding(self, features: torch.Tensor) -> torch.Tensor:
+        if self.shared_encoder:
+            return self._actor_embedding(features)
+        return self._embed(
+            features, self.val_ego_state_net, self.val_ro_net, self.val_rg_net
+        )
+
+    def _embed(
+        self,
+        features: torch.Tensor,
+        ego_state_net: nn.Module,
+        ro_net: nn.Module,
+        rg_net: nn.Module,
+    ) -> torch.Tensor:
+        """Embed the observation with the given encoders and concatenate the
+        ego state with the pooled partner and road graph embeddings."""
 
         # Unpack observation
         ego_state, road_objects, road_graph = self._unpack_obs(features)
 
         # Embed features
-        ego_state = self.actor_ego_state_net(ego_state)
-        road_objects = self.actor_ro_net(road_objects)
-        road_graph = self.actor_rg_net(road_graph)
+        ego_state = ego_state_net(ego_state)
+        road_objects = self._embed_and_pool(ro_net, road_objects, self.ro_max)
+        road_graph = self._embed_and_pool(rg_net, road_graph, self.rg_max)
 
-        # Max pooling across the object dimension
-        # (M, E) -> (1, E) (max pool across features)
-        road_objects = F.max_pool1d(
-            road_objects.permute(0, 2, 1), kernel_size=self.ro_max
-        ).squeeze(-1)
-        road_graph = F.max_pool1d(
-            road_graph.permute(0, 2, 1), kernel_size=self.rg_max
-        ).squeeze(-1)
+        # Concatenate processed ego state and observation
+        return torch.cat((ego_state, road_objects, road_graph), dim=1)
 
-        # Concatenate processed ego state and observation and pass through the output layer
-        out = self.actor_out_net(
-            torch.cat((ego_state, road_objects, road_graph), dim=1)
-        )
+    def _embed_and_pool(
+        self, net: nn.Module, entities: torch.Tensor, max_entities: int
+    ) -> torch.Tensor:
+        """Embed the entities and max pool across the object dimension.
 
-        return out
+        Args:
+            entities (torch.Tensor): tensor of shape (batch_size, max_entities, feature_dim)
+        Return:
+            torch.Tensor of shape (batch_size, embedding_dim)
+        """
+        if self.masked_encoders:
+            return self._embed_and_pool_valid(net, entities)
 
-    def forward_critic(self, features: torch.Tensor) -> torch.Tensor:
-        """Forward step for the value network."""
+        # (M, E) -> (1, E) (max pool across features)
+        embedded = net(entities)
+        return F.max_pool1d(
+            embedded.permute(0, 2, 1), kernel_size=max_entities
+        ).squeeze(-1)
 
-        ego_state, road_objects, road_graph = self._unpack_obs(features)
+    def _embed_and_pool_valid(
+        self, net: nn.Module, entities: torch.Tensor
+    ) -> torch.Tensor:
+        """Embed only the entities that are not padding.
 
-        # Embed features
-        ego_state = self.val_ego_state_net(ego_state)
-        road_objects = self.val_ro_net(road_objects)
-        road_graph = self.val_rg_net(road_graph)
+        Padding slots all hold the same features (zeros with the `None` type
+        one-hot set), so their embedding is computed once and added to the
+        max of every observation with padding, which leaves the output equal
+        to embedding every slot. Selecting the valid entities synchronizes
+        with the device.
+        """
+        padding_feats = entities.new_zeros(entities.shape[-1])
+        padding_feats[constants.ENTITY_CONT_FEAT_DIM] = 1
+        padding = (entities == padding_feats).all(dim=-1)
 
-        # Max pooling across the object dimension
-        # (M, E) -> (1, E) (max pool across features)
-        road_objects = F.max_pool1d(
-            road_objects.permute(0, 2, 1), kernel_size=self.ro_max
-        ).squeeze(-1)
-        road_graph = F.max_pool1d(
-            road_graph.permute(0, 2, 1), kernel_size=self.rg_max
-        ).squeeze(-1)
+        batch_idx, entity_idx = torch.nonzero(~padding, as_tuple=True)
+        valid_embedded = net(entities[batch_idx, entity_idx])
+        padding_embedded = net(padding_feats.unsqueeze(0))
 
-        # Concatenate processed ego state and observation and pass through the output layer
-        out = self.val_out_net(
-            torch.cat((ego_state, road_objects, road_graph), dim=1)
+        pooled = valid_embedded.new_full(
+            (entities.shape[0], valid_embedded.shape[-1]), -torch.inf
+        )
+        pooled = pooled.scatter_reduce(
+            0,
+            batch_idx.unsqueeze(-1).expand_as(valid_embedded),
+            valid_embedded,
+            reduce="amax",
+        )
+        return torch.where(
+            padding.any(dim=1, keepdim=True),
+            torch.maximum(pooled, padding_embedded),
+            pooled,
         )
-
-        return out
 
     def _unpack_obs(self, obs_flat):
         """
@@ -0,0 +1,129 @@
+"""Self-contained TorchScript artifacts of the actor path of trained policies.
+
+An exported policy maps flat observations to action logits, including the
+observation unpacking of the network, and is loaded with torch alone: neither
+stable-baselines3 nor the training code under `algorithms` is imported.
+
+Export a saved policy with:
+
+    python -m pygpudrive.agents.exported_policy models/policy.zip models/policy.pt
+"""
+import json
+from pathlib import Path
+
+import torch
+from torch import nn
+
+METADATA_FILE = "policy_metadata.json"
+
+
+class _ActorPath(nn.Module):
+    """Observations -> action logits of an SB3 actor-critic policy."""
+
+    def __init__(self, policy):
+        super().__init__()
+        self.features_extractor = policy.pi_features_extractor
+        self.mlp_extractor = policy.mlp_extractor
+        self.action_net = policy.action_net
+
+    def forward(self, obs: torch.Tensor) -> torch.Tensor:
+        features = self.features_extractor(obs.float())
+        return self.action_net(self.mlp_extractor.forward_actor(features))
+
+
+@torch.no_grad()
+def export_policy(policy, path):
+    """Trace the actor path of an SB3 policy and save it with its action
+    space to `path`.
+
+    Args:
+        policy: SB3 actor-critic policy with a Discrete or MultiDiscrete
+            action space and a flat observation space.
+        path (str): Path of the TorchScript artifact.
+    """
+    action_space = policy.action_space
+    action_space_type = type(action_space).__name__
+    if action_space_type == "Discrete":
+        nvec = [int(action_space.n)]
+    elif action_space_type == "MultiDiscrete":
+        nvec = [int(n) for n in action_space.nvec]
+    else:
+        raise ValueError(
+            f"Only Discrete and MultiDiscrete action spaces can be exported, "
+            f"got {action_space_type}."
+        )
+
+    # Traced on the CPU; the traced graph does not depend on the device
+    actor = _ActorPath(policy).cpu().eval()
+    obs_dim = int(policy.observation_space.shape[0])
+    traced = torch.jit.trace(actor, torch.rand(2, obs_dim))
+
+    metadata = {
+        "action_space": action_space_type,
+        "nvec": nvec,
+        "obs_dim": obs_dim,
+    }
+    torch.jit.save(
+        traced, str(path), _extra_files={METADATA_FILE: json.dumps(metadata)}
+    )
+
+
+class ExportedPolicy:
+    """Policy loaded from an artifact written by `export_policy`.
+
+    Provides the `_predict` interface of SB3 policies, so it can stand in for
+    them in `PolicyActor`.
+
+    Args:
+        path (str): Path of the TorchScript artifact.
+        device (str): Device to run the policy on.
+    """
+
+    def __init__(self, path, device="cpu"):
+        if not Path(path).is_file():
+            raise FileNotFoundError(f"File not found: {path}")
+        extra_files = {METADATA_FILE: ""}
+        self.actor = torch.jit.load(
+            str(path), map_location=device, _extra_files=extra_files
+        ).eval()
+        metadata = json.loads(extra_files[METADATA_FILE])
+        self.multi_discrete = metadata["action_space"] == "MultiDiscrete"
+        self.nvec = metadata["nvec"]
+        self.obs_dim = metadata["obs_dim"]
+        self.device = device
+
+    @torch.no_grad()
+    def action_logits(self, obs: torch.Tensor) -> torch.Tensor:
+        """Concatenated logits of all action dimensions."""
+        return self.actor(obs.to(self.device))
+
+    @torch.no_grad()
+    def _predict(self, obs: torch.Tensor, deterministic: bool = True):
+        """Select actions, of shape (num_obs,) for Discrete and
+        (num_obs, num_action_dims) for MultiDiscrete action spaces."""
+        actions = [
+            logits.argmax(dim=1)
+            if deterministic
+            else torch.distributions.Categorical(logits=logits).sample()
+            for logits in torch.split(self.action_logits(obs), self.nvec, dim=1)
+        ]
+        if self.multi_discrete:
+            return torch.stack(actions, dim=1)
+        return actions[0]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from algorithms.sb3.ppo.ippo import IPPO
+
+    parser = argparse.ArgumentParser(
+        description="Export the actor of a saved IPPO policy to TorchScript."
+    )
+    parser.add_argument("saved_model_path", help="Saved SB3 policy (.zip)")
+    parser.add_argument("export_path", help="TorchScript artifact (.pt)")
+    args = parser.parse_args()
+
+    policy = IPPO.load(path=args.saved_model_path, device="cpu").policy
+    export_policy(policy, args.export_path)
+    print(f"Exported {args.saved_model_path} to {args.export_path}")
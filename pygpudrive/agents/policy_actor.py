@@ -1,20 +1,51 @@
+import copy
 import torch
 from pathlib import Path
-from algorithms.sb3.ppo.ippo import IPPO
+from pygpudrive.agents.exported_policy import ExportedPolicy
+
+
+def quantize_policy(policy):
+    """Return an inference-only copy of an SB3 policy whose linear layers are
+    dynamically quantized to int8. Runs on the CPU only."""
+    policy = copy.deepcopy(policy).cpu()
+    policy.set_training_mode(False)
+    return torch.ao.quantization.quantize_dynamic(
+        policy, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+@torch.no_grad()
+def action_agreement(policy, other_policy, obs, deterministic=True):
+    """Fraction of observations for which both policies select the same
+    deterministic action.
+
+    obs (torch.Tensor): Observation tensor of shape (num_samples, obs_dim).
+    """
+    actions = policy._predict(obs, deterministic=deterministic)
+    other_actions = other_policy._predict(obs, deterministic=deterministic)
+    agree = actions == other_actions
+    if agree.dim() > 1:  # MultiDiscrete actions
+        agree = agree.all(dim=-1)
+    return agree.float().mean().item()
 
 
 class PolicyActor:
     """Policy actor that selects actions based on a learned policy.
 
-    This class is compatible with policies trained with stable-baselines 3, such as PPO.
+    This class is compatible with policies trained with stable-baselines 3, such as PPO,
+    and with policies exported by `pygpudrive.agents.exported_policy` (`.pt` files), which
+    are loaded without importing stable-baselines 3.
 
     Args:
         is_controlled_func (torch.Tensor): Determines which agents are controlled by this actor (across worlds).
         valid_agent_mask (torch.Tensor): Mask that determines which agents are valid, and thus controllable, in the environment. Shape: (num_worlds, num_agents).
         saved_model_path (str): Path to the saved model.
-        model_class: Model class to use.
+        model_class: Model class to use, defaults to IPPO.
         deterministic (bool): Whether to use deterministic actions.
         device (str): Device to run the policy on.
+        quantize (bool): Run a dynamically int8-quantized copy of the policy,
+            for inference on the CPU only. The float policy is kept as
+            `float_policy` to check the quantized actions against.
     """
 
     def __init__(
@@ -22,15 +53,26 @@ class PolicyActor:
         is_controlled_func,
         valid_agent_mask,
         saved_model_path,
-        model_class=IPPO,
+        model_class=None,
         deterministic=True,
         device="cuda",
+        quantize=False,
     ):
+        if quantize and torch.device(device).type != "cpu":
+            raise ValueError(
+                f"Quantized policies run on the CPU only, got device={device}."
+            )
+        if quantize and Path(saved_model_path).suffix == ".pt":
+            raise ValueError("Exported policies cannot be quantized.")
         self.is_controlled_func = is_controlled_func
         self.device = device
         self.deterministic = deterministic
         self.model_class = model_class
         self.policy = self.load_model(saved_model_path)
+        self.float_policy = None
+        if quantize:
+            self.float_policy = self.policy
+            self.policy = quantize_policy(self.policy)
         self.valid_and_controlled_mask = self.get_valid_actor_mask(
             is_controlled_func, valid_agent_mask
         )
@@ -38,13 +80,24 @@ class PolicyActor:
             torch.where(self.valid_and_controlled_mask[world_idx, :])[0]
             for world_idx in range(valid_agent_mask.shape[0])
         ]
+        # Controlled agents across worlds, in the order of `actor_ids`
+        self.actor_world_idx, self.actor_agent_idx = torch.nonzero(
+            self.valid_and_controlled_mask, as_tuple=True
+        )
+        self.actor_counts = self.valid_and_controlled_mask.sum(dim=1).tolist()
 
     def load_model(self, saved_model_path):
         """Load a learned policy."""
         model_file = Path(saved_model_path)
         if not model_file.is_file():
             raise FileNotFoundError(f"File not found: {saved_model_path}")
+        elif model_file.suffix == ".pt":
+            policy = ExportedPolicy(saved_model_path, device=self.device)
         else:
+            if self.model_class is None:
+                from algorithms.sb3.ppo.ippo import IPPO
+
+                self.model_class = IPPO
             policy = self.model_class.load(
                 path=saved_model_path,
                 device=self.device,
@@ -55,30 +108,68 @@ class PolicyActor:
         """Use learned policy to select actions.
 
         obs (torch.Tensor): Observation tensor.
+
+        Returns a list with the actions of the agents in `actor_ids` for every
+        world. The list is a view of a single batched forward pass, kept for
+        compatibility; prefer `select_action_tensor`.
         """
+        return list(torch.split(self._predict_actors(obs), self.actor_counts))
+
+    def select_action_tensor(self, obs):
+        """Use learned policy to select actions.
+
+        obs (torch.Tensor): Observation tensor.
+
+        Returns a tensor of shape (num_worlds, max_agents, ...) with the
+        actions of the agents controlled by this actor and zeros elsewhere.
+        """
+        actions = self._predict_actors(obs)
+        action_tensor = actions.new_zeros(
+            (*self.valid_and_controlled_mask.shape, *actions.shape[1:])
+        )
+        action_tensor[self.actor_world_idx, self.actor_agent_idx] = actions
+        return action_tensor
+
+    def _predict_actors(self, obs):
+        """Actions of all controlled agents across worlds in one forward pass."""
 
         assert (
             obs.dim() == 3
         ), f"Expected obs to be of shape (num_worlds, max_agents, obs_dim), but got {obs.dim()}."
 
-        action_lists = []
-        for world_idx in range(len(self.actor_ids)):
-            observations = obs[world_idx, self.actor_ids[world_idx], :]
-            if (
-                len(observations) == 0
-            ):  # Append empty tensor if no agents in this world are controlled
-                actions = torch.tensor([]).to(self.device)
-            else:
-                actions = self.policy._predict(
-                    obs[world_idx, self.actor_ids[world_idx], :],
-                    deterministic=self.deterministic,
-                )
-            action_lists.append(actions)
-
-        return action_lists
+        observations = obs[self.actor_world_idx, self.actor_agent_idx]
+        if len(observations) == 0:  # No agents are controlled by this actor
+            return torch.zeros(0, dtype=torch.long, device=self.device)
+        return self.policy._predict(
+            observations, deterministic=self.deterministic
+        )
+
+    def check_quantization(self, obs, min_agreement=0.99):
+        """Check that the quantized policy selects the same deterministic
+        actions as the float policy for at least a `min_agreement` fraction
+        of `obs`.
+
+        obs (torch.Tensor): Observation tensor of shape (num_samples, obs_dim).
+
+        Returns the action agreement.
+        """
+        if self.float_policy is None:
+            raise ValueError("The policy actor was not created with quantize.")
+        # Sampled actions would disagree by chance
+        agreement = action_agreement(
+            self.float_policy, self.policy, obs, deterministic=True
+        )
+        if agreement < min_agreement:
+            raise ValueError(
+                f"Quantized policy agrees with the float policy on "
+                f"{agreement:.2%} of the actions, expected at least "
+                f"{min_agreement:.2%}."
+            )
+        return agreement
 
     def get_distribution(self, obs):
-        """Get policy distribution for given observation."""
+        """Get policy distribution for given observation. Not available for
+        exported policies."""
         return self.policy.get_distribution(obs)
 
     def evaluate_actions(self, obs, actions):
@@ -58,11 +58,17 @@ class GPUDriveGymEnv(gym.Env, metaclass=abc.ABCMeta):
         """
         reward_params = gpudrive.RewardParams()
 
-        if (
-            self.config.reward_type == "sparse_on_goal_achieved"
-            or self.config.reward_type == "weighted_combination"
-        ):
+        if self.config.reward_type == "sparse_on_goal_achieved":
             reward_params.rewardType = gpudrive.RewardType.OnGoalAchieved
+        elif self.config.reward_type == "weighted_combination":
+            reward_params.rewardType = gpudrive.RewardType.WeightedCombination
+            reward_params.goalAchievedWeight = self.config.goal_achieved_weight
+            reward_params.collisionWeight = self.config.collision_weight
+            reward_params.offRoadWeight = self.config.off_road_weight
+            reward_params.progressWeight = self.config.progress_weight
+            reward_params.expertDistanceWeight = (
+                self.config.expert_distance_weight
+            )
         else:
             raise ValueError(f"Invalid reward type: {self.config.reward_type}")
 
@@ -81,6 +87,10 @@ class GPUDriveGymEnv(gym.Env, metaclass=abc.ABCMeta):
             object: Updated parameters object with road reduction settings.
         """
         params.observationRadius = self.config.obs_radius
+        params.enableRoadGrid = self.config.road_grid
+        params.roadObservationCacheDistance = (
+            self.config.road_obs_cache_distance
+        )
         if self.config.road_obs_algorithm == "k_nearest_roadpoints":
             params.roadObservationAlgorithm = (
                 gpudrive.FindRoadObservationsWith.KNearestEntitiesWithRadiusFiltering
@@ -129,6 +139,7 @@ class GPUDriveGymEnv(gym.Env, metaclass=abc.ABCMeta):
 
             else:
                 params.enableLidar = self.config.lidar_obs
+                params.enableLidarGrid = self.config.lidar_grid
                 params.disableClassicalObs = self.config.disable_classic_obs
         params = self._set_collision_behavior(params)
         params = self._set_road_reduction_params(params)
@@ -207,8 +218,11 @@ class GPUDriveGymEnv(gym.Env, metaclass=abc.ABCMeta):
         Raises:
             ValueError: If the specified action type is not supported.
         """
+        self.action_type = action_type
         if action_type == "discrete":
             self.action_space = self._set_discrete_action_space()
+        elif action_type == "multi_discrete":
+            self.action_space = self._set_multi_discrete_action_space()
         elif action_type == "continuous":
             self.action_space = self._set_continuous_action_space()
         else:
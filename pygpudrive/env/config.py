@@ -34,12 +34,18 @@ class EnvConfig:
     # and partner_obs are invalid. This makes the sim 2x faster
     disable_classic_obs: bool = False  # Disable classic observations 
     lidar_obs: bool = False  # Use LiDAR in observations
+    # Trace the road lidar rays through a static per-world grid instead of
+    # the physics BVH; only the agents are still checked every step
+    lidar_grid: bool = False
 
-    # Set the weights for the reward components
+    # Set the weights for the reward components (used by "weighted_combination")
     # R = a * collided + b * goal_achieved + c * off_road
+    #     + d * progress_to_goal - e * distance_to_expert
     collision_weight: float = 0.0
     goal_achieved_weight: float = 1.0
     off_road_weight: float = 0.0
+    progress_weight: float = 0.0  # Dense: meters closer to the goal than last step
+    expert_distance_weight: float = 0.0  # Dense: meters from the expert position
 
     # Road observation algorithm settings
     road_obs_algorithm: str = "linear"  # Algorithm for road observations
@@ -47,6 +53,14 @@ class EnvConfig:
     polyline_reduction_threshold: float = (
         1.0  # Threshold for polyline reduction
     )
+    # Query roads through a per-world uniform grid (built once per map load)
+    # instead of scanning every road segment for every agent
+    road_grid: bool = False
+    # Cache the roads within road_obs_cache_distance beyond the observation
+    # radius of each agent and select its road observations among them until
+    # it moves more than road_obs_cache_distance. The observations are the
+    # same as without the cache. 0.0 disables the cache
+    road_obs_cache_distance: float = 0.0
 
     # Dynamics model
     dynamics_model: str = (
@@ -136,6 +150,9 @@ class SceneConfig:
         k_unique_scenes (Optional[int]): Number of unique scenes if using
             K_UNIQUE_N discipline.
         seed (Optional[int]): Seed for random scene selection.
+        shard_index (int): Index of the shard of the dataset to select from.
+        num_shards (int): Number of disjoint shards the dataset is split
+            into, e.g. one per rank in distributed training.
     """
 
     path: str
@@ -143,6 +160,8 @@ class SceneConfig:
     discipline: SelectionDiscipline = SelectionDiscipline.PAD_N
     k_unique_scenes: Optional[int] = None
     seed: Optional[int] = None
+    shard_index: int = 0
+    num_shards: int = 1
 
 
 class RenderMode(Enum):
@@ -21,4 +21,6 @@ MAX_ROAD_SCALE = 100
 # Feature shape constants
 EGO_FEAT_DIM = 6
 PARTNER_FEAT_DIM = 10
-ROAD_GRAPH_FEAT_DIM = 13
\ No newline at end of file
+ROAD_GRAPH_FEAT_DIM = 13
+# Partner and road graph features that precede the one-hot entity type
+ENTITY_CONT_FEAT_DIM = 6
\ No newline at end of file
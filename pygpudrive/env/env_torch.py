@@ -1,6 +1,6 @@
 """Base Gym Environment that interfaces with the GPU Drive simulator."""
 
-from gymnasium.spaces import Box, Discrete, Tuple
+from gymnasium.spaces import Box, Discrete, MultiDiscrete, Tuple
 import numpy as np
 import torch
 import copy
@@ -10,6 +10,7 @@ from itertools import product
 
 from pygpudrive.env.config import EnvConfig, RenderConfig, SceneConfig
 from pygpudrive.env.base_env import GPUDriveGymEnv
+from pygpudrive.env.expert_trajectory import ExpertTrajectory
 from pygpudrive.env import constants
 
 
@@ -50,8 +51,10 @@ class GPUDriveTorchEnv(GPUDriveGymEnv):
             low=-np.inf, high=np.inf, shape=(self.get_obs().shape[-1],)
         )
         self._setup_action_space(action_type)
+        self._init_action_staging()
         self.info_dim = 5  # Number of info features
         self.episode_len = self.config.episode_len
+        self._build_expert_trajectory()
         # Rendering setup
         self.visualizer = self._setup_rendering()
 
@@ -72,37 +75,19 @@ class GPUDriveTorchEnv(GPUDriveGymEnv):
             .to(self.device)
         )
 
-    def get_rewards(
-        self, collision_weight=0, goal_achieved_weight=1.0, off_road_weight=0
-    ):
+    def get_rewards(self):
         """Obtain the rewards for the current step.
-        By default, the reward is a weighted combination of the following components:
+
+        The rewards are computed by the simulator. For the
+        "weighted_combination" reward type they are a weighted combination of
+        the following components, weighted as set in the config:
         - collision
         - goal_achieved
         - off_road
-
-        The importance of each component is determined by the weights.
+        - progress toward the goal
+        - distance to the expert trajectory
         """
-        if self.config.reward_type == "sparse_on_goal_achieved":
-            return self.sim.reward_tensor().to_torch().squeeze(dim=2)
-
-        elif self.config.reward_type == "weighted_combination":
-            # Return the weighted combination of the reward components
-            info_tensor = self.sim.info_tensor().to_torch()
-            off_road = info_tensor[:, :, 0].to(torch.float)
-
-            # True if the vehicle collided with another road object
-            # (i.e. a cyclist or pedestrian)
-            collided = info_tensor[:, :, 1:3].to(torch.float).sum(axis=2)
-            goal_achieved = info_tensor[:, :, 3].to(torch.float)
-
-            weighted_rewards = (
-                collision_weight * collided
-                + goal_achieved_weight * goal_achieved
-                + off_road_weight * off_road
-            )
-
-            return weighted_rewards
+        return self.sim.reward_tensor().to_torch().squeeze(dim=2)
 
     def step_dynamics(self, actions):
         if actions is not None:
@@ -110,67 +95,143 @@ class GPUDriveTorchEnv(GPUDriveGymEnv):
         self.sim.step()
 
     def _apply_actions(self, actions):
-        """Apply the actions to the simulator."""
+        """Apply the actions to the simulator.
 
-        if (
+        Args:
+            actions (torch.Tensor): Joint action indices of shape
+                (num_worlds, max_agent_count) or (num_worlds, max_agent_count, 1),
+                per-component action indices of shape
+                (num_worlds, max_agent_count, 3) for the multi-discrete action
+                space, or action values of shape
+                (num_worlds, max_agent_count, action_dim).
+
+        Decoding goes through preallocated buffers and writes into a cached
+        view of the simulator's action tensor, so no tensors are allocated
+        per step.
+        """
+        actions = self._stage_action_input(actions)
+
+        if self.action_type == "multi_discrete":
+            # Offset the component indices into the concatenated grids
+            indices = self._action_index_buffer
+            indices.copy_(actions.nan_to_num_(nan=0))
+            indices.add_(self._action_grid_offsets)
+            torch.index_select(
+                self._flat_action_grid,
+                0,
+                indices.view(-1),
+                out=self._action_value_buffer.view(-1),
+            )
+            self._sim_action_values.copy_(self._action_value_buffer)
+
+        elif (
             self.config.dynamics_model == "classic"
             or self.config.dynamics_model == "bicycle"
             or self.config.dynamics_model == "delta_local"
         ):
-            if actions.dim() == 2:  # (num_worlds, max_agent_count)
-                # Map action indices to action values if indices are provided
-                actions = (
-                    torch.nan_to_num(actions, nan=0).long().to(self.device)
+            if actions.dim() == 2 or (
+                actions.dim() == 3 and actions.shape[2] == 1
+            ):
+                # Map action indices to action values
+                indices = self._action_index_buffer
+                indices.copy_(actions.nan_to_num_(nan=0).view(indices.shape))
+                torch.index_select(
+                    self.action_keys_tensor,
+                    0,
+                    indices.view(-1),
+                    out=self._action_value_buffer.view(-1, 3),
                 )
-                action_value_tensor = self.action_keys_tensor[actions]
-
-            elif actions.dim() == 3:
-                if actions.shape[2] == 1:
-                    actions = actions.squeeze(dim=2).to(self.device)
-                    action_value_tensor = self.action_keys_tensor[actions]
-                elif (
-                    actions.shape[2] == 3
-                ):  # Assuming we are given the actual action values
-                    # (acceleration, steering, heading)
-                    action_value_tensor = actions.to(self.device)
+                self._sim_action_values.copy_(self._action_value_buffer)
+            elif actions.dim() == 3 and actions.shape[2] == 3:
+                # Assuming we are given the actual action values
+                # (acceleration, steering, heading) or (dx, dy, dyaw)
+                self._sim_action_values.copy_(actions)
             else:
                 raise ValueError(f"Invalid action shape: {actions.shape}")
 
         else:
-            action_value_tensor = actions.to(self.device)
-
-        # Feed the action values to gpudrive
-        self._copy_actions_to_simulator(action_value_tensor)
-
-    def _copy_actions_to_simulator(self, actions):
-        """Copy the provived actions to the simulator."""
-        if (
-            self.config.dynamics_model == "classic"
-            or self.config.dynamics_model == "bicycle"
-        ):
-            # Action space: (acceleration, steering, heading)
-            self.sim.action_tensor().to_torch()[:, :, :3].copy_(actions)
-        elif self.config.dynamics_model == "delta_local":
-            # Action space: (dx, dy, dyaw)
-            self.sim.action_tensor().to_torch()[:, :, :3].copy_(actions)
-        elif self.config.dynamics_model == "state":
             # Following the StateAction struct in types.hpp
             # Need to provide: (x, y, z, yaw, velocity x, vel y, vel z, ang_vel_x, ang_vel_y, ang_vel_z)
-            self.sim.action_tensor().to_torch()[:, :, :10].copy_(actions)
+            self._sim_action_values.copy_(actions)
+
+    def _init_action_staging(self):
+        """Preallocate the buffers used to feed actions to the simulator.
+
+        The simulator exports its action tensor once for the lifetime of the
+        manager, so a view of it is cached and written in place.
+        """
+        self._sim_actions = self.sim.action_tensor().to_torch()
+        if self.config.dynamics_model == "state":
+            num_action_values = 10
         else:
-            raise ValueError(
-                f"Invalid dynamics model: {self.config.dynamics_model}"
+            num_action_values = 3
+        self._sim_action_values = self._sim_actions[:, :, :num_action_values]
+
+        batch_shape = (self.num_worlds, self.max_agent_count)
+        self._action_value_buffer = torch.zeros(
+            (*batch_shape, num_action_values), device=self.device
+        )
+        if self.action_type == "multi_discrete":
+            batch_shape = (*batch_shape, len(self.action_grids))
+            self._flat_action_grid = torch.cat(self.action_grids)
+            self._action_grid_offsets = torch.tensor(
+                [0] + self.action_grid_sizes[:-1], device=self.device
+            ).cumsum(dim=0)
+        self._action_index_buffer = torch.zeros(
+            batch_shape, dtype=torch.long, device=self.device
+        )
+
+        # Input buffers are created per action shape on first use
+        self._action_input_buffers = {}
+        self._pinned_copy_done = (
+            torch.cuda.Event() if self._action_value_buffer.is_cuda else None
+        )
+
+    def _stage_action_input(self, actions):
+        """Copy the actions into a reusable float buffer on the device.
+
+        Actions coming from the host are copied to the GPU through a pinned
+        buffer, which lets the transfer run asynchronously.
+
+        Returns:
+            torch.Tensor: The staged actions. Owned by the environment and
+                overwritten on the next call.
+        """
+        shape = tuple(actions.shape)
+        if shape not in self._action_input_buffers:
+            device_buffer = torch.empty(
+                shape, dtype=torch.float32, device=self.device
+            )
+            pinned_buffer = (
+                torch.empty(shape, dtype=torch.float32, pin_memory=True)
+                if device_buffer.is_cuda
+                else None
             )
+            self._action_input_buffers[shape] = (device_buffer, pinned_buffer)
+        device_buffer, pinned_buffer = self._action_input_buffers[shape]
+
+        if pinned_buffer is not None and not actions.is_cuda:
+            # Do not overwrite the pinned buffer while it is still being read
+            self._pinned_copy_done.synchronize()
+            pinned_buffer.copy_(actions)
+            device_buffer.copy_(pinned_buffer, non_blocking=True)
+            self._pinned_copy_done.record()
+        else:
+            device_buffer.copy_(actions)
+        return device_buffer
 
-    def _set_discrete_action_space(self) -> None:
-        """Configure the discrete action space based on dynamics model."""
-        products = None
+    def _init_action_grids(self):
+        """Move the action grids of the dynamics model to the device.
 
+        Returns:
+            list or None: Per-component action grids, in the order of the
+                joint action space, or None for the state dynamics model.
+        """
         if self.config.dynamics_model == "delta_local":
             self.dx = self.config.dx.to(self.device)
             self.dy = self.config.dy.to(self.device)
             self.dyaw = self.config.dyaw.to(self.device)
-            products = product(self.dx, self.dy, self.dyaw)
+            return [self.dx, self.dy, self.dyaw]
         elif (
             self.config.dynamics_model == "classic"
             or self.config.dynamics_model == "bicycle"
@@ -178,21 +239,28 @@ class GPUDriveTorchEnv(GPUDriveGymEnv):
             self.steer_actions = self.config.steer_actions.to(self.device)
             self.accel_actions = self.config.accel_actions.to(self.device)
             self.head_actions = self.config.head_tilt_actions.to(self.device)
-            products = product(
-                self.accel_actions, self.steer_actions, self.head_actions
-            )
+            return [
+                self.accel_actions,
+                self.steer_actions,
+                self.head_actions,
+            ]
         elif self.config.dynamics_model == "state":
             self.x = self.config.x.to(self.device)
             self.y = self.config.y.to(self.device)
             self.yaw = self.config.yaw.to(self.device)
             self.vx = self.config.vx.to(self.device)
             self.vy = self.config.vy.to(self.device)
-
+            return None
         else:
             raise ValueError(
                 f"Invalid dynamics model: {self.config.dynamics_model}"
             )
 
+    def _set_discrete_action_space(self) -> None:
+        """Configure the discrete action space based on dynamics model."""
+        action_grids = self._init_action_grids()
+        products = product(*action_grids) if action_grids is not None else None
+
         # Create a mapping from action indices to action values
         self.action_key_to_values = {}
         self.values_to_action_key = {}
@@ -218,16 +286,156 @@ class GPUDriveTorchEnv(GPUDriveGymEnv):
                 ]
             ).to(self.device)
 
+            self._set_action_grids(action_grids)
+
             return Discrete(n=int(len(self.action_key_to_values)))
         else:
             return Discrete(n=1)
 
+    def _set_multi_discrete_action_space(self) -> None:
+        """Configure a factorized action space with one discrete component
+        per action dimension (e.g. acceleration, steering, head tilt).
+
+        Unlike the joint discrete space, its size grows with the sum of the
+        grid sizes instead of their product.
+        """
+        action_grids = self._init_action_grids()
+        if action_grids is None:
+            raise ValueError(
+                f"Multi-discrete actions are not supported for dynamics_model: {self.config.dynamics_model}."
+            )
+        self._set_action_grids(action_grids)
+        return MultiDiscrete(self.action_grid_sizes)
+
+    def _set_action_grids(self, action_grids):
+        """Store the per-component action grids used to encode and decode
+        joint action indices.
+
+        The joint index enumerates the cartesian product of the grids in
+        order, i.e. it is a mixed-radix number whose last component varies
+        fastest (the same order as `action_key_to_values`).
+        """
+        self.action_grids = [grid.float() for grid in action_grids]
+        self.action_grid_sizes = [len(grid) for grid in action_grids]
+
+        # Snapping to the nearest grid value is a bucketize against the
+        # midpoints between the sorted grid values
+        self._sorted_action_grids = []
+        self._action_grid_midpoints = []
+        self._action_grid_sort_order = []
+        for grid in self.action_grids:
+            sorted_grid, sort_order = torch.sort(grid)
+            self._sorted_action_grids.append(sorted_grid)
+            self._action_grid_midpoints.append(
+                (sorted_grid[1:] + sorted_grid[:-1]) / 2
+            )
+            self._action_grid_sort_order.append(sort_order)
+
+    def encode_multi_discrete_actions(self, action_values):
+        """Map action values to per-component action indices.
+
+        Every component is snapped to the nearest value of its grid, so
+        continuous actions (e.g. expert actions) can be passed directly.
+
+        Args:
+            action_values (torch.Tensor): Action values of shape (..., 3),
+                ordered like the action grids.
+
+        Returns:
+            torch.Tensor: Component indices (long) of shape (..., 3).
+        """
+        if not hasattr(self, "action_grids"):
+            raise ValueError(
+                f"Discrete actions are not supported for dynamics_model: {self.config.dynamics_model}."
+            )
+
+        action_values = action_values.to(self.device).float()
+        component_indices = []
+        for dim, (midpoints, sort_order) in enumerate(
+            zip(self._action_grid_midpoints, self._action_grid_sort_order)
+        ):
+            if len(midpoints) == 0:  # Single value grid
+                component_indices.append(
+                    torch.zeros(
+                        action_values.shape[:-1],
+                        dtype=torch.long,
+                        device=self.device,
+                    )
+                )
+                continue
+            sorted_idx = torch.bucketize(
+                action_values[..., dim].contiguous(), midpoints
+            )
+            component_indices.append(sort_order[sorted_idx])
+        return torch.stack(component_indices, dim=-1)
+
+    def decode_multi_discrete_actions(self, component_indices):
+        """Map per-component action indices to action values.
+
+        Args:
+            component_indices (torch.Tensor): Indices of shape (..., 3).
+
+        Returns:
+            torch.Tensor: Action values of shape (..., 3).
+        """
+        component_indices = component_indices.to(self.device).long()
+        return torch.stack(
+            [
+                grid[component_indices[..., dim]]
+                for dim, grid in enumerate(self.action_grids)
+            ],
+            dim=-1,
+        )
+
+    def encode_actions(self, action_values):
+        """Map action values to joint discrete action indices.
+
+        Every component is snapped to the nearest value of its grid first, so
+        continuous actions (e.g. expert actions) can be passed directly.
+
+        Args:
+            action_values (torch.Tensor): Action values of shape (..., 3),
+                ordered like the action grids.
+
+        Returns:
+            torch.Tensor: Joint action indices (long) of shape (...).
+        """
+        component_indices = self.encode_multi_discrete_actions(action_values)
+        indices = torch.zeros_like(component_indices[..., 0])
+        for dim, size in enumerate(self.action_grid_sizes):
+            indices = indices * size + component_indices[..., dim]
+        return indices
+
+    def decode_actions(self, action_indices):
+        """Map joint discrete action indices to action values.
+
+        Args:
+            action_indices (torch.Tensor): Joint action indices of any shape.
+
+        Returns:
+            torch.Tensor: Action values of shape (*action_indices.shape, 3).
+        """
+        if not hasattr(self, "action_grids"):
+            raise ValueError(
+                f"Discrete actions are not supported for dynamics_model: {self.config.dynamics_model}."
+            )
+
+        remainder = action_indices.to(self.device).long()
+        components = []
+        for grid, size in zip(
+            reversed(self.action_grids), reversed(self.action_grid_sizes)
+        ):
+            components.append(grid[remainder % size])
+            remainder = remainder // size
+        return torch.stack(components[::-1], dim=-1)
+
     def _set_continuous_action_space(self) -> None:
         """Configure the continuous action space."""
         if self.config.dynamics_model == "delta_local":
             self.dx = self.config.dx.to(self.device)
             self.dy = self.config.dy.to(self.device)
             self.dyaw = self.config.dyaw.to(self.device)
+            self._set_action_grids([self.dx, self.dy, self.dyaw])
             action_1 = self.dx.clone().cpu().numpy()
             action_2 = self.dy.clone().cpu().numpy()
             action_3 = self.dyaw.clone().cpu().numpy()
@@ -235,6 +443,9 @@ class GPUDriveTorchEnv(GPUDriveGymEnv):
             self.steer_actions = self.config.steer_actions.to(self.device)
             self.accel_actions = self.config.accel_actions.to(self.device)
             self.head_actions = torch.tensor([0], device=self.device)
+            self._set_action_grids(
+                [self.accel_actions, self.steer_actions, self.head_actions]
+            )
             action_1 = self.steer_actions.clone().cpu().numpy()
             action_2 = self.accel_actions.clone().cpu().numpy()
             action_3 = self.head_actions.clone().cpu().numpy()
@@ -388,83 +599,44 @@ class GPUDriveTorchEnv(GPUDriveGymEnv):
 
         return state
 
-    def get_expert_actions(self, debug_world_idx=None, debug_veh_idx=None):
-        """Get expert actions for the full trajectories across worlds."""
-
-        expert_traj = self.sim.expert_trajectory_tensor().to_torch()
-
-        # Global positions
-        positions = expert_traj[:, :, : 2 * self.episode_len].view(
-            self.num_worlds, self.max_agent_count, self.episode_len, -1
+    def _build_expert_trajectory(self):
+        """Split the expert trajectories of the loaded scenes into typed fields."""
+        self.expert_trajectory = ExpertTrajectory.from_export(
+            self.sim.expert_trajectory_tensor().to_torch(),
+            dynamics_model=self.config.dynamics_model,
+            episode_len=self.episode_len,
         )
 
-        # Global velocity
-        velocity = expert_traj[
-            :, :, 2 * self.episode_len : 4 * self.episode_len
-        ].view(self.num_worlds, self.max_agent_count, self.episode_len, -1)
-
-        headings = expert_traj[
-            :, :, 4 * self.episode_len : 5 * self.episode_len
-        ].view(self.num_worlds, self.max_agent_count, self.episode_len, -1)
+    def reinit_scenarios(self, dataset):
+        """Resample the scenes and rebuild the expert trajectories."""
+        super().reinit_scenarios(dataset)
+        self._build_expert_trajectory()
 
-        inferred_expert_actions = expert_traj[
-            :, :, 6 * self.episode_len : 16 * self.episode_len
-        ].view(self.num_worlds, self.max_agent_count, self.episode_len, -1)
+    def get_expert_actions(self, debug_world_idx=None, debug_veh_idx=None):
+        """Get expert actions for the full trajectories across worlds.
 
-        if self.config.dynamics_model == "delta_local":
-            inferred_expert_actions = inferred_expert_actions[..., :3]
-            inferred_expert_actions[..., 0] = torch.clamp(
-                inferred_expert_actions[..., 0], -6, 6
-            )
-            inferred_expert_actions[..., 1] = torch.clamp(
-                inferred_expert_actions[..., 1], -6, 6
-            )
-            inferred_expert_actions[..., 2] = torch.clamp(
-                inferred_expert_actions[..., 2], -3.14, 3.14
-            )
-        elif self.config.dynamics_model == "state":
-            # Extract (x, y, yaw, velocity x, velocity y)
-            inferred_expert_actions = torch.cat(
-                (
-                    positions,  # xy
-                    torch.ones((*positions.shape[:-1], 1), device=self.device),
-                    headings,  # float (yaw)
-                    velocity,  # xy velocity
-                    torch.zeros(
-                        (*positions.shape[:-1], 4), device=self.device
-                    ),
-                ),
-                dim=-1,
-            )
+        The actions are cached per map load in `self.expert_trajectory` and
+        returned without copying, so they must not be modified in place.
+        """
+        expert_trajectory = self.expert_trajectory
 
-        else:  # classic or bicycle
-            inferred_expert_actions = inferred_expert_actions[..., :3]
-            inferred_expert_actions[..., 0] = torch.clamp(
-                inferred_expert_actions[..., 0], -6, 6
-            )
-            inferred_expert_actions[..., 1] = torch.clamp(
-                inferred_expert_actions[..., 1], -0.3, 0.3
-            )
         velo2speed = None
         debug_positions = None
         if debug_world_idx is not None and debug_veh_idx is not None:
             velo2speed = (
-                torch.norm(velocity[debug_world_idx, debug_veh_idx], dim=-1)
+                torch.norm(
+                    expert_trajectory.velocities[debug_world_idx, debug_veh_idx],
+                    dim=-1,
+                )
                 / constants.MAX_SPEED
             )
-            positions[..., 0] = self.normalize_tensor(
-                positions[..., 0],
-                constants.MIN_REL_GOAL_COORD,
-                constants.MAX_REL_GOAL_COORD,
-            )
-            positions[..., 1] = self.normalize_tensor(
-                positions[..., 1],
+            debug_positions = self.normalize_tensor(
+                expert_trajectory.positions[debug_world_idx, debug_veh_idx],
                 constants.MIN_REL_GOAL_COORD,
                 constants.MAX_REL_GOAL_COORD,
             )
-            debug_positions = positions[debug_world_idx, debug_veh_idx]
 
-        return inferred_expert_actions, velo2speed, debug_positions
+        return expert_trajectory.actions, velo2speed, debug_positions
 
     def normalize_and_flatten_partner_obs(self, obs):
         """Normalize partner state features.
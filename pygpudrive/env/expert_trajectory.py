@@ -0,0 +1,85 @@
+"""Structured view of the expert trajectories of the loaded scenes."""
+
+from dataclasses import dataclass
+
+import torch
+
+
+@dataclass
+class ExpertTrajectory:
+    """Expert trajectories of all agents, split into typed fields.
+
+    Every field is a contiguous tensor owned by this object (not a view of the
+    simulator's export buffer), indexed as (world, agent, time_step, ...).
+
+    Attributes:
+        positions (torch.Tensor): Global xy positions, shape (W, A, T, 2).
+        velocities (torch.Tensor): Global xy velocities, shape (W, A, T, 2).
+        yaws (torch.Tensor): Headings in radians, shape (W, A, T).
+        valids (torch.Tensor): Whether the expert state is valid, bool of
+            shape (W, A, T).
+        actions (torch.Tensor): Expert actions in the action space of the
+            dynamics model, shape (W, A, T, action_dim).
+    """
+
+    positions: torch.Tensor
+    velocities: torch.Tensor
+    yaws: torch.Tensor
+    valids: torch.Tensor
+    actions: torch.Tensor
+
+    @classmethod
+    def from_export(cls, expert_traj, dynamics_model, episode_len):
+        """Build the trajectories from the simulator's expert trajectory tensor.
+
+        Args:
+            expert_traj (torch.Tensor): Exported expert trajectories of shape
+                (W, A, 16 * episode_len): positions, velocities, headings,
+                valids and inferred actions, each stored time step major.
+            dynamics_model (str): Dynamics model the actions are built for.
+            episode_len (int): Number of time steps per trajectory.
+        """
+        num_worlds, max_agent_count = expert_traj.shape[:2]
+
+        def field(start, end):
+            return expert_traj[
+                :, :, start * episode_len : end * episode_len
+            ].reshape(num_worlds, max_agent_count, episode_len, -1)
+
+        positions = field(0, 2).clone()
+        velocities = field(2, 4).clone()
+        yaws = field(4, 5).squeeze(-1).clone()
+        valids = field(5, 6).squeeze(-1).bool()
+        inferred_actions = field(6, 16)
+
+        if dynamics_model == "delta_local":
+            actions = inferred_actions[..., :3].clone()
+            actions[..., 0].clamp_(-6, 6)
+            actions[..., 1].clamp_(-6, 6)
+            actions[..., 2].clamp_(-3.14, 3.14)
+        elif dynamics_model == "state":
+            # (x, y, z, yaw, velocity x, velocity y, 4 x zero)
+            actions = torch.cat(
+                (
+                    positions,
+                    torch.ones_like(positions[..., :1]),
+                    yaws.unsqueeze(-1),
+                    velocities,
+                    torch.zeros(
+                        (*positions.shape[:-1], 4), device=positions.device
+                    ),
+                ),
+                dim=-1,
+            )
+        else:  # classic or bicycle
+            actions = inferred_actions[..., :3].clone()
+            actions[..., 0].clamp_(-6, 6)
+            actions[..., 1].clamp_(-0.3, 0.3)
+
+        return cls(
+            positions=positions,
+            velocities=velocities,
+            yaws=yaws,
+            valids=valids,
+            actions=actions,
+        )
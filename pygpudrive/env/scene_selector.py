@@ -5,6 +5,20 @@ from math import ceil
 from pygpudrive.env.config import SelectionDiscipline
 
 
+def shard_scenes(scenes, shard_index, num_shards):
+    """Every num_shards-th scene, starting at shard_index."""
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(
+            f"shard_index must be in [0, {num_shards}), got {shard_index}."
+        )
+    shard = scenes[shard_index::num_shards]
+    if len(shard) == 0:
+        raise ValueError(
+            f"Cannot split {len(scenes)} scenes into {num_shards} shards."
+        )
+    return shard
+
+
 def select_scenes(config):
     assert os.path.exists(config.path) and os.listdir(
         config.path
@@ -23,6 +37,9 @@ def select_scenes(config):
             "The data directory does not contain any traffic scenes. Maybe you specified a path to the wrong folder?"
         )
 
+    # Only select from this shard, so that shards never share a scene
+    all_scenes = shard_scenes(all_scenes, config.shard_index, config.num_shards)
+
     def random_sample(k):
         seed = config.seed if config.seed is not None else 0x5CA1AB1E
         rand = random.Random(seed)
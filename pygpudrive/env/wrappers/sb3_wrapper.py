@@ -12,6 +12,7 @@ from stable_baselines3.common.vec_env.base_vec_env import (
 )
 
 from pygpudrive.env.env_torch import GPUDriveTorchEnv
+from pygpudrive.env.scene_selector import shard_scenes
 
 logging.basicConfig(level=logging.INFO)
 
@@ -38,21 +39,33 @@ class SB3MultiAgentEnv(VecEnv):
             scene_config=scene_config,
             max_cont_agents=max_cont_agents,
             device=device,
+            action_type=exp_config.action_type,
         )
         self.config = config
         self.exp_config = exp_config
-        self.all_scene_paths = [
-            os.path.join(self.exp_config.data_dir, scene)
-            for scene in sorted(os.listdir(self.exp_config.data_dir))
-            if scene.startswith("tfrecord")
-        ]
+        # Resample from the same shard of the dataset as the initial scenes
+        self.all_scene_paths = shard_scenes(
+            [
+                os.path.join(self.exp_config.data_dir, scene)
+                for scene in sorted(os.listdir(self.exp_config.data_dir))
+                if scene.startswith("tfrecord")
+            ],
+            scene_config.shard_index,
+            scene_config.num_shards,
+        )
         self.unique_scene_paths = list(set(self.all_scene_paths))
         self.num_worlds = self._env.num_worlds
         self.max_agent_count = self._env.max_agent_count
         self.num_envs = self._env.cont_agent_mask.sum().item()
         self.device = device
         self.controlled_agent_mask = self._env.cont_agent_mask.clone()
-        self.action_space = gym.spaces.Discrete(self._env.action_space.n)
+        self.controlled_agent_idx = self._flat_controlled_agent_idx()
+        if exp_config.action_type == "multi_discrete":
+            self.action_space = gym.spaces.MultiDiscrete(
+                self._env.action_space.nvec
+            )
+        else:
+            self.action_space = gym.spaces.Discrete(self._env.action_space.n)
         self.observation_space = gym.spaces.Box(
             -np.inf, np.inf, self._env.observation_space.shape, np.float32
         )
@@ -63,19 +76,9 @@ class SB3MultiAgentEnv(VecEnv):
             (self.num_worlds, self.max_agent_count)
         ).to(self.device)
         self.actions_tensor = torch.zeros(
-            (self.num_worlds, self.max_agent_count)
-        ).to(self.device)
-        # Storage: Fill buffer with nan values
-        self.buf_rews = torch.full(
-            (self.num_worlds, self.max_agent_count), fill_value=float("nan")
-        ).to(self.device)
-        self.buf_dones = torch.full(
-            (self.num_worlds, self.max_agent_count), fill_value=float("nan")
-        ).to(self.device)
-        self.buf_obs = torch.full(
-            (self.num_envs, self.obs_dim),
-            fill_value=float("nan"),
+            (self.num_worlds, self.max_agent_count, *self.action_space.shape)
         ).to(self.device)
+        self._allocate_step_buffers()
 
         self.num_episodes = 0
 
@@ -95,27 +98,33 @@ class SB3MultiAgentEnv(VecEnv):
         if world_idx is None:
             self._env.reset()
             obs = self._env.get_obs()
+            self._next_obs = obs
 
             # Make dead agent mask (True for dead or invalid agents)
             self.dead_agent_mask = ~self.controlled_agent_mask.clone()
 
             # Flatten over num_worlds and max_agent_count
-            obs = obs[self.controlled_agent_mask].reshape(
-                self.num_envs, self.obs_dim
+            obs = obs.view(-1, self.obs_dim).index_select(
+                0, self.controlled_agent_idx
             )
 
             return obs
         else:
             self._env.sim.reset(world_idx.item())
 
-    def step(self, actions) -> VecEnvStepReturn:
+    def step(self, actions, copy=False) -> VecEnvStepReturn:
         """
+        Args:
+        -----
+            actions (torch.Tensor): Actions of the controlled agents.
+            copy (bool): Return copies instead of views into the step buffers.
+
         Returns:
         --------
-            torch.Tensor (max_agent_count * num_worlds, obs_dim): Next obs.
-            torch.Tensor (max_agent_count * num_worlds): Rewards.
-            torch.Tensor (max_agent_count * num_worlds): Dones.
-            torch.Tensor (max_agent_count * num_worlds, info_dim): Info.
+            torch.Tensor (num_envs, obs_dim): Next obs.
+            torch.Tensor (num_envs): Rewards.
+            torch.Tensor (num_envs): Dones.
+            torch.Tensor (num_envs, info_dim): Info.
 
         Note:
         -------
@@ -123,75 +132,122 @@ class SB3MultiAgentEnv(VecEnv):
             To handle this, we return done is 1 at the first time step the
             agent is done. After that, we return nan for the rewards, infos
             and done for that agent until the end of the episode.
+
+            Unless `copy` is set, the returned tensors are views into two
+            sets of persistent buffers used in turn, so they stay valid until
+            the next but one call of `step`.
         """
 
         # Reset the info dict
         self.info_dict = {}
 
         # Unsqueeze action tensor to a shape the gpudrive env expects
-        self.actions_tensor[self.controlled_agent_mask] = actions
+        self.actions_tensor.view(-1, *self.action_space.shape).index_copy_(
+            0, self.controlled_agent_idx, actions.to(self.actions_tensor.dtype)
+        )
 
         # Step the environment
         self._env.step_dynamics(self.actions_tensor)
 
-        reward = self._env.get_rewards().clone()
-        done = self._env.get_dones().clone()
-        info = self._env.get_infos().clone()
+        reward = self._env.get_rewards()
+        done = self._env.get_dones()
+        info = self._env.get_infos()
+
+        # Gather the controlled agents before the done worlds are reset;
+        # agents that were dead before this step get nan placeholders
+        self._buffer_idx = 1 - self._buffer_idx
+        buf_obs, buf_rews, buf_dones, buf_infos = self._step_buffers[
+            self._buffer_idx
+        ]
+        dead = self.dead_agent_mask.view(-1).index_select(
+            0, self.controlled_agent_idx
+        )
+        torch.index_select(
+            reward.reshape(-1), 0, self.controlled_agent_idx, out=buf_rews
+        )
+        buf_rews.masked_fill_(dead, torch.nan)
+        torch.index_select(
+            done.reshape(-1), 0, self.controlled_agent_idx, out=buf_dones
+        )
+        buf_dones.masked_fill_(dead, torch.nan)
+        torch.index_select(
+            info.reshape(-1, self.info_dim),
+            0,
+            self.controlled_agent_idx,
+            out=buf_infos,
+        )
 
         # CHECK IF A WORLD IS DONE -> RESET
-        done_worlds = torch.where(
-            (done.nan_to_num(0) * self.controlled_agent_mask).sum(dim=1)
-            == self.controlled_agent_mask.sum(dim=1)
-        )[0]
+        # The simulator resets worlds by index from the host, so the done
+        # worlds are read back once per step
+        done_world_mask = (done.nan_to_num(0) * self.controlled_agent_mask).sum(
+            dim=1
+        ) == self.controlled_agent_mask.sum(dim=1)
+        done_worlds = torch.nonzero(done_world_mask.cpu()).flatten()
 
         if len(done_worlds) > 0:
             self._update_info_dict(info, done_worlds)
             self.num_episodes += len(done_worlds)
             self._env.sim.reset(done_worlds.tolist())
 
-        # Override nan placeholders for alive agents
-        self.buf_rews[self.dead_agent_mask] = torch.nan
-        self.buf_rews[~self.dead_agent_mask] = reward[~self.dead_agent_mask]
-        self.buf_dones[self.dead_agent_mask] = torch.nan
-        self.buf_dones[~self.dead_agent_mask] = done[~self.dead_agent_mask].to(
-            torch.float32
-        )
-
         # Store running total reward across worlds
         self.agent_step += 1
 
         # Update dead agent mask: Set to True if agent is done before
-        # the end of the episode
-        self.dead_agent_mask = torch.logical_or(self.dead_agent_mask, done)
-
-        # Now override the dead agent mask for the reset worlds
-        if len(done_worlds) > 0:
-            for world_idx in done_worlds:
-                self.dead_agent_mask[
-                    world_idx, :
-                ] = ~self.controlled_agent_mask[world_idx, :].clone()
-            self.agent_step[done_worlds] = 0
+        # the end of the episode, and reset it for the reset worlds
+        done_world_mask = done_world_mask.unsqueeze(dim=1)
+        self.dead_agent_mask.logical_or_(done.bool())
+        torch.where(
+            done_world_mask,
+            self._uncontrolled_agent_mask,
+            self.dead_agent_mask,
+            out=self.dead_agent_mask,
+        )
+        self.agent_step.masked_fill_(done_world_mask, 0)
 
         # Construct the next observation
-        next_obs = self._env.get_obs()
-        self.obs_alive = next_obs[~self.dead_agent_mask]
+        self._next_obs = self._env.get_obs()
+        torch.index_select(
+            self._next_obs.view(-1, self.obs_dim),
+            0,
+            self.controlled_agent_idx,
+            out=buf_obs,
+        )
 
         # RETURN NEXT_OBS, REWARD, DONE, INFO
+        outputs = (buf_obs, buf_rews, buf_dones, buf_infos)
+        if copy:
+            return tuple(output.clone() for output in outputs)
+        return outputs
+
+    @property
+    def obs_alive(self):
+        """Observations of the agents alive after the last step."""
+        return self._next_obs[~self.dead_agent_mask]
+
+    def obs_alive_extrema(self):
+        """Min and max of `obs_alive` as 0-d tensors, without the host-device
+        sync of boolean indexing."""
+        alive = ~self.dead_agent_mask.unsqueeze(-1)
         return (
-            next_obs[self.controlled_agent_mask]
-            .reshape(self.num_envs, self.obs_dim)
-            .clone(),
-            self.buf_rews[self.controlled_agent_mask]
-            .reshape(self.num_envs)
-            .clone(),
-            self.buf_dones[self.controlled_agent_mask]
-            .reshape(self.num_envs)
-            .clone(),
-            info[self.controlled_agent_mask]
-            .reshape(self.num_envs, self.info_dim)
-            .clone(),
+            torch.where(alive, self._next_obs, torch.inf).amin(),
+            torch.where(alive, self._next_obs, -torch.inf).amax(),
         )
 
+    def _allocate_step_buffers(self):
+        """Allocate the two sets of buffers `step` writes its outputs to."""
+        self._uncontrolled_agent_mask = ~self.controlled_agent_mask
+        self._step_buffers = [
+            (
+                torch.empty((self.num_envs, self.obs_dim), device=self.device),
+                torch.empty((self.num_envs,), device=self.device),
+                torch.empty((self.num_envs,), device=self.device),
+                torch.empty((self.num_envs, self.info_dim), device=self.device),
+            )
+            for _ in range(2)
+        ]
+        self._buffer_idx = 0
+
     def close(self) -> None:
         """Close the environment."""
         self._env.close()
@@ -245,38 +301,40 @@ class SB3MultiAgentEnv(VecEnv):
         self.max_agent_count = self._env.max_agent_count
         self.num_valid_controlled_agents_across_worlds = self._env.num_valid_controlled_agents_across_worlds
         self.num_envs = self.controlled_agent_mask.sum().item()
+        self.controlled_agent_idx = self._flat_controlled_agent_idx()
+        self._allocate_step_buffers()
 
-    def _update_info_dict(self, info, indices) -> None:
-        """Update the info logger."""
+    def _flat_controlled_agent_idx(self):
+        """Indices of the controlled agents in the flattened (world, agent) axis.
 
-        # Select info for controlled agents
-        controlled_agent_info = info[indices][
-            self.controlled_agent_mask[indices]
-        ]
+        Indexing with these instead of the boolean mask avoids a host-device
+        sync on every use.
+        """
+        return torch.nonzero(self.controlled_agent_mask.flatten()).flatten()
 
-        self.info_dict["off_road"] = controlled_agent_info[:, 0].sum().item()
-        self.info_dict["veh_collisions"] = (
-            controlled_agent_info[:, 1].sum().item()
-        )
-        self.info_dict["non_veh_collision"] = (
-            controlled_agent_info[:, 2].sum().item()
-        )
-        self.info_dict["goal_achieved"] = (
-            controlled_agent_info[:, 3].sum().item()
-        )
-        self.info_dict["num_controlled_agents"] = self.controlled_agent_mask[
-            indices
-        ].sum()
+    def _update_info_dict(self, info, indices) -> None:
+        """Update the info logger.
+
+        The values are 0-d tensors on the device, so that logging does not
+        synchronize with the device on every step.
+        """
+        # Sum the info of the controlled agents
+        controlled_agent_mask = self.controlled_agent_mask[indices]
+        info_sums = (
+            info[indices][..., :4] * controlled_agent_mask.unsqueeze(-1)
+        ).sum(dim=(0, 1))
+
+        self.info_dict["off_road"] = info_sums[0]
+        self.info_dict["veh_collisions"] = info_sums[1]
+        self.info_dict["non_veh_collision"] = info_sums[2]
+        self.info_dict["goal_achieved"] = info_sums[3]
+        self.info_dict["num_controlled_agents"] = controlled_agent_mask.sum()
 
         # Log the agents that are done but did not receive any reward
         self.info_dict["truncated"] = (
-            (
-                (self.agent_step[indices] == self.config.episode_len - 1)
-                * ~self.dead_agent_mask[indices]
-            )
-            .sum()
-            .item()
-        )
+            (self.agent_step[indices] == self.config.episode_len - 1)
+            * ~self.dead_agent_mask[indices]
+        ).sum()
 
     def get_attr(self, attr_name, indices=None):
         raise NotImplementedError()
@@ -30,14 +30,20 @@ namespace gpudrive
         nb::enum_<RewardType>(m, "RewardType")
             .value("DistanceBased", RewardType::DistanceBased)
             .value("OnGoalAchieved", RewardType::OnGoalAchieved)
-            .value("Dense", RewardType::Dense);
+            .value("Dense", RewardType::Dense)
+            .value("WeightedCombination", RewardType::WeightedCombination);
 
         // Define RewardParams class
         nb::class_<RewardParams>(m, "RewardParams")
             .def(nb::init<>()) // Default constructor
             .def_rw("rewardType", &RewardParams::rewardType)
             .def_rw("distanceToGoalThreshold", &RewardParams::distanceToGoalThreshold)
-            .def_rw("distanceToExpertThreshold", &RewardParams::distanceToExpertThreshold);
+            .def_rw("distanceToExpertThreshold", &RewardParams::distanceToExpertThreshold)
+            .def_rw("goalAchievedWeight", &RewardParams::goalAchievedWeight)
+            .def_rw("collisionWeight", &RewardParams::collisionWeight)
+            .def_rw("offRoadWeight", &RewardParams::offRoadWeight)
+            .def_rw("progressWeight", &RewardParams::progressWeight)
+            .def_rw("expertDistanceWeight", &RewardParams::expertDistanceWeight);
 
         nb::enum_<FindRoadObservationsWith>(m, "FindRoadObservationsWith")
             .value("KNearestEntitiesWithRadiusFiltering", FindRoadObservationsWith::KNearestEntitiesWithRadiusFiltering)
@@ -57,6 +63,9 @@ namespace gpudrive
             .def_rw("dynamicsModel", &Parameters::dynamicsModel)
             .def_rw("enableLidar", &Parameters::enableLidar)
             .def_rw("disableClassicalObs", &Parameters::disableClassicalObs)
+            .def_rw("enableRoadGrid", &Parameters::enableRoadGrid)
+            .def_rw("roadObservationCacheDistance", &Parameters::roadObservationCacheDistance)
+            .def_rw("enableLidarGrid", &Parameters::enableLidarGrid)
             .def_rw("isStaticAgentControlled", &Parameters::isStaticAgentControlled);
 
         // Define CollisionBehaviour enum
@@ -104,8 +113,12 @@ namespace gpudrive
                 nb::arg("enable_batch_renderer") = false,
                 nb::arg("batch_render_view_width") = 64,
                 nb::arg("batch_render_view_height") = 64)
-            .def("step", &Manager::step)
-            .def("reset", &Manager::reset)
+            // Release the GIL so Python threads can run while the
+            // simulator steps (e.g. training while collecting rollouts)
+            .def("step", &Manager::step,
+                 nb::call_guard<nb::gil_scoped_release>())
+            .def("reset", &Manager::reset,
+                 nb::call_guard<nb::gil_scoped_release>())
             .def("action_tensor", &Manager::actionTensor)
             .def("reward_tensor", &Manager::rewardTensor)
             .def("done_tensor", &Manager::doneTensor)
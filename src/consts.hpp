@@ -11,6 +11,24 @@ namespace consts {
 inline constexpr madrona::CountT kMaxAgentCount = 128;
 inline constexpr madrona::CountT kMaxRoadEntityCount = 6000;
 inline constexpr madrona::CountT kMaxAgentMapObservationsCount = 200;
+// Capacity of the per-agent candidate roads of the road observation cache.
+inline constexpr madrona::CountT kRoadObservationCacheCandidates =
+    2 * kMaxAgentMapObservationsCount;
+
+// Resolution of the per-world road grid (see src/road_grid.hpp). The grid
+// spans the bounding box of the road centers with kRoadGridDim cells per
+// axis, but cells are never smaller than kRoadGridMinCellSize meters.
+inline constexpr int32_t kRoadGridDim = 64;
+inline constexpr madrona::CountT kRoadGridCellCount = kRoadGridDim * kRoadGridDim;
+inline constexpr float kRoadGridMinCellSize = 2.f;
+
+// Resolution and capacity of the per-world lidar grid (see
+// src/lidar_grid.hpp). A road is stored once per cell it overlaps, so the
+// number of entries can exceed the number of roads.
+inline constexpr int32_t kLidarGridDim = 64;
+inline constexpr madrona::CountT kLidarGridCellCount = kLidarGridDim * kLidarGridDim;
+inline constexpr float kLidarGridMinCellSize = 2.f;
+inline constexpr madrona::CountT kLidarGridMaxEntries = 4 * kMaxRoadEntityCount;
 
 inline constexpr bool useEstimatedYaw = true;
 
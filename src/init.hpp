@@ -70,9 +70,10 @@ namespace gpudrive
 
     enum class RewardType : uint32_t
     {
-        DistanceBased,  // negative distance to goal
-        OnGoalAchieved, // 1 if on goal, 0 otherwise
-        Dense           // negative distance to expert trajectory
+        DistanceBased,      // negative distance to goal
+        OnGoalAchieved,     // 1 if on goal, 0 otherwise
+        Dense,              // negative distance to expert trajectory
+        WeightedCombination // weighted sum of the terms below
     };
 
     struct RewardParams
@@ -80,6 +81,12 @@ namespace gpudrive
         RewardType rewardType;
         float distanceToGoalThreshold;
         float distanceToExpertThreshold;
+        // Weights of the WeightedCombination reward
+        float goalAchievedWeight = 1.f;   // 1 if on goal, 0 otherwise
+        float collisionWeight = 0.f;      // 1 if collided with another agent
+        float offRoadWeight = 0.f;        // 1 if collided with a road edge
+        float progressWeight = 0.f;       // decrease of the distance to goal since the last step
+        float expertDistanceWeight = 0.f; // distance to the expert trajectory
     };
 
     enum class CollisionBehaviour : uint32_t
@@ -118,6 +125,9 @@ namespace gpudrive
         bool enableLidar = false;
         bool disableClassicalObs = false;
         DynamicsModel dynamicsModel = DynamicsModel::Classic;
+        bool enableRoadGrid = false; // Query roads through the per-world grid instead of scanning all of them
+        float roadObservationCacheDistance = 0.f; // Margin of the cached candidate roads; they are gathered again after moving this far (0 disables caching)
+        bool enableLidarGrid = false; // Trace road lidar rays through the static per-world lidar grid
     };
 
     struct WorldInit
@@ -1,6 +1,7 @@
 #pragma once
 
 #include "binary_heap.hpp"
+#include "road_grid.hpp"
 #include "types.hpp"
 #include <algorithm>
 #include <madrona/math.hpp>
@@ -157,4 +158,76 @@ void selectKNearestRoadEntities(Engine &ctx, const Rotation &referenceRotation,
   fillZeros(heap + newBeyond, heap + K);
 }
 
+// Adds `observation` to the max-heap of the K nearest observations seen so
+// far, which holds `heapSize` observations.
+template <madrona::CountT K>
+void offerKNearest(gpudrive::MapObservation *heap, madrona::CountT &heapSize,
+                   const gpudrive::MapObservation &observation) {
+  if (heapSize < K) {
+    heap[heapSize++] = observation;
+    if (heapSize == K) {
+      make_heap(heap, heap + K, cmp);
+    }
+    return;
+  }
+
+  if (not cmp(observation, heap[0])) {
+    return;
+  }
+
+  pop_heap(heap, heap + K, cmp);
+  heap[K - 1] = observation;
+  push_heap(heap, heap + K, cmp);
+}
+
+// The K nearest of the given roads that are within the observation radius.
+template <madrona::CountT K, typename ForEachRoad>
+void selectKNearestRoadEntitiesAmong(
+    Engine &ctx, const Rotation &referenceRotation,
+    const madrona::math::Vector2 &referencePosition,
+    ForEachRoad &&forEachRoad, gpudrive::MapObservation *heap) {
+  const Entity *roads = ctx.data().roads;
+  const float radius = ctx.data().params.observationRadius;
+
+  utils::ReferenceFrame referenceFrame(referencePosition, referenceRotation);
+
+  madrona::CountT heapSize = 0;
+  forEachRoad([&](int32_t roadIdx) {
+    const Entity road = roads[roadIdx];
+    const auto &roadPos = ctx.get<madrona::base::Position>(road);
+    if ((roadPos.xy() - referencePosition).length2() > radius * radius) {
+      return true;
+    }
+
+    offerKNearest<K>(heap, heapSize,
+                     referenceFrame.observationOf(
+                         roadPos, ctx.get<madrona::base::Rotation>(road),
+                         ctx.get<madrona::base::Scale>(road),
+                         ctx.get<gpudrive::EntityType>(road),
+                         static_cast<float>(ctx.get<RoadMapId>(road).id),
+                         ctx.get<MapType>(road)));
+    return true;
+  });
+
+  fillZeros(heap + heapSize, heap + K);
+}
+
+// Same selection as selectKNearestRoadEntities (the K nearest roads within
+// the observation radius), but only the roads in the grid cells around the
+// agent are considered.
+template <madrona::CountT K>
+void selectKNearestRoadEntitiesWithGrid(
+    Engine &ctx, const Rotation &referenceRotation,
+    const madrona::math::Vector2 &referencePosition,
+    gpudrive::MapObservation *heap) {
+  const float radius = ctx.data().params.observationRadius;
+  selectKNearestRoadEntitiesAmong<K>(
+      ctx, referenceRotation, referencePosition,
+      [&](auto &&fn) {
+        roadgrid::forEachRoadNear(ctx.data().roadGrid, referencePosition,
+                                  radius, fn);
+      },
+      heap);
+}
+
 } // namespace gpudrive
@@ -27,6 +27,7 @@ static inline void resetAgentInterface(Engine &ctx, Entity agent_iface, EntityTy
     ctx.get<Info>(agent_iface) = Info{};
     ctx.get<Info>(agent_iface).type = (int32_t)type;
     ctx.get<ResponseType>(agent_iface) = resp_type;
+    ctx.get<RoadObservationCache>(agent_iface).numCandidates = -1;
 }
 
 static inline void resetAgent(Engine &ctx, Entity agent) {
@@ -47,6 +48,7 @@ static inline void resetAgent(Engine &ctx, Entity agent) {
     ctx.get<Action>(agent_iface) = getZeroAction(ctx.data().params.dynamicsModel);
     
     resetAgentInterface(ctx, agent_iface, ctx.get<EntityType>(agent), ctx.get<ResponseType>(agent));
+    ctx.get<Progress>(agent).previousGoalDistance = -1.f;
 
 #ifndef GPUDRIVE_DISABLE_NARROW_PHASE
     ctx.get<CollisionDetectionEvent>(agent).hasCollided.store_release(0);
@@ -384,6 +386,18 @@ void createPersistentEntities(Engine &ctx) {
     }
     ctx.data().numRoads = roadIdx;
 
+    roadgrid::build(ctx.data().roadGrid, ctx.data().numRoads,
+                    [&](CountT idx) {
+                        return ctx.get<Position>(ctx.data().roads[idx]).xy();
+                    });
+    lidargrid::build(ctx.data().lidarGrid, ctx.data().numRoads,
+                     [&](CountT idx) {
+                         Entity road = ctx.data().roads[idx];
+                         return lidargrid::makeBox(ctx.get<Position>(road),
+                                                   ctx.get<Rotation>(road),
+                                                   ctx.get<Scale>(road));
+                     });
+
     auto &shape = ctx.singleton<Shape>();
     shape.agentEntityCount = ctx.data().numAgents;
     shape.roadEntityCount = ctx.data().numRoads;
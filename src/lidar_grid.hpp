@@ -0,0 +1,276 @@
+#pragma once
+
+#include <cmath>
+#include <madrona/math.hpp>
+#include <madrona/types.hpp>
+
+#include "consts.hpp"
+
+namespace gpudrive {
+
+// Static uniform grid over the road collision boxes of a world, used to trace
+// the road edge and road line lidar rays without going through the physics
+// BVH, which also contains the moving agents and is rebuilt every step.
+//
+// Every road is inserted into all the cells overlapped by the bounding box of
+// its collision box. Rays walk the cells they cross (2D DDA) and stop as soon
+// as the closest hit so far lies within the current cell.
+struct LidarGrid {
+    madrona::math::Vector2 origin;
+    float cellSize;
+    float invCellSize;
+    // Set if the roads overlap more cells than `roadIndices` can hold. The
+    // lidar then falls back to the BVH for this world.
+    int32_t overflow;
+    int32_t cellStart[consts::kLidarGridCellCount + 1];
+    int32_t roadIndices[consts::kLidarGridMaxEntries];
+};
+
+namespace lidargrid {
+
+// Collision box of a road. All road objects use the unit cube hull, so the box
+// is spanned by the entity's scale around its position.
+struct Box {
+    madrona::math::Vector2 center;
+    madrona::math::Vector2 axis; // Unit direction of the box's local x axis
+    float halfLength;
+    float halfWidth;
+    float zMin;
+    float zMax;
+};
+
+inline Box makeBox(const madrona::math::Vector3 &position,
+                   const madrona::math::Quat &rotation,
+                   const madrona::math::Diag3x3 &scale) {
+    return Box{
+        .center = position.xy(),
+        .axis = rotation.rotateVec({1.f, 0.f, 0.f}).xy(),
+        .halfLength = scale.d0,
+        .halfWidth = scale.d1,
+        .zMin = position.z - scale.d2,
+        .zMax = position.z + scale.d2,
+    };
+}
+
+// Distance along the horizontal ray `origin + t * dir` (at height `z`) to the
+// box, or -1 if the ray misses it. Rays starting inside a box do not hit it.
+inline float intersectBox(const Box &box, const madrona::math::Vector2 &origin,
+                          const madrona::math::Vector2 &dir, float z) {
+    if (z < box.zMin || z > box.zMax) {
+        return -1.f;
+    }
+
+    madrona::math::Vector2 rel = origin - box.center;
+    madrona::math::Vector2 perp{-box.axis.y, box.axis.x};
+
+    float localOrigin[2] = {rel.x * box.axis.x + rel.y * box.axis.y,
+                            rel.x * perp.x + rel.y * perp.y};
+    float localDir[2] = {dir.x * box.axis.x + dir.y * box.axis.y,
+                         dir.x * perp.x + dir.y * perp.y};
+    float halfExtents[2] = {box.halfLength, box.halfWidth};
+
+    float tEnter = -INFINITY;
+    float tExit = INFINITY;
+    for (int axis = 0; axis < 2; ++axis) {
+        if (fabsf(localDir[axis]) < 1e-8f) {
+            if (fabsf(localOrigin[axis]) > halfExtents[axis]) {
+                return -1.f;
+            }
+            continue;
+        }
+        float invDir = 1.f / localDir[axis];
+        float t1 = (-halfExtents[axis] - localOrigin[axis]) * invDir;
+        float t2 = (halfExtents[axis] - localOrigin[axis]) * invDir;
+        tEnter = fmaxf(tEnter, fminf(t1, t2));
+        tExit = fminf(tExit, fmaxf(t1, t2));
+    }
+
+    if (tEnter > tExit || tEnter < 0.f) {
+        return -1.f;
+    }
+    return tEnter;
+}
+
+inline int32_t clampedCell(float coord, float origin, float invCellSize) {
+    int32_t cell = (int32_t)floorf((coord - origin) * invCellSize);
+    return cell < 0 ? 0
+                    : (cell >= consts::kLidarGridDim ? consts::kLidarGridDim - 1
+                                                     : cell);
+}
+
+// Half extents of the axis aligned bounding box of `box`.
+inline madrona::math::Vector2 boundingExtent(const Box &box) {
+    return {
+        fabsf(box.axis.x) * box.halfLength + fabsf(box.axis.y) * box.halfWidth,
+        fabsf(box.axis.y) * box.halfLength + fabsf(box.axis.x) * box.halfWidth,
+    };
+}
+
+// Calls `fn(cellIdx)` for every cell overlapped by the bounding box of `box`.
+template <typename Fn>
+void forEachCellOf(const LidarGrid &grid, const Box &box, Fn &&fn) {
+    madrona::math::Vector2 extent = boundingExtent(box);
+
+    int32_t minX = clampedCell(box.center.x - extent.x, grid.origin.x,
+                               grid.invCellSize);
+    int32_t maxX = clampedCell(box.center.x + extent.x, grid.origin.x,
+                               grid.invCellSize);
+    int32_t minY = clampedCell(box.center.y - extent.y, grid.origin.y,
+                               grid.invCellSize);
+    int32_t maxY = clampedCell(box.center.y + extent.y, grid.origin.y,
+                               grid.invCellSize);
+
+    for (int32_t y = minY; y <= maxY; ++y) {
+        for (int32_t x = minX; x <= maxX; ++x) {
+            fn(y * consts::kLidarGridDim + x);
+        }
+    }
+}
+
+// Builds the grid from `numRoads` roads. `boxOf(roadIdx)` must return the
+// collision box of road `roadIdx`.
+template <typename BoxFn>
+void build(LidarGrid &grid, madrona::CountT numRoads, BoxFn &&boxOf) {
+    for (madrona::CountT cellIdx = 0; cellIdx <= consts::kLidarGridCellCount;
+         ++cellIdx) {
+        grid.cellStart[cellIdx] = 0;
+    }
+    grid.overflow = 0;
+    grid.origin = {0.f, 0.f};
+    grid.cellSize = consts::kLidarGridMinCellSize;
+    grid.invCellSize = 1.f / grid.cellSize;
+
+    if (numRoads == 0) {
+        return;
+    }
+
+    // Bounds of the boxes themselves (not only their centers), so that every
+    // box lies completely inside the grid.
+    madrona::math::Vector2 lo{INFINITY, INFINITY};
+    madrona::math::Vector2 hi{-INFINITY, -INFINITY};
+    for (madrona::CountT roadIdx = 0; roadIdx < numRoads; ++roadIdx) {
+        Box box = boxOf(roadIdx);
+        madrona::math::Vector2 extent = boundingExtent(box);
+        lo.x = fminf(lo.x, box.center.x - extent.x);
+        lo.y = fminf(lo.y, box.center.y - extent.y);
+        hi.x = fmaxf(hi.x, box.center.x + extent.x);
+        hi.y = fmaxf(hi.y, box.center.y + extent.y);
+    }
+
+    float extent = fmaxf(hi.x - lo.x, hi.y - lo.y);
+    grid.origin = lo;
+    grid.cellSize = fmaxf(extent / (float)consts::kLidarGridDim,
+                          consts::kLidarGridMinCellSize);
+    grid.invCellSize = 1.f / grid.cellSize;
+
+    int32_t numEntries = 0;
+    for (madrona::CountT roadIdx = 0; roadIdx < numRoads; ++roadIdx) {
+        forEachCellOf(grid, boxOf(roadIdx), [&](int32_t cellIdx) {
+            grid.cellStart[cellIdx]++;
+            numEntries++;
+        });
+    }
+    if (numEntries > consts::kLidarGridMaxEntries) {
+        grid.overflow = 1;
+        return;
+    }
+
+    for (madrona::CountT cellIdx = 1; cellIdx < consts::kLidarGridCellCount;
+         ++cellIdx) {
+        grid.cellStart[cellIdx] += grid.cellStart[cellIdx - 1];
+    }
+    grid.cellStart[consts::kLidarGridCellCount] = numEntries;
+
+    for (madrona::CountT roadIdx = numRoads - 1; roadIdx >= 0; --roadIdx) {
+        forEachCellOf(grid, boxOf(roadIdx), [&](int32_t cellIdx) {
+            grid.roadIndices[--grid.cellStart[cellIdx]] = (int32_t)roadIdx;
+        });
+    }
+}
+
+// Returns the index of the closest road hit by the horizontal ray
+// `origin + t * dir` at height `z` with t < tMax, or -1 if there is none.
+// `dir` must be normalized.
+template <typename BoxFn>
+int32_t traceRay(const LidarGrid &grid, BoxFn &&boxOf,
+                 const madrona::math::Vector2 &origin,
+                 const madrona::math::Vector2 &dir, float z, float tMax,
+                 float *hitT) {
+    const float gridSize = grid.cellSize * (float)consts::kLidarGridDim;
+    const float lo[2] = {grid.origin.x, grid.origin.y};
+    const float o[2] = {origin.x, origin.y};
+    const float d[2] = {dir.x, dir.y};
+
+    // Clip the ray against the grid bounds.
+    float tStart = 0.f;
+    float tEnd = tMax;
+    for (int axis = 0; axis < 2; ++axis) {
+        if (fabsf(d[axis]) < 1e-8f) {
+            if (o[axis] < lo[axis] || o[axis] > lo[axis] + gridSize) {
+                return -1;
+            }
+            continue;
+        }
+        float t1 = (lo[axis] - o[axis]) / d[axis];
+        float t2 = (lo[axis] + gridSize - o[axis]) / d[axis];
+        tStart = fmaxf(tStart, fminf(t1, t2));
+        tEnd = fminf(tEnd, fmaxf(t1, t2));
+    }
+    if (tStart > tEnd) {
+        return -1;
+    }
+
+    int32_t cell[2];
+    int32_t step[2];
+    float tNext[2];
+    float tDelta[2];
+    for (int axis = 0; axis < 2; ++axis) {
+        cell[axis] = clampedCell(o[axis] + tStart * d[axis], lo[axis],
+                                 grid.invCellSize);
+        if (fabsf(d[axis]) < 1e-8f) {
+            step[axis] = 0;
+            tNext[axis] = INFINITY;
+            tDelta[axis] = INFINITY;
+            continue;
+        }
+        step[axis] = d[axis] > 0.f ? 1 : -1;
+        float boundary =
+            lo[axis] + (float)(cell[axis] + (step[axis] > 0)) * grid.cellSize;
+        tNext[axis] = (boundary - o[axis]) / d[axis];
+        tDelta[axis] = grid.cellSize / fabsf(d[axis]);
+    }
+
+    float closest = tMax;
+    int32_t closestRoad = -1;
+    while (true) {
+        int32_t cellIdx = cell[1] * consts::kLidarGridDim + cell[0];
+        for (int32_t i = grid.cellStart[cellIdx];
+             i < grid.cellStart[cellIdx + 1]; ++i) {
+            int32_t roadIdx = grid.roadIndices[i];
+            float t = intersectBox(boxOf(roadIdx), origin, dir, z);
+            if (t >= 0.f && t < closest) {
+                closest = t;
+                closestRoad = roadIdx;
+            }
+        }
+
+        int axis = tNext[0] < tNext[1] ? 0 : 1;
+        float tCellExit = tNext[axis];
+        if (closest <= tCellExit || tCellExit > tEnd) {
+            break;
+        }
+
+        cell[axis] += step[axis];
+        if (cell[axis] < 0 || cell[axis] >= consts::kLidarGridDim) {
+            break;
+        }
+        tNext[axis] += tDelta[axis];
+    }
+
+    *hitT = closest;
+    return closestRoad;
+}
+
+} // namespace lidargrid
+
+} // namespace gpudrive
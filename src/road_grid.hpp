@@ -0,0 +1,136 @@
+#pragma once
+
+#include <cmath>
+#include <madrona/math.hpp>
+#include <madrona/types.hpp>
+
+#include "consts.hpp"
+
+namespace gpudrive {
+
+// Static uniform grid over the road entities of a world.
+//
+// Roads never move after they are created, so the grid is built once per
+// world whenever the map is (re)loaded. Each road is bucketed by the cell that
+// contains its center and the road indices are stored contiguously per cell
+// (counting sort), row-major. A radius query therefore only touches the
+// cells overlapping the query square, and within one grid row those cells
+// form a single contiguous range of `roadIndices`.
+//
+// All road observation filters use the distance to the road center, so
+// bucketing by center is exact: no road within the radius can be missed.
+struct RoadGrid {
+    madrona::math::Vector2 origin;
+    float cellSize;
+    float invCellSize;
+    int32_t cellStart[consts::kRoadGridCellCount + 1];
+    int32_t roadIndices[consts::kMaxRoadEntityCount];
+};
+
+namespace roadgrid {
+
+inline int32_t clampedCellCoord(const RoadGrid &grid, float coord,
+                                float origin) {
+    float cell = floorf((coord - origin) * grid.invCellSize);
+    cell = fminf(fmaxf(cell, -1.f), (float)consts::kRoadGridDim);
+    return (int32_t)cell;
+}
+
+inline int32_t cellIndexOf(const RoadGrid &grid,
+                           const madrona::math::Vector2 &position) {
+    int32_t x = clampedCellCoord(grid, position.x, grid.origin.x);
+    int32_t y = clampedCellCoord(grid, position.y, grid.origin.y);
+    x = x < 0 ? 0 : (x >= consts::kRoadGridDim ? consts::kRoadGridDim - 1 : x);
+    y = y < 0 ? 0 : (y >= consts::kRoadGridDim ? consts::kRoadGridDim - 1 : y);
+    return y * consts::kRoadGridDim + x;
+}
+
+// Builds the grid from `numRoads` road centers. `positionOf(roadIdx)` must
+// return the center of road `roadIdx` as a Vector2.
+template <typename PositionFn>
+void build(RoadGrid &grid, madrona::CountT numRoads, PositionFn &&positionOf) {
+    for (madrona::CountT cellIdx = 0; cellIdx <= consts::kRoadGridCellCount;
+         ++cellIdx) {
+        grid.cellStart[cellIdx] = 0;
+    }
+
+    if (numRoads == 0) {
+        grid.origin = {0.f, 0.f};
+        grid.cellSize = consts::kRoadGridMinCellSize;
+        grid.invCellSize = 1.f / grid.cellSize;
+        return;
+    }
+
+    madrona::math::Vector2 lo = positionOf(0);
+    madrona::math::Vector2 hi = lo;
+    for (madrona::CountT roadIdx = 1; roadIdx < numRoads; ++roadIdx) {
+        madrona::math::Vector2 p = positionOf(roadIdx);
+        lo.x = fminf(lo.x, p.x);
+        lo.y = fminf(lo.y, p.y);
+        hi.x = fmaxf(hi.x, p.x);
+        hi.y = fmaxf(hi.y, p.y);
+    }
+
+    float extent = fmaxf(hi.x - lo.x, hi.y - lo.y);
+    grid.origin = lo;
+    grid.cellSize = fmaxf(extent / (float)consts::kRoadGridDim,
+                          consts::kRoadGridMinCellSize);
+    grid.invCellSize = 1.f / grid.cellSize;
+
+    // Count roads per cell, then turn the counts into inclusive prefix sums
+    // (the end of every cell).
+    for (madrona::CountT roadIdx = 0; roadIdx < numRoads; ++roadIdx) {
+        grid.cellStart[cellIndexOf(grid, positionOf(roadIdx))]++;
+    }
+    for (madrona::CountT cellIdx = 1; cellIdx < consts::kRoadGridCellCount;
+         ++cellIdx) {
+        grid.cellStart[cellIdx] += grid.cellStart[cellIdx - 1];
+    }
+    grid.cellStart[consts::kRoadGridCellCount] = (int32_t)numRoads;
+
+    // Scatter back to front. Every decrement moves a cell end towards its
+    // start, so afterwards cellStart[c] is the first slot of cell c and the
+    // roads of each cell are sorted by ascending road index.
+    for (madrona::CountT roadIdx = numRoads - 1; roadIdx >= 0; --roadIdx) {
+        int32_t cellIdx = cellIndexOf(grid, positionOf(roadIdx));
+        grid.roadIndices[--grid.cellStart[cellIdx]] = (int32_t)roadIdx;
+    }
+}
+
+// Calls `fn(roadIdx)` for every road whose cell overlaps the axis aligned
+// square of half-size `radius` around `center`. Candidates still need an
+// exact distance check. Iteration stops early if `fn` returns false.
+template <typename Fn>
+void forEachRoadNear(const RoadGrid &grid,
+                     const madrona::math::Vector2 &center, float radius,
+                     Fn &&fn) {
+    int32_t minX = clampedCellCoord(grid, center.x - radius, grid.origin.x);
+    int32_t maxX = clampedCellCoord(grid, center.x + radius, grid.origin.x);
+    int32_t minY = clampedCellCoord(grid, center.y - radius, grid.origin.y);
+    int32_t maxY = clampedCellCoord(grid, center.y + radius, grid.origin.y);
+
+    if (maxX < 0 || maxY < 0 || minX >= consts::kRoadGridDim ||
+        minY >= consts::kRoadGridDim) {
+        return;
+    }
+
+    minX = minX < 0 ? 0 : minX;
+    minY = minY < 0 ? 0 : minY;
+    maxX = maxX >= consts::kRoadGridDim ? consts::kRoadGridDim - 1 : maxX;
+    maxY = maxY >= consts::kRoadGridDim ? consts::kRoadGridDim - 1 : maxY;
+
+    for (int32_t y = minY; y <= maxY; ++y) {
+        int32_t rowOffset = y * consts::kRoadGridDim;
+        int32_t begin = grid.cellStart[rowOffset + minX];
+        int32_t end = grid.cellStart[rowOffset + maxX + 1];
+        for (int32_t i = begin; i < end; ++i) {
+            if (!fn(grid.roadIndices[i])) {
+                return;
+            }
+        }
+    }
+}
+
+} // namespace roadgrid
+
+} // namespace gpudrive
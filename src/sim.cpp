@@ -35,6 +35,7 @@ void Sim::registerTypes(ECSRegistry &registry, const Config &cfg)
     registry.registerComponent<SelfObservation>();
     registry.registerComponent<MapObservation>();
     registry.registerComponent<AgentMapObservations>();
+    registry.registerComponent<RoadObservationCache>();
     registry.registerComponent<Reward>();
     registry.registerComponent<Done>();
     registry.registerComponent<Progress>();
@@ -215,20 +216,21 @@ inline void collectPartnerObsSystem(Engine &ctx,
     }
 }
 
-inline void collectMapObservationsSystem(Engine &ctx,
-                                        const Position &pos,
-                                        const Rotation &rot,
-                                        const AgentInterfaceEntity &agent_iface)
+static inline void selectRoadObservations(Engine &ctx,
+                                          const Position &pos,
+                                          const Rotation &rot,
+                                          AgentMapObservations &map_obs)
 {
-    if(ctx.data().params.disableClassicalObs)
-        return;
-
-    auto &map_obs = ctx.get<AgentMapObservations>(agent_iface.e);
-    
     const auto alg = ctx.data().params.roadObservationAlgorithm;
+    const bool useGrid = ctx.data().params.enableRoadGrid;
     if (alg == FindRoadObservationsWith::KNearestEntitiesWithRadiusFiltering) {
-        selectKNearestRoadEntities<consts::kMaxAgentMapObservationsCount>(
-            ctx, rot, pos.xy(), map_obs.obs);
+        if (useGrid) {
+            selectKNearestRoadEntitiesWithGrid<consts::kMaxAgentMapObservationsCount>(
+                ctx, rot, pos.xy(), map_obs.obs);
+        } else {
+            selectKNearestRoadEntities<consts::kMaxAgentMapObservationsCount>(
+                ctx, rot, pos.xy(), map_obs.obs);
+        }
         return;
     }
 
@@ -236,25 +238,222 @@ inline void collectMapObservationsSystem(Engine &ctx,
 
     utils::ReferenceFrame referenceFrame(pos.xy(), rot);
     CountT arrIndex = 0; CountT roadIdx = 0;
-    while(roadIdx < ctx.data().numRoads && arrIndex < consts::kMaxAgentMapObservationsCount) {
-        Entity road = ctx.data().roads[roadIdx++];
-        auto roadPos = ctx.get<Position>(road);
-        auto roadRot = ctx.get<Rotation>(road);
 
-        auto dist = referenceFrame.distanceTo(roadPos);
-        if (dist > ctx.data().params.observationRadius) {
-            continue;
+    if (useGrid) {
+        // Only visit the roads in the grid cells around the agent. The cells
+        // are visited in grid order, so keep the in-radius roads with the
+        // smallest indices in a max-heap and emit them in index order: this
+        // selects the same roads, in the same order, as the linear scan.
+        constexpr CountT K = consts::kMaxAgentMapObservationsCount;
+        const float radius = ctx.data().params.observationRadius;
+        auto byIndex = [](int32_t a, int32_t b) { return a < b; };
+        int32_t roadIndices[K];
+        CountT numRoads = 0;
+        roadgrid::forEachRoadNear(ctx.data().roadGrid, pos.xy(), radius,
+            [&](int32_t gridRoadIdx) {
+                auto roadPos = ctx.get<Position>(ctx.data().roads[gridRoadIdx]);
+                if (referenceFrame.distanceTo(roadPos) > radius) {
+                    return true;
+                }
+                if (numRoads < K) {
+                    roadIndices[numRoads++] = gridRoadIdx;
+                    if (numRoads == K) {
+                        make_heap(roadIndices, roadIndices + K, byIndex);
+                    }
+                } else if (gridRoadIdx < roadIndices[0]) {
+                    pop_heap(roadIndices, roadIndices + K, byIndex);
+                    roadIndices[K - 1] = gridRoadIdx;
+                    push_heap(roadIndices, roadIndices + K, byIndex);
+                }
+                return true;
+            });
+
+        // Heap sort into ascending road index order.
+        make_heap(roadIndices, roadIndices + numRoads, byIndex);
+        for (CountT heapEnd = numRoads; heapEnd > 1; --heapEnd) {
+            pop_heap(roadIndices, roadIndices + heapEnd, byIndex);
+        }
+
+        for (; arrIndex < numRoads; ++arrIndex) {
+            Entity road = ctx.data().roads[roadIndices[arrIndex]];
+            map_obs.obs[arrIndex] = referenceFrame.observationOf(
+                ctx.get<Position>(road), ctx.get<Rotation>(road), ctx.get<Scale>(road), ctx.get<EntityType>(road), static_cast<float>(ctx.get<RoadMapId>(road).id), ctx.get<MapType>(road));
+        }
+    } else {
+        while (roadIdx < ctx.data().numRoads && arrIndex < consts::kMaxAgentMapObservationsCount) {
+            Entity road = ctx.data().roads[roadIdx++];
+            auto roadPos = ctx.get<Position>(road);
+            auto roadRot = ctx.get<Rotation>(road);
+
+            auto dist = referenceFrame.distanceTo(roadPos);
+            if (dist > ctx.data().params.observationRadius) {
+                continue;
+            }
+
+            map_obs.obs[arrIndex] = referenceFrame.observationOf(
+                roadPos, roadRot, ctx.get<Scale>(road), ctx.get<EntityType>(road), static_cast<float>(ctx.get<RoadMapId>(road).id), ctx.get<MapType>(road));
+            arrIndex++;
+        }
+    }
+    while (arrIndex < consts::kMaxAgentMapObservationsCount) {
+        map_obs.obs[arrIndex++] = MapObservation::zero();
+    }
+}
+
+// Selects the candidate roads of the observation cache: every road within
+// observationRadius + roadObservationCacheDistance of the agent. If there are
+// more than kRoadObservationCacheCandidates, only the nearest are kept and the
+// radius the candidates cover shrinks accordingly. The candidates are stored
+// in ascending road index order.
+static inline void storeRoadObservationCandidates(Engine &ctx,
+                                                  const Vector2 &pos,
+                                                  RoadObservationCache &cache)
+{
+    constexpr CountT C = consts::kRoadObservationCacheCandidates;
+    const auto &params = ctx.data().params;
+    const float searchRadius =
+        params.observationRadius + params.roadObservationCacheDistance;
+
+    auto distance2Of = [&](int32_t roadIdx) {
+        return (ctx.get<Position>(ctx.data().roads[roadIdx]).xy() - pos)
+            .length2();
+    };
+    auto byDistance = [&](int32_t a, int32_t b) {
+        return distance2Of(a) < distance2Of(b);
+    };
+    auto byIndex = [](int32_t a, int32_t b) { return a < b; };
+
+    // Max-heap on the distance once full, so the farthest road is dropped
+    CountT numCandidates = 0;
+    bool overflow = false;
+    auto visit = [&](int32_t roadIdx) {
+        if (distance2Of(roadIdx) > searchRadius * searchRadius) {
+            return true;
+        }
+        if (numCandidates < C) {
+            cache.candidates[numCandidates++] = roadIdx;
+            if (numCandidates == C) {
+                make_heap(cache.candidates, cache.candidates + C, byDistance);
+            }
+        } else {
+            overflow = true;
+            if (byDistance(roadIdx, cache.candidates[0])) {
+                pop_heap(cache.candidates, cache.candidates + C, byDistance);
+                cache.candidates[C - 1] = roadIdx;
+                push_heap(cache.candidates, cache.candidates + C, byDistance);
+            }
+        }
+        return true;
+    };
+
+    if (params.enableRoadGrid) {
+        roadgrid::forEachRoadNear(ctx.data().roadGrid, pos, searchRadius, visit);
+    } else {
+        for (CountT roadIdx = 0; roadIdx < ctx.data().numRoads; ++roadIdx) {
+            visit((int32_t)roadIdx);
+        }
+    }
+
+    // A dropped road is at least as far as the farthest kept one, so every
+    // road strictly closer than that is a candidate.
+    cache.coveredRadius =
+        overflow ? sqrtf(distance2Of(cache.candidates[0])) : searchRadius;
+    cache.anchorPosition = pos;
+
+    // Heap sort into ascending road index order.
+    make_heap(cache.candidates, cache.candidates + numCandidates, byIndex);
+    for (CountT heapEnd = numCandidates; heapEnd > 1; --heapEnd) {
+        pop_heap(cache.candidates, cache.candidates + heapEnd, byIndex);
+    }
+    cache.numCandidates = (int32_t)numCandidates;
+}
+
+// The candidates contain every road within the observation radius as long as
+// the agent stays within coveredRadius - observationRadius of the anchor.
+static inline bool isRoadObservationCacheValid(const Parameters &params,
+                                               const RoadObservationCache &cache,
+                                               const Vector2 &pos)
+{
+    if (cache.numCandidates < 0) {
+        return false;
+    }
+    return (pos - cache.anchorPosition).length() + params.observationRadius <
+           cache.coveredRadius;
+}
+
+// Selects the road observations among the cached candidates in the agent's
+// current frame. Since the candidates contain every road in range, this is
+// the same selection as selectRoadObservations.
+static inline void selectRoadObservationsFromCache(
+    Engine &ctx, const Position &pos, const Rotation &rot,
+    const RoadObservationCache &cache, AgentMapObservations &map_obs)
+{
+    auto forEachCandidate = [&](auto &&fn) {
+        for (CountT i = 0; i < cache.numCandidates; ++i) {
+            if (!fn(cache.candidates[i])) {
+                return;
+            }
         }
+    };
 
-        map_obs.obs[arrIndex] = referenceFrame.observationOf(
-            roadPos, roadRot, ctx.get<Scale>(road), ctx.get<EntityType>(road), static_cast<float>(ctx.get<RoadMapId>(road).id), ctx.get<MapType>(road));
-        arrIndex++;
+    const auto alg = ctx.data().params.roadObservationAlgorithm;
+    if (alg == FindRoadObservationsWith::KNearestEntitiesWithRadiusFiltering) {
+        selectKNearestRoadEntitiesAmong<consts::kMaxAgentMapObservationsCount>(
+            ctx, rot, pos.xy(), forEachCandidate, map_obs.obs);
+        return;
     }
+
+    assert(alg == FindRoadObservationsWith::AllEntitiesWithRadiusFiltering);
+
+    // Candidates are in road index order, like the linear scan
+    utils::ReferenceFrame referenceFrame(pos.xy(), rot);
+    const float radius = ctx.data().params.observationRadius;
+    CountT arrIndex = 0;
+    forEachCandidate([&](int32_t roadIdx) {
+        Entity road = ctx.data().roads[roadIdx];
+        auto roadPos = ctx.get<Position>(road);
+        if (referenceFrame.distanceTo(roadPos) > radius) {
+            return true;
+        }
+        map_obs.obs[arrIndex++] = referenceFrame.observationOf(
+            roadPos, ctx.get<Rotation>(road), ctx.get<Scale>(road), ctx.get<EntityType>(road), static_cast<float>(ctx.get<RoadMapId>(road).id), ctx.get<MapType>(road));
+        return arrIndex < consts::kMaxAgentMapObservationsCount;
+    });
     while (arrIndex < consts::kMaxAgentMapObservationsCount) {
         map_obs.obs[arrIndex++] = MapObservation::zero();
     }
 }
 
+inline void collectMapObservationsSystem(Engine &ctx,
+                                        const Position &pos,
+                                        const Rotation &rot,
+                                        const AgentInterfaceEntity &agent_iface)
+{
+    const auto &params = ctx.data().params;
+    if(params.disableClassicalObs)
+        return;
+
+    auto &map_obs = ctx.get<AgentMapObservations>(agent_iface.e);
+
+    if (params.roadObservationCacheDistance <= 0.f) {
+        selectRoadObservations(ctx, pos, rot, map_obs);
+        return;
+    }
+
+    auto &cache = ctx.get<RoadObservationCache>(agent_iface.e);
+    if (!isRoadObservationCacheValid(params, cache, pos.xy())) {
+        storeRoadObservationCandidates(ctx, pos.xy(), cache);
+        if (!isRoadObservationCacheValid(params, cache, pos.xy())) {
+            // Too many roads nearby for the candidates to cover the radius
+            cache.numCandidates = -1;
+            selectRoadObservations(ctx, pos, rot, map_obs);
+            return;
+        }
+    }
+
+    selectRoadObservationsFromCache(ctx, pos, rot, cache, map_obs);
+}
+
 // Make the agents easier to control by zeroing out their velocity
 // after each step.
 inline void agentZeroVelSystem(Engine &,
@@ -381,22 +580,15 @@ inline void lidarSystem(Engine &ctx, Entity e, const AgentInterfaceEntity &agent
     Vector3 agent_fwd = rot.rotateVec(math::fwd);
     Vector3 right = rot.rotateVec(math::right);
 
-    auto traceRay = [&](int32_t idx, float offset, LidarSample *samples) {
+    auto rayAngle = [&](int32_t idx) {
         // float theta = 2.f * math::pi * (
         //     float(idx) / float(consts::numLidarSamples)); 
         float head_angle = ctx.get<ControlledState>(agent_iface.e).controlled ? action.classic.headAngle : 0.f;
-        float theta = consts::lidarAngle * (2 * float(idx) / float(consts::numLidarSamples) - 1) + head_angle;
-        float x = cosf(theta);
-        float y = sinf(theta);
-
-        Vector3 ray_dir = (x * right + y * agent_fwd).normalize();
-
-        float hit_t;
-        Vector3 hit_normal;
-        Entity hit_entity =
-            bvh.traceRay(pos + offset * math::up, ray_dir, &hit_t,
-                         &hit_normal, consts::lidarDistance);
+        return consts::lidarAngle * (2 * float(idx) / float(consts::numLidarSamples) - 1) + head_angle;
+    };
 
+    auto writeSample = [&](LidarSample *samples, int32_t idx, float theta,
+                           Entity hit_entity, float hit_t) {
         if (hit_entity == Entity::none()) {
             samples[idx] = {
                 .depth = 0.f,
@@ -409,12 +601,82 @@ inline void lidarSystem(Engine &ctx, Entity e, const AgentInterfaceEntity &agent
             samples[idx] = {
                 .depth = hit_t,
                 .encodedType = encodeType(entity_type),
-                .position = {hit_t * x,
-                             hit_t * y},
+                .position = {hit_t * cosf(theta),
+                             hit_t * sinf(theta)},
             };
         }
     };
 
+    auto traceRay = [&](int32_t idx, float offset, LidarSample *samples) {
+        float theta = rayAngle(idx);
+        float x = cosf(theta);
+        float y = sinf(theta);
+
+        Vector3 ray_dir = (x * right + y * agent_fwd).normalize();
+
+        float hit_t;
+        Vector3 hit_normal;
+        Entity hit_entity =
+            bvh.traceRay(pos + offset * math::up, ray_dir, &hit_t,
+                         &hit_normal, consts::lidarDistance);
+
+        writeSample(samples, idx, theta, hit_entity, hit_t);
+        return hit_entity;
+    };
+
+    // Road rays only need the static lidar grid plus the agents. Agent hulls
+    // span [pos.z, pos.z + 2 * scale.d2], so the car ray (traced first)
+    // already found the closest agent for every road ray above pos.z.
+    const LidarGrid &lidarGrid = ctx.data().lidarGrid;
+    const bool useLidarGrid =
+        ctx.data().params.enableLidarGrid && !lidarGrid.overflow;
+    auto roadBox = [&](int32_t roadIdx) {
+        Entity road = ctx.data().roads[roadIdx];
+        return lidargrid::makeBox(ctx.get<Position>(road),
+                                  ctx.get<Rotation>(road),
+                                  ctx.get<Scale>(road));
+    };
+
+    auto traceRoadRay = [&](int32_t idx, float offset, LidarSample *samples,
+                            Entity car_hit, const LidarSample &car_sample) {
+        if (!useLidarGrid) {
+            traceRay(idx, offset, samples);
+            return;
+        }
+
+        float theta = rayAngle(idx);
+        Vector3 ray_dir = (cosf(theta) * right + sinf(theta) * agent_fwd).normalize();
+
+        float max_t = consts::lidarDistance;
+        Entity hit_entity = Entity::none();
+        if (car_hit != Entity::none() && offset >= 0.f) {
+            EntityType car_hit_type = ctx.get<EntityType>(car_hit);
+            if (car_hit_type >= EntityType::Vehicle &&
+                car_hit_type <= EntityType::Cyclist) {
+                max_t = car_sample.depth;
+                hit_entity = car_hit;
+            }
+        }
+
+        float hit_t = max_t;
+        int32_t road_idx = lidargrid::traceRay(
+            lidarGrid, roadBox, pos.xy(), ray_dir.xy(), pos.z + offset,
+            max_t, &hit_t);
+        if (road_idx >= 0) {
+            hit_entity = ctx.data().roads[road_idx];
+        }
+
+        writeSample(samples, idx, theta, hit_entity, hit_t);
+    };
+
+    auto traceRays = [&](int32_t idx) {
+        Entity car_hit = traceRay(idx, consts::lidarCarOffset, lidar.samplesCars);
+        traceRoadRay(idx, consts::lidarRoadEdgeOffset, lidar.samplesRoadEdges,
+                     car_hit, lidar.samplesCars[idx]);
+        traceRoadRay(idx, consts::lidarRoadLineOffset, lidar.samplesRoadLines,
+                     car_hit, lidar.samplesCars[idx]);
+    };
+
 
     // MADRONA_GPU_MODE guards GPU specific logic
 #ifdef MADRONA_GPU_MODE
@@ -423,47 +685,85 @@ inline void lidarSystem(Engine &ctx, Entity e, const AgentInterfaceEntity &agent
     int32_t idx = threadIdx.x % 32;
 
     while (idx < consts::numLidarSamples) {
-        traceRay(idx, consts::lidarCarOffset, lidar.samplesCars);
-        traceRay(idx, consts::lidarRoadEdgeOffset, lidar.samplesRoadEdges);
-        traceRay(idx, consts::lidarRoadLineOffset, lidar.samplesRoadLines);
+        traceRays(idx);
         idx += 32;
     }
 #else
     for (CountT i = 0; i < consts::numLidarSamples; i++) {
-        traceRay(i, consts::lidarCarOffset, lidar.samplesCars);
-        traceRay(i, consts::lidarRoadEdgeOffset, lidar.samplesRoadEdges);
-        traceRay(i, consts::lidarRoadLineOffset, lidar.samplesRoadLines);
+        traceRays(i);
     }
 #endif
 }
 
-// Computes reward for each agent and keeps track of the max distance achieved
-// so far through the challenge. Continuous reward is provided for any new
-// distance achieved.
+// Distance to the expert's position at the current step, 0 where the expert
+// trajectory is invalid.
+static inline float distanceToExpert(Engine &ctx,
+                                     const Position &position,
+                                     const AgentInterfaceEntity &agent_iface)
+{
+    const Trajectory &trajectory = ctx.get<Trajectory>(agent_iface.e);
+    CountT curStep = getCurrentStep(ctx.get<StepsRemaining>(agent_iface.e));
+    if (curStep >= consts::kTrajectoryLength || !trajectory.valids[curStep])
+    {
+        return 0.f;
+    }
+    return (position.xy() - trajectory.positions[curStep]).length();
+}
+
+// Computes the reward of each agent for the configured reward type:
+// DistanceBased is the negative distance to the goal, OnGoalAchieved is 1
+// within the goal threshold, and Dense is the negative distance to the
+// expert. WeightedCombination weighs goal achieved, collisions, off road,
+// the progress towards the goal since the last step (from
+// Progress::previousGoalDistance) and, optionally, the distance to the expert.
 inline void rewardSystem(Engine &ctx,
                          const Position &position,
                          const Goal &goal,
+                         Progress &progress,
                          const AgentInterfaceEntity &agent_iface)
 {
     Reward &out_reward = ctx.get<Reward>(agent_iface.e);
-    const auto &rewardType = ctx.data().params.rewardParams.rewardType;
+    const auto &rewardParams = ctx.data().params.rewardParams;
+    const auto &rewardType = rewardParams.rewardType;
+    float dist = (position.xy() - goal.position).length();
     if(rewardType == RewardType::DistanceBased)
     {
-        float dist = (position.xy() - goal.position).length();
         float reward = -dist;
         out_reward.v = reward;
     }
     else if(rewardType == RewardType::OnGoalAchieved)
     {
-        float dist = (position.xy() - goal.position).length();
-        float reward = (dist < ctx.data().params.rewardParams.distanceToGoalThreshold) ? 1.f : 0.f;
+        float reward = (dist < rewardParams.distanceToGoalThreshold) ? 1.f : 0.f;
         out_reward.v = reward;
     }
     else if(rewardType == RewardType::Dense)
     {
-        // TODO: Implement full trajectory reward
-        assert(false);
+        out_reward.v = -distanceToExpert(ctx, position, agent_iface);
+    }
+    else if(rewardType == RewardType::WeightedCombination)
+    {
+        const Info &info = ctx.get<Info>(agent_iface.e);
+        // The done system marks the goal as reached only after this system
+        float goalAchieved =
+            (info.reachedGoal || dist < rewardParams.distanceToGoalThreshold) ? 1.f : 0.f;
+        float collided = (float)(info.collidedWithVehicle + info.collidedWithNonVehicle);
+        float offRoad = (float)info.collidedWithRoad;
+        float goalProgress = progress.previousGoalDistance >= 0.f
+                                 ? progress.previousGoalDistance - dist
+                                 : 0.f;
+
+        float reward = rewardParams.goalAchievedWeight * goalAchieved +
+                       rewardParams.collisionWeight * collided +
+                       rewardParams.offRoadWeight * offRoad +
+                       rewardParams.progressWeight * goalProgress;
+        if (rewardParams.expertDistanceWeight != 0.f)
+        {
+            reward -= rewardParams.expertDistanceWeight *
+                      distanceToExpert(ctx, position, agent_iface);
+        }
+        out_reward.v = reward;
     }
+    progress.previousGoalDistance = dist;
 
     // Just in case agents do something crazy, clamp total reward
     // out_reward.v = fmaxf(fminf(out_reward.v, 1.f), 0.f);
@@ -693,6 +993,7 @@ void setupRestOfTasks(TaskGraphBuilder &builder, const Sim::Config &cfg,
          rewardSystem,
             Position,
             Goal,
+            Progress,
             AgentInterfaceEntity
         >>({phys_done});
 
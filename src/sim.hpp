@@ -7,6 +7,8 @@
 #include "types.hpp"
 #include "init.hpp"
 #include "rng.hpp"
+#include "lidar_grid.hpp"
+#include "road_grid.hpp"
 
 namespace gpudrive {
 
@@ -126,6 +128,12 @@ struct Sim : public madrona::WorldBase {
     Entity agent_ifaces[consts::kMaxAgentCount];
     Entity road_ifaces[consts::kMaxRoadEntityCount];
 
+    // Spatial index over `roads`, rebuilt whenever the map is loaded.
+    RoadGrid roadGrid;
+    // Static acceleration structure for the road lidar rays, rebuilt whenever
+    // the map is loaded.
+    LidarGrid lidarGrid;
+
     Entity camera_agent;
 
     madrona::CountT numControlledAgents;
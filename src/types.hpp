@@ -262,6 +262,16 @@ struct ResetMap {
                   sizeof(float) * consts::kMaxAgentMapObservationsCount *
                       AgentMapObservationExportSize);
 
+    // Candidate roads of an agent's road observations, see
+    // collectMapObservationsSystem.
+    struct RoadObservationCache
+    {
+        madrona::math::Vector2 anchorPosition;
+        float coveredRadius; // Every road closer to the anchor is a candidate
+        int32_t numCandidates; // -1 if the candidates have to be selected again
+        int32_t candidates[consts::kRoadObservationCacheCandidates]; // Road indices, ascending
+    };
+
     struct LidarSample
     {
         float depth;
@@ -287,10 +297,10 @@ struct ResetMap {
         uint32_t t;
     };
 
-    // Can be refactored for rewards
+    // Reward shaping state
     struct Progress
     {
-        float maxY;
+        float previousGoalDistance; // -1 right after a reset
     };
 
     // Per-agent component storing Entity IDs of the other agents. Used to
@@ -358,6 +368,7 @@ struct ResetMap {
                                 AbsoluteSelfObservation,
                                 PartnerObservations,
                                 AgentMapObservations,
+                                RoadObservationCache,
                                 Lidar,
                                 StepsRemaining,
                                 ResponseType,
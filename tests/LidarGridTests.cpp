@@ -0,0 +1,140 @@
+#include "lidar_grid.hpp"
+#include "mgr.hpp"
+#include "test_utils.hpp"
+#include <gtest/gtest.h>
+
+#include <cmath>
+#include <memory>
+#include <random>
+#include <vector>
+
+using namespace madrona;
+using namespace madrona::math;
+using gpudrive::LidarGrid;
+namespace lidargrid = gpudrive::lidargrid;
+
+namespace {
+
+lidargrid::Box makeBox(float x, float y, float yaw, float halfLength,
+                       float halfWidth, float z = 1.f) {
+  return lidargrid::makeBox(Vector3{x, y, z}, Quat::angleAxis(yaw, math::up),
+                            Diag3x3{halfLength, halfWidth, 0.1f});
+}
+
+} // namespace
+
+TEST(LidarGridTests, IntersectBox) {
+  auto box = makeBox(10.f, 0.f, 0.f, 1.f, 0.5f);
+
+  EXPECT_NEAR(lidargrid::intersectBox(box, {0.f, 0.f}, {1.f, 0.f}, 1.f), 9.f,
+              test_utils::EPSILON);
+  // Pointing away from the box.
+  EXPECT_EQ(lidargrid::intersectBox(box, {0.f, 0.f}, {-1.f, 0.f}, 1.f), -1.f);
+  // Passing next to the box.
+  EXPECT_EQ(lidargrid::intersectBox(box, {0.f, 1.f}, {1.f, 0.f}, 1.f), -1.f);
+  // Above the box.
+  EXPECT_EQ(lidargrid::intersectBox(box, {0.f, 0.f}, {1.f, 0.f}, 1.5f), -1.f);
+  // Starting inside the box.
+  EXPECT_EQ(lidargrid::intersectBox(box, {10.f, 0.f}, {1.f, 0.f}, 1.f), -1.f);
+
+  // Rotated by 90 degrees the box is 2 long along y and 1 wide along x.
+  auto rotated = makeBox(10.f, 0.f, math::pi / 2.f, 1.f, 0.5f);
+  EXPECT_NEAR(lidargrid::intersectBox(rotated, {0.f, 0.f}, {1.f, 0.f}, 1.f),
+              9.5f, test_utils::EPSILON);
+}
+
+TEST(LidarGridTests, MatchesBruteForceRayCast) {
+  std::mt19937 gen(0);
+  std::uniform_real_distribution<float> coord(-200.f, 200.f);
+  std::uniform_real_distribution<float> angle(-math::pi, math::pi);
+  std::uniform_real_distribution<float> halfLength(0.5f, 15.f);
+
+  std::vector<lidargrid::Box> boxes;
+  for (int i = 0; i < 2000; ++i) {
+    boxes.push_back(
+        makeBox(coord(gen), coord(gen), angle(gen), halfLength(gen), 0.1f));
+  }
+  auto boxOf = [&](int32_t idx) { return boxes[idx]; };
+
+  auto grid = std::make_unique<LidarGrid>();
+  lidargrid::build(*grid, boxes.size(), boxOf);
+  ASSERT_FALSE(grid->overflow);
+
+  std::uniform_real_distribution<float> originCoord(-300.f, 300.f);
+  for (int i = 0; i < 2000; ++i) {
+    Vector2 origin{originCoord(gen), originCoord(gen)};
+    float theta = angle(gen);
+    Vector2 dir{cosf(theta), sinf(theta)};
+    const float tMax = 200.f;
+
+    float expectedT = tMax;
+    int32_t expectedIdx = -1;
+    for (int32_t idx = 0; idx < (int32_t)boxes.size(); ++idx) {
+      float t = lidargrid::intersectBox(boxes[idx], origin, dir, 1.f);
+      if (t >= 0.f && t < expectedT) {
+        expectedT = t;
+        expectedIdx = idx;
+      }
+    }
+
+    float hitT;
+    int32_t hitIdx =
+        lidargrid::traceRay(*grid, boxOf, origin, dir, 1.f, tMax, &hitT);
+    EXPECT_EQ(hitIdx, expectedIdx);
+    if (expectedIdx >= 0) {
+      EXPECT_NEAR(hitT, expectedT, test_utils::EPSILON);
+    }
+  }
+}
+
+TEST(LidarGridTests, OverflowIsFlagged) {
+  // A handful of boxes spanning the whole grid overlap every cell.
+  std::vector<lidargrid::Box> boxes;
+  for (int i = 0; i < 20; ++i) {
+    boxes.push_back(makeBox(0.f, (float)i, math::pi / 4.f, 1000.f, 0.1f));
+  }
+
+  auto grid = std::make_unique<LidarGrid>();
+  lidargrid::build(*grid, boxes.size(),
+                   [&](int32_t idx) { return boxes[idx]; });
+  EXPECT_TRUE(grid->overflow);
+}
+
+// The road rays traced through the lidar grid should agree with the physics
+// BVH. Rays starting inside a road box are the only expected difference.
+TEST(LidarGridTests, GridMatchesBVHLidar) {
+  auto makeManager = [](bool enableLidarGrid) {
+    return gpudrive::Manager({.execMode = ExecMode::CPU,
+                              .gpuID = 0,
+                              .scenes = {"testJsons/test.json"},
+                              .params = {
+                                  .polylineReductionThreshold = 0.0,
+                                  .observationRadius = 100.0,
+                                  .collisionBehaviour =
+                                      gpudrive::CollisionBehaviour::Ignore,
+                                  .enableLidar = true,
+                                  .enableLidarGrid = enableLidarGrid,
+                              }});
+  };
+  auto bvh = makeManager(false);
+  auto grid = makeManager(true);
+
+  size_t numSamples = 0;
+  size_t numMatching = 0;
+  for (int step = 0; step < 10; ++step) {
+    auto expected = test_utils::flatten_obs(bvh.lidarTensor());
+    auto actual = test_utils::flatten_obs(grid.lidarTensor());
+    ASSERT_EQ(expected.size(), actual.size());
+
+    // (depth, encodedType, x, y) per sample
+    for (size_t i = 0; i < expected.size(); i += 4) {
+      numSamples++;
+      numMatching += std::abs(expected[i] - actual[i]) < 1e-2f &&
+                     expected[i + 1] == actual[i + 1];
+    }
+    bvh.step();
+    grid.step();
+  }
+
+  EXPECT_GE((double)numMatching / numSamples, 0.99);
+}
@@ -0,0 +1,80 @@
+#include "mgr.hpp"
+#include "test_utils.hpp"
+#include <gtest/gtest.h>
+
+#include <vector>
+
+using namespace madrona;
+using gpudrive::RewardParams;
+using gpudrive::RewardType;
+
+namespace {
+
+constexpr int kNumSteps = 10;
+
+gpudrive::Manager makeManager(const RewardParams &rewardParams) {
+  return gpudrive::Manager({.execMode = ExecMode::CPU,
+                            .gpuID = 0,
+                            .scenes = {"testJsons/test.json"},
+                            .params = {
+                                .polylineReductionThreshold = 0.0,
+                                .observationRadius = 100.0,
+                                .rewardParams = rewardParams,
+                                .collisionBehaviour =
+                                    gpudrive::CollisionBehaviour::Ignore,
+                            }});
+}
+
+RewardParams weightedCombination() {
+  return RewardParams{.rewardType = RewardType::WeightedCombination,
+                      .distanceToGoalThreshold = 1.0,
+                      .distanceToExpertThreshold = 1.0};
+}
+
+} // namespace
+
+// With the default weights only the goal term is active.
+TEST(RewardTests, DefaultWeightsMatchOnGoalAchieved) {
+  auto reference = makeManager({.rewardType = RewardType::OnGoalAchieved,
+                                .distanceToGoalThreshold = 1.0,
+                                .distanceToExpertThreshold = 1.0});
+  auto weighted = makeManager(weightedCombination());
+
+  for (int step = 0; step < kNumSteps; ++step) {
+    reference.step();
+    weighted.step();
+    auto expected = test_utils::flatten_obs(reference.rewardTensor());
+    auto actual = test_utils::flatten_obs(weighted.rewardTensor());
+    ASSERT_EQ(expected.size(), actual.size());
+    for (size_t i = 0; i < expected.size(); ++i) {
+      EXPECT_EQ(expected[i], actual[i]);
+    }
+  }
+}
+
+// The progress term is the decrease of the distance to the goal, which the
+// DistanceBased reward reports as its negative.
+TEST(RewardTests, ProgressIsDecreaseOfGoalDistance) {
+  auto distance = makeManager({.rewardType = RewardType::DistanceBased,
+                               .distanceToGoalThreshold = 1.0,
+                               .distanceToExpertThreshold = 1.0});
+  auto params = weightedCombination();
+  params.goalAchievedWeight = 0.f;
+  params.progressWeight = 1.f;
+  auto progress = makeManager(params);
+
+  distance.step();
+  progress.step();
+  auto previous = test_utils::flatten_obs(distance.rewardTensor());
+  for (int step = 1; step < kNumSteps; ++step) {
+    distance.step();
+    progress.step();
+    auto current = test_utils::flatten_obs(distance.rewardTensor());
+    auto actual = test_utils::flatten_obs(progress.rewardTensor());
+    ASSERT_EQ(current.size(), actual.size());
+    for (size_t i = 0; i < current.size(); ++i) {
+      EXPECT_NEAR(actual[i], current[i] - previous[i], test_utils::EPSILON);
+    }
+    previous = current;
+  }
+}
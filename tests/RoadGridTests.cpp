@@ -0,0 +1,204 @@
+#include "road_grid.hpp"
+#include "mgr.hpp"
+#include "test_utils.hpp"
+#include <gtest/gtest.h>
+
+#include <algorithm>
+#include <memory>
+#include <random>
+#include <set>
+#include <tuple>
+#include <vector>
+
+using namespace madrona;
+using namespace madrona::math;
+using gpudrive::RoadGrid;
+
+namespace {
+
+std::set<int32_t> queryGrid(const RoadGrid &grid, Vector2 center, float radius,
+                            const std::vector<Vector2> &positions) {
+  std::set<int32_t> found;
+  gpudrive::roadgrid::forEachRoadNear(grid, center, radius, [&](int32_t idx) {
+    if ((positions[idx] - center).length() <= radius) {
+      found.insert(idx);
+    }
+    return true;
+  });
+  return found;
+}
+
+std::set<int32_t> queryBruteForce(Vector2 center, float radius,
+                                  const std::vector<Vector2> &positions) {
+  std::set<int32_t> found;
+  for (int32_t idx = 0; idx < (int32_t)positions.size(); ++idx) {
+    if ((positions[idx] - center).length() <= radius) {
+      found.insert(idx);
+    }
+  }
+  return found;
+}
+
+} // namespace
+
+TEST(RoadGridTests, MatchesBruteForceRadiusQuery) {
+  std::mt19937 gen(0);
+  std::uniform_real_distribution<float> coord(-400.f, 400.f);
+
+  std::vector<Vector2> positions(gpudrive::consts::kMaxRoadEntityCount);
+  for (auto &p : positions) {
+    p = Vector2{.x = coord(gen), .y = coord(gen)};
+  }
+
+  auto grid = std::make_unique<RoadGrid>();
+  gpudrive::roadgrid::build(*grid, positions.size(),
+                            [&](CountT idx) { return positions[idx]; });
+
+  std::uniform_real_distribution<float> queryCoord(-600.f, 600.f);
+  for (float radius : {5.f, 50.f, 100.f, 2000.f}) {
+    for (int i = 0; i < 50; ++i) {
+      Vector2 center{.x = queryCoord(gen), .y = queryCoord(gen)};
+      EXPECT_EQ(queryGrid(*grid, center, radius, positions),
+                queryBruteForce(center, radius, positions));
+    }
+  }
+}
+
+TEST(RoadGridTests, CellsAreSortedByRoadIndex) {
+  std::vector<Vector2> positions = {
+      {.x = 0, .y = 0}, {.x = 100, .y = 100}, {.x = 0.5, .y = 0.5},
+      {.x = 100, .y = 99}, {.x = 0, .y = 1}};
+
+  auto grid = std::make_unique<RoadGrid>();
+  gpudrive::roadgrid::build(*grid, positions.size(),
+                            [&](CountT idx) { return positions[idx]; });
+
+  for (CountT cell = 0; cell < gpudrive::consts::kRoadGridCellCount; ++cell) {
+    EXPECT_TRUE(std::is_sorted(grid->roadIndices + grid->cellStart[cell],
+                               grid->roadIndices + grid->cellStart[cell + 1]));
+  }
+  EXPECT_EQ(grid->cellStart[gpudrive::consts::kRoadGridCellCount],
+            (int32_t)positions.size());
+}
+
+TEST(RoadGridTests, EmptyGrid) {
+  auto grid = std::make_unique<RoadGrid>();
+  gpudrive::roadgrid::build(*grid, 0, [](CountT) { return Vector2{0, 0}; });
+
+  int32_t visited = 0;
+  gpudrive::roadgrid::forEachRoadNear(*grid, Vector2{0, 0}, 100.f,
+                                      [&](int32_t) {
+                                        ++visited;
+                                        return true;
+                                      });
+  EXPECT_EQ(visited, 0);
+}
+
+class RoadGridObservationTest
+    : public ::testing::TestWithParam<gpudrive::FindRoadObservationsWith> {
+protected:
+  gpudrive::Manager makeManager(bool enableRoadGrid) {
+    return gpudrive::Manager({.execMode = ExecMode::CPU,
+                              .gpuID = 0,
+                              .scenes = {"testJsons/test.json"},
+                              .params = {
+                                  .polylineReductionThreshold = 0.0,
+                                  .observationRadius = 20.0,
+                                  .collisionBehaviour =
+                                      gpudrive::CollisionBehaviour::Ignore,
+                                  .roadObservationAlgorithm = GetParam(),
+                                  .enableRoadGrid = enableRoadGrid,
+                              }});
+  }
+
+  // Road observations of every agent, sorted so that the comparison does not
+  // depend on the order in which roads were visited.
+  static std::vector<std::vector<std::tuple<float, float, float>>>
+  sortedObservations(gpudrive::Manager &mgr) {
+    auto flat = test_utils::flatten_obs(mgr.agentMapObservationsTensor());
+    const size_t perAgent = gpudrive::consts::kMaxAgentMapObservationsCount *
+                            gpudrive::MapObservationExportSize;
+
+    std::vector<std::vector<std::tuple<float, float, float>>> result;
+    for (size_t offset = 0; offset < flat.size(); offset += perAgent) {
+      std::vector<std::tuple<float, float, float>> agentObs;
+      for (size_t i = offset; i < offset + perAgent;
+           i += gpudrive::MapObservationExportSize) {
+        // (x, y, road id)
+        agentObs.emplace_back(flat[i], flat[i + 1], flat[i + 7]);
+      }
+      std::sort(agentObs.begin(), agentObs.end());
+      result.push_back(std::move(agentObs));
+    }
+    return result;
+  }
+};
+
+TEST_P(RoadGridObservationTest, GridMatchesLinearScan) {
+  auto linear = makeManager(false);
+  auto grid = makeManager(true);
+
+  for (int step = 0; step < 10; ++step) {
+    auto expected = sortedObservations(linear);
+    auto actual = sortedObservations(grid);
+    ASSERT_EQ(expected.size(), actual.size());
+    for (size_t agentIdx = 0; agentIdx < expected.size(); ++agentIdx) {
+      for (size_t i = 0; i < expected[agentIdx].size(); ++i) {
+        EXPECT_NEAR(std::get<0>(expected[agentIdx][i]),
+                    std::get<0>(actual[agentIdx][i]), test_utils::EPSILON);
+        EXPECT_NEAR(std::get<1>(expected[agentIdx][i]),
+                    std::get<1>(actual[agentIdx][i]), test_utils::EPSILON);
+        EXPECT_EQ(std::get<2>(expected[agentIdx][i]),
+                  std::get<2>(actual[agentIdx][i]));
+      }
+    }
+    linear.step();
+    grid.step();
+  }
+}
+
+INSTANTIATE_TEST_SUITE_P(
+    RoadObservationAlgorithms, RoadGridObservationTest,
+    ::testing::Values(
+        gpudrive::FindRoadObservationsWith::KNearestEntitiesWithRadiusFiltering,
+        gpudrive::FindRoadObservationsWith::AllEntitiesWithRadiusFiltering));
+
+// With a large radius more roads are in range than there are observation
+// slots. The grid must keep the same roads as the linear scan, in the same
+// order, so the observations are compared unsorted.
+TEST(RoadGridTruncationTest, GridSelectsSameRoadsAsLinearScanWhenTruncated) {
+  auto makeManager = [](bool enableRoadGrid) {
+    return gpudrive::Manager(
+        {.execMode = ExecMode::CPU,
+         .gpuID = 0,
+         .scenes = {"testJsons/test.json"},
+         .params = {
+             .polylineReductionThreshold = 0.0,
+             .observationRadius = 1000.0,
+             .collisionBehaviour = gpudrive::CollisionBehaviour::Ignore,
+             .roadObservationAlgorithm = gpudrive::FindRoadObservationsWith::
+                 AllEntitiesWithRadiusFiltering,
+             .enableRoadGrid = enableRoadGrid,
+         }});
+  };
+  auto linear = makeManager(false);
+  auto grid = makeManager(true);
+
+  for (int step = 0; step < 3; ++step) {
+    auto expected =
+        test_utils::flatten_obs(linear.agentMapObservationsTensor());
+    auto actual = test_utils::flatten_obs(grid.agentMapObservationsTensor());
+    ASSERT_EQ(expected.size(), actual.size());
+
+    // Every slot of the first agent is filled, so the selection was truncated
+    const size_t lastSlot = (gpudrive::consts::kMaxAgentMapObservationsCount - 1) *
+                            gpudrive::MapObservationExportSize;
+    ASSERT_NE(expected[lastSlot + 6], (float)gpudrive::EntityType::None);
+
+    for (size_t i = 0; i < expected.size(); ++i) {
+      EXPECT_NEAR(expected[i], actual[i], test_utils::EPSILON) << "at " << i;
+    }
+    linear.step();
+    grid.step();
+  }
+}
@@ -0,0 +1,124 @@
+#include "consts.hpp"
+#include "mgr.hpp"
+#include "test_utils.hpp"
+#include <gtest/gtest.h>
+
+#include <algorithm>
+#include <cmath>
+#include <tuple>
+#include <vector>
+
+using namespace madrona;
+
+namespace {
+
+constexpr float kObservationRadius = 20.f;
+constexpr int kNumSteps = 20;
+
+gpudrive::Manager makeManager(gpudrive::FindRoadObservationsWith alg,
+                              float cacheDistance, bool enableRoadGrid = false) {
+  return gpudrive::Manager({.execMode = ExecMode::CPU,
+                            .gpuID = 0,
+                            .scenes = {"testJsons/test.json"},
+                            .params = {
+                                .polylineReductionThreshold = 0.0,
+                                .observationRadius = kObservationRadius,
+                                .collisionBehaviour =
+                                    gpudrive::CollisionBehaviour::Ignore,
+                                .roadObservationAlgorithm = alg,
+                                .enableRoadGrid = enableRoadGrid,
+                                .roadObservationCacheDistance = cacheDistance,
+                            }});
+}
+
+struct RoadObs {
+  float x, y, heading, type, id;
+};
+
+// Valid (non padding) road observations of every agent.
+std::vector<std::vector<RoadObs>> roadObservations(gpudrive::Manager &mgr) {
+  auto flat = test_utils::flatten_obs(mgr.agentMapObservationsTensor());
+  const size_t perAgent = gpudrive::consts::kMaxAgentMapObservationsCount *
+                          gpudrive::AgentMapObservationExportSize;
+
+  std::vector<std::vector<RoadObs>> result;
+  for (size_t offset = 0; offset < flat.size(); offset += perAgent) {
+    std::vector<RoadObs> agentObs;
+    for (size_t i = offset; i < offset + perAgent;
+         i += gpudrive::AgentMapObservationExportSize) {
+      RoadObs obs{.x = flat[i],
+                  .y = flat[i + 1],
+                  .heading = flat[i + 5],
+                  .type = flat[i + 6],
+                  .id = flat[i + 7]};
+      if (obs.type != (float)gpudrive::EntityType::None) {
+        agentObs.push_back(obs);
+      }
+    }
+    result.push_back(std::move(agentObs));
+  }
+  return result;
+}
+
+// The k-nearest selection keeps its observations in heap order, which depends
+// on the order the roads were visited in, so those are compared sorted.
+void expectSameObservations(gpudrive::FindRoadObservationsWith alg,
+                            std::vector<RoadObs> expected,
+                            std::vector<RoadObs> actual) {
+  if (alg ==
+      gpudrive::FindRoadObservationsWith::KNearestEntitiesWithRadiusFiltering) {
+    auto byId = [](const RoadObs &lhs, const RoadObs &rhs) {
+      return std::tie(lhs.id, lhs.x, lhs.y) < std::tie(rhs.id, rhs.x, rhs.y);
+    };
+    std::sort(expected.begin(), expected.end(), byId);
+    std::sort(actual.begin(), actual.end(), byId);
+  }
+
+  ASSERT_EQ(expected.size(), actual.size());
+  for (size_t i = 0; i < expected.size(); ++i) {
+    EXPECT_NEAR(expected[i].x, actual[i].x, test_utils::EPSILON);
+    EXPECT_NEAR(expected[i].y, actual[i].y, test_utils::EPSILON);
+    EXPECT_NEAR(std::cos(expected[i].heading), std::cos(actual[i].heading),
+                test_utils::EPSILON);
+    EXPECT_EQ(expected[i].id, actual[i].id);
+  }
+}
+
+} // namespace
+
+class RoadObservationCacheTest
+    : public ::testing::TestWithParam<gpudrive::FindRoadObservationsWith> {};
+
+// The cache only holds candidate roads; the observations are selected among
+// them in the agent's current frame, so they match the uncached ones for any
+// cache distance, including roads entering and leaving the radius.
+TEST_P(RoadObservationCacheTest, CachedMatchesUncached) {
+  for (bool enableRoadGrid : {false, true}) {
+    for (float cacheDistance : {1e-6f, 1.f, 5.f}) {
+      auto uncached = makeManager(GetParam(), 0.f);
+      auto cached = makeManager(GetParam(), cacheDistance, enableRoadGrid);
+
+      for (int step = 0; step < kNumSteps; ++step) {
+        auto expected = roadObservations(uncached);
+        auto actual = roadObservations(cached);
+        ASSERT_EQ(expected.size(), actual.size());
+        for (size_t agentIdx = 0; agentIdx < expected.size(); ++agentIdx) {
+          SCOPED_TRACE(::testing::Message()
+                       << "grid " << enableRoadGrid << ", cache distance "
+                       << cacheDistance << ", step " << step << ", agent "
+                       << agentIdx);
+          expectSameObservations(GetParam(), expected[agentIdx],
+                                 actual[agentIdx]);
+        }
+        uncached.step();
+        cached.step();
+      }
+    }
+  }
+}
+
+INSTANTIATE_TEST_SUITE_P(
+    RoadObservationAlgorithms, RoadObservationCacheTest,
+    ::testing::Values(
+        gpudrive::FindRoadObservationsWith::KNearestEntitiesWithRadiusFiltering,
+        gpudrive::FindRoadObservationsWith::AllEntitiesWithRadiusFiltering));
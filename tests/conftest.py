@@ -0,0 +1,74 @@
+"""Shared factories of small late fusion networks and their observations."""
+from types import SimpleNamespace
+
+import gymnasium as gym
+import numpy as np
+import torch
+
+from networks.perm_eq_late_fusion import LateFusionPolicy
+from pygpudrive.env import constants
+
+MAX_AGENTS = 6
+ROADGRAPH_TOP_K = 9
+LATE_FUSION_OBS_DIM = (
+    constants.EGO_FEAT_DIM
+    + constants.PARTNER_FEAT_DIM * (MAX_AGENTS - 1)
+    + constants.ROAD_GRAPH_FEAT_DIM * ROADGRAPH_TOP_K
+)
+
+
+def late_fusion_configs(masked_encoders, shared_encoder=False):
+    """Env and experiment configs of a small late fusion network."""
+    env_config = SimpleNamespace(
+        ego_state=True,
+        partner_obs=True,
+        road_map_obs=True,
+        max_num_agents_in_scene=MAX_AGENTS,
+        roadgraph_top_k=ROADGRAPH_TOP_K,
+    )
+    exp_config = SimpleNamespace(
+        ego_state_layers=[16, 8],
+        road_object_layers=[16, 16],
+        road_graph_layers=[16, 16],
+        shared_layers=[16],
+        act_func="tanh",
+        dropout=0.0,
+        last_layer_dim_pi=8,
+        last_layer_dim_vf=8,
+        masked_encoders=masked_encoders,
+        shared_encoder=shared_encoder,
+    )
+    return env_config, exp_config
+
+
+def late_fusion_observation_space():
+    return gym.spaces.Box(
+        low=-np.inf,
+        high=np.inf,
+        shape=(LATE_FUSION_OBS_DIM,),
+        dtype=np.float32,
+    )
+
+
+def make_late_fusion_policy(action_space, masked_encoders):
+    env_config, exp_config = late_fusion_configs(masked_encoders)
+    return LateFusionPolicy(
+        observation_space=late_fusion_observation_space(),
+        env_config=env_config,
+        exp_config=exp_config,
+        action_space=action_space,
+        lr_schedule=lambda _: 3e-4,
+    )
+
+
+def make_late_fusion_obs(num_obs=64):
+    """Random observations, of which the first half pad the second half of
+    their road points."""
+    obs = torch.rand(num_obs, LATE_FUSION_OBS_DIM)
+    road_graph = obs[:, -constants.ROAD_GRAPH_FEAT_DIM * ROADGRAPH_TOP_K :]
+    road_graph = road_graph.view(num_obs, ROADGRAPH_TOP_K, -1)
+    road_graph[: num_obs // 2, ROADGRAPH_TOP_K // 2 :] = 0
+    road_graph[
+        : num_obs // 2, ROADGRAPH_TOP_K // 2 :, constants.ENTITY_CONT_FEAT_DIM
+    ] = 1
+    return obs
@@ -0,0 +1,122 @@
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from pygpudrive.env.config import EnvConfig
+from pygpudrive.env.env_torch import GPUDriveTorchEnv
+
+
+def make_action_space(dynamics_model):
+    """Set up only the discrete action space of an environment."""
+    env = GPUDriveTorchEnv.__new__(GPUDriveTorchEnv)
+    env.config = EnvConfig(dynamics_model=dynamics_model)
+    env.device = "cpu"
+    env.action_space = env._set_discrete_action_space()
+    return env
+
+
+@pytest.mark.parametrize("dynamics_model", ["classic", "delta_local"])
+def test_decode_matches_action_table(dynamics_model):
+    env = make_action_space(dynamics_model)
+    indices = torch.arange(env.action_space.n)
+
+    assert torch.equal(env.decode_actions(indices), env.action_keys_tensor)
+    assert torch.equal(env.encode_actions(env.action_keys_tensor), indices)
+
+
+@pytest.mark.parametrize("dynamics_model", ["classic", "delta_local"])
+def test_encode_snaps_to_nearest_grid_value(dynamics_model):
+    env = make_action_space(dynamics_model)
+    values = torch.randn(4, 8, 91, 3) * 3
+
+    indices = env.encode_actions(values)
+    assert indices.shape == (4, 8, 91)
+
+    # Reference: brute force nearest neighbour per component
+    expected = torch.zeros(values.shape[:-1], dtype=torch.long)
+    for dim, grid in enumerate(env.action_grids):
+        nearest = torch.argmin(
+            torch.abs(values[..., dim, None] - grid), dim=-1
+        )
+        expected = expected * len(grid) + nearest
+    assert torch.equal(indices, expected)
+
+    # Values that match the dict based lookup after snapping
+    snapped = env.decode_actions(indices)
+    for value, idx in zip(snapped.view(-1, 3)[:100], indices.view(-1)[:100]):
+        key = tuple(round(v, 3) for v in value.tolist())
+        assert env.values_to_action_key[key] == idx.item()
+
+
+@pytest.mark.parametrize("dynamics_model", ["classic", "delta_local"])
+def test_multi_discrete_matches_joint_encoding(dynamics_model):
+    env = make_action_space(dynamics_model)
+    multi_discrete_space = env._set_multi_discrete_action_space()
+    assert multi_discrete_space.nvec.tolist() == env.action_grid_sizes
+
+    values = torch.randn(4, 8, 91, 3) * 3
+    component_indices = env.encode_multi_discrete_actions(values)
+    assert component_indices.shape == (4, 8, 91, 3)
+
+    assert torch.equal(
+        env.decode_multi_discrete_actions(component_indices),
+        env.decode_actions(env.encode_actions(values)),
+    )
+
+
+class FakeSim:
+    """Exposes only the action tensor of the simulator."""
+
+    def __init__(self, num_worlds, max_agent_count):
+        self.actions = torch.zeros(num_worlds, max_agent_count, 10)
+
+    def action_tensor(self):
+        return SimpleNamespace(to_torch=lambda: self.actions)
+
+
+def make_staged_env(dynamics_model, action_type, num_worlds=2, max_agents=5):
+    env = make_action_space(dynamics_model)
+    if action_type == "multi_discrete":
+        env.action_space = env._set_multi_discrete_action_space()
+    env.action_type = action_type
+    env.num_worlds = num_worlds
+    env.max_agent_count = max_agents
+    env.sim = FakeSim(num_worlds, max_agents)
+    env._init_action_staging()
+    return env
+
+
+@pytest.mark.parametrize("dynamics_model", ["classic", "delta_local"])
+def test_apply_action_indices(dynamics_model):
+    env = make_staged_env(dynamics_model, "discrete")
+    actions = torch.randint(0, env.action_space.n, (2, 5)).float()
+    actions[0, 1] = float("nan")
+
+    for _ in range(2):  # Second call reuses the staging buffers
+        env._apply_actions(actions)
+        expected = env.action_keys_tensor[
+            torch.nan_to_num(actions, nan=0).long()
+        ]
+        assert torch.equal(env.sim.actions[:, :, :3], expected)
+        assert torch.isnan(actions[0, 1])  # Input is left untouched
+
+    env._apply_actions(actions.unsqueeze(-1))
+    assert torch.equal(env.sim.actions[:, :, :3], expected)
+
+    values = torch.randn(2, 5, 3)
+    env._apply_actions(values)
+    assert torch.equal(env.sim.actions[:, :, :3], values)
+
+
+def test_apply_multi_discrete_actions():
+    env = make_staged_env("classic", "multi_discrete")
+    component_indices = torch.stack(
+        [torch.randint(0, n, (2, 5)) for n in env.action_grid_sizes], dim=-1
+    )
+
+    env._apply_actions(component_indices)
+    assert torch.equal(
+        env.sim.actions[:, :, :3],
+        env.decode_multi_discrete_actions(component_indices),
+    )
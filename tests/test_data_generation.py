@@ -0,0 +1,32 @@
+import torch
+
+from algorithms.il.data_generation import (
+    ExpertShardWriter,
+    load_expert_shards,
+)
+
+
+def test_shard_writer_round_trip(tmp_path):
+    writer = ExpertShardWriter(str(tmp_path), shard_size=7)
+
+    batches = []
+    for num_rows in [3, 5, 0, 9, 2]:
+        batch = (
+            torch.randn(num_rows, 4),
+            torch.randint(0, 10, (num_rows, 1)),
+            torch.randn(num_rows, 4),
+            torch.randint(0, 2, (num_rows,)).float(),
+        )
+        writer.add(*batch)
+        batches.append(batch)
+    shard_paths = writer.close()
+
+    # 19 transitions in shards of at most 7
+    assert len(shard_paths) == 3
+    shards = list(load_expert_shards(str(tmp_path)))
+    assert [len(shard["obs"]) for shard in shards] == [7, 7, 5]
+
+    for key_idx, key in enumerate(["obs", "actions", "next_obs", "dones"]):
+        expected = torch.cat([batch[key_idx] for batch in batches], dim=0)
+        actual = torch.cat([shard[key] for shard in shards], dim=0)
+        assert torch.equal(actual, expected)
@@ -0,0 +1,73 @@
+import pytest
+import torch
+
+from pygpudrive.env.expert_trajectory import ExpertTrajectory
+
+NUM_WORLDS = 2
+MAX_AGENTS = 3
+EPISODE_LEN = 5
+
+
+def make_export():
+    """Expert trajectory export with distinct values per field."""
+    traj = torch.randn(NUM_WORLDS, MAX_AGENTS, 16 * EPISODE_LEN) * 10
+    traj[:, :, 5 * EPISODE_LEN : 6 * EPISODE_LEN] = (
+        torch.rand(NUM_WORLDS, MAX_AGENTS, EPISODE_LEN) > 0.5
+    ).float()
+    return traj
+
+
+@pytest.mark.parametrize("dynamics_model", ["classic", "delta_local", "state"])
+def test_fields_follow_export_layout(dynamics_model):
+    export = make_export()
+    original = export.clone()
+    expert = ExpertTrajectory.from_export(export, dynamics_model, EPISODE_LEN)
+
+    T = EPISODE_LEN
+    assert torch.equal(
+        expert.positions,
+        export[:, :, : 2 * T].view(NUM_WORLDS, MAX_AGENTS, T, 2),
+    )
+    assert torch.equal(
+        expert.velocities,
+        export[:, :, 2 * T : 4 * T].view(NUM_WORLDS, MAX_AGENTS, T, 2),
+    )
+    assert torch.equal(expert.yaws, export[:, :, 4 * T : 5 * T])
+    assert torch.equal(expert.valids, export[:, :, 5 * T : 6 * T].bool())
+
+    for field in (
+        expert.positions,
+        expert.velocities,
+        expert.yaws,
+        expert.valids,
+        expert.actions,
+    ):
+        assert field.is_contiguous()
+        assert field.shape[:3] == (NUM_WORLDS, MAX_AGENTS, T)
+
+    # The export buffer is never modified
+    assert torch.equal(export, original)
+
+
+def test_classic_actions_are_clamped():
+    export = make_export()
+    expert = ExpertTrajectory.from_export(export, "classic", EPISODE_LEN)
+    inferred = export[:, :, 6 * EPISODE_LEN :].view(
+        NUM_WORLDS, MAX_AGENTS, EPISODE_LEN, 10
+    )
+
+    assert expert.actions.shape[-1] == 3
+    assert torch.equal(expert.actions[..., 0], inferred[..., 0].clamp(-6, 6))
+    assert torch.equal(
+        expert.actions[..., 1], inferred[..., 1].clamp(-0.3, 0.3)
+    )
+    assert torch.equal(expert.actions[..., 2], inferred[..., 2])
+
+
+def test_state_actions():
+    expert = ExpertTrajectory.from_export(make_export(), "state", EPISODE_LEN)
+
+    assert expert.actions.shape[-1] == 10
+    assert torch.equal(expert.actions[..., :2], expert.positions)
+    assert torch.equal(expert.actions[..., 3], expert.yaws)
+    assert torch.equal(expert.actions[..., 4:6], expert.velocities)
@@ -0,0 +1,72 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import gymnasium as gym
+import pytest
+import torch
+
+from networks.basic_ffn import FeedForwardPolicy
+from pygpudrive.agents.exported_policy import ExportedPolicy, export_policy
+from tests.conftest import (
+    late_fusion_observation_space,
+    make_late_fusion_obs,
+    make_late_fusion_policy,
+)
+
+
+@pytest.mark.parametrize(
+    "make_policy",
+    [
+        lambda: FeedForwardPolicy(
+            observation_space=late_fusion_observation_space(),
+            action_space=gym.spaces.Discrete(9),
+            lr_schedule=lambda _: 3e-4,
+        ),
+        lambda: make_late_fusion_policy(gym.spaces.Discrete(9), False),
+        lambda: make_late_fusion_policy(gym.spaces.Discrete(9), True),
+        lambda: make_late_fusion_policy(
+            gym.spaces.MultiDiscrete([5, 7]), False
+        ),
+    ],
+)
+def test_exported_policy_matches_policy(tmp_path, make_policy):
+    torch.manual_seed(0)
+    policy = make_policy()
+    policy.set_training_mode(False)
+    path = tmp_path / "policy.pt"
+    export_policy(policy, path)
+
+    exported = ExportedPolicy(path)
+    # Another batch size than the one the policy was traced with
+    obs = make_late_fusion_obs()
+
+    with torch.no_grad():
+        expected = policy._predict(obs, deterministic=True)
+        features = policy.pi_features_extractor(obs)
+        logits = policy.action_net(
+            policy.mlp_extractor.forward_actor(features)
+        )
+    assert torch.allclose(exported.action_logits(obs), logits, atol=1e-6)
+    assert torch.equal(exported._predict(obs, deterministic=True), expected)
+    assert exported._predict(obs, deterministic=False).shape == expected.shape
+
+
+def test_exported_policy_loads_without_sb3(tmp_path):
+    torch.manual_seed(0)
+    path = tmp_path / "policy.pt"
+    export_policy(make_late_fusion_policy(gym.spaces.Discrete(9), True), path)
+
+    script = (
+        "import sys, torch\n"
+        "from pygpudrive.agents.exported_policy import ExportedPolicy\n"
+        f"policy = ExportedPolicy({str(path)!r})\n"
+        "policy._predict(torch.rand(3, policy.obs_dim))\n"
+        "assert 'stable_baselines3' not in sys.modules\n"
+        "assert 'algorithms' not in sys.modules\n"
+    )
+    subprocess.run(
+        [sys.executable, "-c", script],
+        check=True,
+        cwd=Path(__file__).resolve().parents[1],
+    )
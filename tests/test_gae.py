@@ -0,0 +1,73 @@
+import pytest
+import torch
+
+from algorithms.sb3.rollout_buffer import (
+    compute_gae,
+    compute_gae_loop,
+    compute_vtrace,
+)
+
+
+def make_rollout(buffer_size, n_envs, seed=0):
+    """Random rollout with NaN padding for dead agents, as in IPPO."""
+    gen = torch.Generator().manual_seed(seed)
+    rewards = torch.randn(buffer_size, n_envs, generator=gen)
+    values = torch.randn(buffer_size, n_envs, generator=gen)
+    episode_starts = (
+        torch.rand(buffer_size, n_envs, generator=gen) < 0.05
+    ).float()
+    last_values = torch.randn(n_envs, generator=gen)
+    dones = (torch.rand(n_envs, generator=gen) < 0.1).float()
+
+    # Agents die at a random step and stay dead until the end
+    death_step = torch.randint(0, 2 * buffer_size, (n_envs,), generator=gen)
+    dead = torch.arange(buffer_size)[:, None] >= death_step[None, :]
+    for tensor in (rewards, values, episode_starts):
+        tensor[dead] = float("nan")
+    last_values[dead[-1]] = float("nan")
+    dones[dead[-1]] = float("nan")
+    return rewards, values, episode_starts, last_values, dones
+
+
+@pytest.mark.parametrize("buffer_size", [1, 2, 7, 91])
+@pytest.mark.parametrize("gamma,gae_lambda", [(0.99, 0.95), (1.0, 1.0)])
+def test_scan_matches_loop(buffer_size, gamma, gae_lambda):
+    rollout = make_rollout(buffer_size, n_envs=64)
+
+    expected = compute_gae_loop(*rollout, gamma, gae_lambda)
+    actual = compute_gae(*rollout, gamma, gae_lambda)
+
+    assert not torch.isnan(actual).any()
+    assert torch.allclose(actual, expected, atol=1e-4, rtol=1e-4)
+
+
+@pytest.mark.parametrize("buffer_size", [1, 7, 91])
+def test_on_policy_vtrace_returns_match_gae(buffer_size):
+    rollout = make_rollout(buffer_size, n_envs=64)
+    rewards, values = rollout[:2]
+    log_rhos = torch.zeros_like(rewards)
+
+    gae_advantages = compute_gae(*rollout, 0.99, 0.95)
+    advantages, returns = compute_vtrace(*rollout, log_rhos, 0.99, 0.95)
+
+    valid = ~torch.isnan(rewards)
+    assert not torch.isnan(advantages).any()
+    assert torch.allclose(
+        returns[valid], (gae_advantages + values)[valid], atol=1e-4
+    )
+
+
+def test_vtrace_truncates_importance_weights():
+    rollout = make_rollout(buffer_size=20, n_envs=64, seed=1)
+    gen = torch.Generator().manual_seed(2)
+    log_rhos = torch.rand(rollout[0].shape, generator=gen)
+
+    # Ratios above rho_bar = c_bar = 1 are truncated to 1, i.e. on-policy
+    truncated = compute_vtrace(*rollout, log_rhos, 0.99, 0.95)
+    on_policy = compute_vtrace(*rollout, torch.zeros_like(log_rhos), 0.99, 0.95)
+    for actual, expected in zip(truncated, on_policy):
+        assert torch.allclose(actual, expected, equal_nan=True)
+
+    # Ratios below one shrink the correction toward the current values
+    advantages, returns = compute_vtrace(*rollout, -log_rhos, 0.99, 0.95)
+    assert not torch.allclose(returns, on_policy[1], equal_nan=True)
@@ -0,0 +1,91 @@
+import torch
+
+from networks.perm_eq_late_fusion import LateFusionNet
+from pygpudrive.env import constants
+from tests.conftest import MAX_AGENTS, ROADGRAPH_TOP_K, late_fusion_configs
+
+BATCH_SIZE = 16
+
+
+def make_net(masked_encoders, shared_encoder=False):
+    return LateFusionNet(
+        None, *late_fusion_configs(masked_encoders, shared_encoder)
+    )
+
+
+def make_entities(num_entities, feat_dim, num_valid):
+    """Entities with `num_valid[i]` valid slots in observation i, followed
+    by padding (zeros with the `None` type set)."""
+    entities = torch.zeros(BATCH_SIZE, num_entities, feat_dim)
+    entities[..., constants.ENTITY_CONT_FEAT_DIM] = 1
+    for i, count in enumerate(num_valid):
+        entities[i, :count] = torch.rand(count, feat_dim) + 0.1
+    return entities
+
+
+def make_obs():
+    num_valid_partners = torch.randint(0, MAX_AGENTS, (BATCH_SIZE,))
+    num_valid_partners[0] = MAX_AGENTS - 1  # No padding
+    num_valid_road_points = torch.randint(
+        0, ROADGRAPH_TOP_K + 1, (BATCH_SIZE,)
+    )
+    num_valid_road_points[1] = 0  # Only padding
+    ego_state = torch.rand(BATCH_SIZE, constants.EGO_FEAT_DIM)
+    partners = make_entities(
+        MAX_AGENTS - 1, constants.PARTNER_FEAT_DIM, num_valid_partners
+    )
+    road_graph = make_entities(
+        ROADGRAPH_TOP_K, constants.ROAD_GRAPH_FEAT_DIM, num_valid_road_points
+    )
+    return torch.cat(
+        [ego_state, partners.flatten(1), road_graph.flatten(1)], dim=1
+    )
+
+
+def test_masked_encoders_match_dense_encoders():
+    torch.manual_seed(0)
+    dense = make_net(masked_encoders=False)
+    masked = make_net(masked_encoders=True)
+    masked.load_state_dict(dense.state_dict())
+    obs = make_obs()
+
+    for expected, actual in zip(dense(obs), masked(obs)):
+        assert torch.allclose(expected, actual, atol=1e-6)
+
+
+def test_masked_encoders_gradients_match():
+    torch.manual_seed(0)
+    dense = make_net(masked_encoders=False)
+    masked = make_net(masked_encoders=True)
+    masked.load_state_dict(dense.state_dict())
+    obs = make_obs()
+
+    dense.forward_actor(obs).sum().backward()
+    masked.forward_actor(obs).sum().backward()
+
+    for (name, expected), actual in zip(
+        dense.named_parameters(), masked.parameters()
+    ):
+        if expected.grad is not None:
+            assert torch.allclose(expected.grad, actual.grad, atol=1e-5), name
+
+
+def test_shared_encoder_feeds_both_heads():
+    torch.manual_seed(0)
+    separate = make_net(masked_encoders=False)
+    shared = make_net(masked_encoders=True, shared_encoder=True)
+    obs = make_obs()
+
+    assert not hasattr(shared, "val_ro_net")
+    assert sum(p.numel() for p in shared.parameters()) < sum(
+        p.numel() for p in separate.parameters()
+    )
+
+    latent_pi, latent_vf = shared(obs)
+    assert torch.allclose(latent_pi, shared.forward_actor(obs))
+    assert torch.allclose(latent_vf, shared.forward_critic(obs))
+
+    # The value loss trains the shared encoders
+    shared.forward_critic(obs).sum().backward()
+    assert shared.actor_ro_net[0].weight.grad is not None
+    assert shared.actor_out_net[0].weight.grad is None
@@ -0,0 +1,56 @@
+import gymnasium as gym
+import numpy as np
+import torch
+
+from networks.basic_ffn import FeedForwardPolicy
+from pygpudrive.agents.exported_policy import export_policy
+from pygpudrive.agents.policy_actor import PolicyActor
+
+NUM_WORLDS = 4
+MAX_AGENTS = 5
+OBS_DIM = 12
+
+
+def make_actor(tmp_path, valid_agent_mask):
+    torch.manual_seed(0)
+    policy = FeedForwardPolicy(
+        observation_space=gym.spaces.Box(
+            low=-np.inf, high=np.inf, shape=(OBS_DIM,), dtype=np.float32
+        ),
+        action_space=gym.spaces.Discrete(9),
+        lr_schedule=lambda _: 3e-4,
+    )
+    path = tmp_path / "policy.pt"
+    export_policy(policy, path)
+    return PolicyActor(
+        is_controlled_func=torch.arange(MAX_AGENTS) != 1,
+        valid_agent_mask=valid_agent_mask,
+        saved_model_path=path,
+        device="cpu",
+    )
+
+
+def test_select_action_matches_per_world_predict(tmp_path):
+    valid_agent_mask = torch.tensor(
+        [
+            [True, True, True, False, False],
+            [False, False, False, False, False],
+            [True, True, True, True, True],
+            [False, True, False, False, True],
+        ]
+    )
+    actor = make_actor(tmp_path, valid_agent_mask)
+    obs = torch.randn(NUM_WORLDS, MAX_AGENTS, OBS_DIM)
+
+    action_lists = actor.select_action(obs)
+    action_tensor = actor.select_action_tensor(obs)
+
+    assert len(action_lists) == NUM_WORLDS
+    for world_idx, actor_ids in enumerate(actor.actor_ids):
+        expected = actor.policy._predict(obs[world_idx, actor_ids])
+        assert torch.equal(action_lists[world_idx], expected)
+        assert torch.equal(action_tensor[world_idx, actor_ids], expected)
+
+    not_controlled = ~actor.valid_and_controlled_mask
+    assert action_tensor.shape == (NUM_WORLDS, MAX_AGENTS)
+    assert (action_tensor[not_controlled] == 0).all()
@@ -0,0 +1,106 @@
+import gymnasium as gym
+import numpy as np
+import pytest
+import torch
+
+from networks.basic_ffn import FeedForwardPolicy
+from pygpudrive.agents.policy_actor import (
+    PolicyActor,
+    action_agreement,
+    quantize_policy,
+)
+from tests.conftest import make_late_fusion_obs, make_late_fusion_policy
+
+OBS_DIM = 32
+NUM_ACTIONS = 9
+
+
+def make_policy():
+    torch.manual_seed(0)
+    return FeedForwardPolicy(
+        observation_space=gym.spaces.Box(
+            low=-np.inf, high=np.inf, shape=(OBS_DIM,), dtype=np.float32
+        ),
+        action_space=gym.spaces.Discrete(NUM_ACTIONS),
+        lr_schedule=lambda _: 3e-4,
+    )
+
+
+class PickledModel:
+    """Model class for `PolicyActor` that loads a pickled policy."""
+
+    def __init__(self, policy):
+        self.policy = policy
+
+    @classmethod
+    def load(cls, path, device):
+        return cls(torch.load(path, map_location=device, weights_only=False))
+
+
+def test_quantized_policy_agrees_with_float_policy():
+    policy = make_policy()
+    quantized = quantize_policy(policy)
+    obs = torch.randn(1024, OBS_DIM)
+
+    assert not any(
+        type(module) is torch.nn.Linear for module in quantized.modules()
+    )
+    # The float policy is left untouched
+    assert any(type(module) is torch.nn.Linear for module in policy.modules())
+    assert action_agreement(policy, quantized, obs) >= 0.95
+
+
+def test_quantize_requires_cpu():
+    with pytest.raises(ValueError):
+        PolicyActor(
+            is_controlled_func=torch.ones(4, dtype=torch.bool),
+            valid_agent_mask=torch.ones(1, 4, dtype=torch.bool),
+            saved_model_path="policy.zip",
+            device="cuda",
+            quantize=True,
+        )
+
+
+@pytest.mark.parametrize("masked_encoders", [False, True])
+def test_quantized_late_fusion_policy_agrees_with_float_policy(
+    masked_encoders,
+):
+    torch.manual_seed(0)
+    policy = make_late_fusion_policy(
+        gym.spaces.Discrete(NUM_ACTIONS), masked_encoders
+    )
+    quantized = quantize_policy(policy)
+    obs = make_late_fusion_obs(num_obs=1024)
+
+    assert not any(
+        type(module) is torch.nn.Linear for module in quantized.modules()
+    )
+    assert action_agreement(policy, quantized, obs) >= 0.9
+
+
+@pytest.mark.parametrize("deterministic", [True, False])
+def test_policy_actor_check_quantization(tmp_path, deterministic):
+    path = tmp_path / "policy.zip"
+    torch.save(make_policy(), path)
+    actor = PolicyActor(
+        is_controlled_func=torch.ones(4, dtype=torch.bool),
+        valid_agent_mask=torch.ones(2, 4, dtype=torch.bool),
+        saved_model_path=path,
+        model_class=PickledModel,
+        deterministic=deterministic,
+        device="cpu",
+        quantize=True,
+    )
+    obs = torch.randn(1024, OBS_DIM)
+
+    assert not any(
+        type(module) is torch.nn.Linear for module in actor.policy.modules()
+    )
+    agreement = actor.check_quantization(obs, min_agreement=0.95)
+    assert agreement == action_agreement(actor.float_policy, actor.policy, obs)
+    assert actor.select_action_tensor(obs[:8].view(2, 4, OBS_DIM)).shape == (
+        2,
+        4,
+    )
+    with pytest.raises(ValueError):
+        actor.check_quantization(obs, min_agreement=1.01)
@@ -0,0 +1,128 @@
+import gymnasium as gym
+import numpy as np
+import pytest
+import torch
+
+from algorithms.sb3.callbacks import MultiAgentCallback
+from algorithms.sb3.rollout_buffer import (
+    MaskedRolloutBuffer,
+    RaggedRolloutBuffer,
+)
+
+BUFFER_SIZE = 12
+N_ENVS = 16
+OBS_DIM = 5
+
+
+def make_buffers(**kwargs):
+    observation_space = gym.spaces.Box(-np.inf, np.inf, (OBS_DIM,), np.float32)
+    action_space = gym.spaces.Discrete(7)
+    return [
+        buffer_cls(
+            BUFFER_SIZE,
+            observation_space,
+            action_space,
+            device="cpu",
+            n_envs=N_ENVS,
+            **kwargs,
+        )
+        for buffer_cls in (MaskedRolloutBuffer, RaggedRolloutBuffer)
+    ]
+
+
+def fill(buffers, seed=0):
+    """Add a rollout in which agents die early and stay NaN padded."""
+    gen = torch.Generator().manual_seed(seed)
+    death_step = torch.randint(1, 2 * BUFFER_SIZE, (N_ENVS,), generator=gen)
+    episode_starts = torch.zeros(N_ENVS)
+    for step in range(BUFFER_SIZE):
+        dead = step >= death_step
+        obs = torch.randn(N_ENVS, OBS_DIM, generator=gen)
+        actions = torch.randint(0, 7, (N_ENVS,), generator=gen).float()
+        rewards = torch.randn(N_ENVS, generator=gen)
+        values = torch.randn(N_ENVS, 1, generator=gen)
+        log_probs = torch.randn(N_ENVS, generator=gen)
+        for tensor in (obs, actions, rewards, values, log_probs):
+            tensor[dead] = float("nan")
+        for buffer in buffers:
+            buffer.add(
+                obs,
+                actions.reshape(-1, 1),
+                rewards,
+                episode_starts.clone(),
+                values,
+                log_probs,
+            )
+        # Done on the last valid step, NaN afterwards
+        episode_starts = torch.zeros(N_ENVS)
+        episode_starts[step + 1 >= death_step] = float("nan")
+        episode_starts[step + 1 == death_step] = 1.0
+
+    last_values = torch.randn(N_ENVS, generator=gen)
+    dones = torch.zeros(N_ENVS)
+    last_values[BUFFER_SIZE >= death_step] = float("nan")
+    dones[BUFFER_SIZE >= death_step] = float("nan")
+    for buffer in buffers:
+        buffer.compute_returns_and_advantage(last_values, dones)
+
+
+def test_matches_masked_buffer():
+    masked, ragged = make_buffers()
+    fill([masked, ragged])
+
+    valid = ~torch.isnan(masked.rewards)
+    assert ragged.num_samples == valid.sum().item()
+    assert torch.equal(ragged.observations, masked.observations[valid])
+    assert torch.equal(ragged.actions, masked.actions[valid])
+    assert torch.allclose(ragged.advantages, masked.advantages[valid])
+    assert torch.allclose(ragged.returns, masked.returns[valid])
+
+    samples = list(ragged.get(batch_size=10))
+    assert (
+        sum(len(batch.advantages) for batch in samples) == ragged.num_samples
+    )
+
+
+def test_callback_counts_the_same_episodes():
+    masked, ragged = make_buffers()
+    fill([masked, ragged])
+
+    rewards, completions = MultiAgentCallback._rollout_totals(masked)
+    ragged_rewards, ragged_completions = MultiAgentCallback._rollout_totals(
+        ragged
+    )
+    assert completions > 0
+    assert completions == torch.nan_to_num(masked.episode_starts).sum()
+    assert ragged_completions == completions
+    assert ragged_rewards == pytest.approx(rewards, rel=1e-5)
+
+
+def test_storage_is_reused_across_rollouts():
+    _, ragged = make_buffers()
+    fill([ragged], seed=0)
+    capacity = ragged.capacity
+
+    ragged.reset()
+    assert ragged.num_samples == 0
+    assert ragged.capacity == capacity
+    fill([ragged], seed=0)
+    assert ragged.capacity == capacity
+
+
+@pytest.mark.parametrize("batch_size", [None, 7, 64])
+def test_minibatches_cover_valid_samples_once(batch_size):
+    masked, ragged = make_buffers()
+    fill([masked, ragged])
+
+    for buffer in (masked, ragged):
+        # Outputs are reused between minibatches, so copy them right away
+        advantages = torch.cat(
+            [batch.advantages.clone() for batch in buffer.get(batch_size)]
+        )
+        expected = buffer.valid_samples("advantages")
+        assert torch.equal(advantages.sort().values, expected.sort().values)
+
+
+def test_ragged_buffer_rejects_async_transfer():
+    with pytest.raises(ValueError):
+        make_buffers(async_transfer=True)
@@ -0,0 +1,88 @@
+import gymnasium as gym
+import numpy as np
+import pytest
+import torch
+
+from algorithms.sb3.rollout_buffer import MaskedRolloutBuffer
+
+BUFFER_SIZE = 12
+N_ENVS = 16
+OBS_DIM = 5
+
+
+def make_buffer(device="cpu", **kwargs):
+    return MaskedRolloutBuffer(
+        BUFFER_SIZE,
+        gym.spaces.Box(-np.inf, np.inf, (OBS_DIM,), np.float32),
+        gym.spaces.Discrete(7),
+        device=device,
+        n_envs=N_ENVS,
+        **kwargs,
+    )
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="needs CUDA")
+def test_async_transfer_matches_blocking_copies():
+    buffers = [
+        make_buffer(device="cuda", async_transfer=async_transfer)
+        for async_transfer in (False, True)
+    ]
+    assert buffers[1].observations.is_pinned()
+
+    for _ in range(BUFFER_SIZE):
+        step = (
+            torch.randn(N_ENVS, OBS_DIM, device="cuda"),
+            torch.randint(0, 7, (N_ENVS, 1), device="cuda").float(),
+            torch.randn(N_ENVS, device="cuda"),
+            torch.zeros(N_ENVS, device="cuda"),
+            torch.randn(N_ENVS, 1, device="cuda"),
+            torch.randn(N_ENVS, device="cuda"),
+        )
+        for buffer in buffers:
+            buffer.add(*step)
+    for buffer in buffers:
+        buffer.compute_returns_and_advantage(
+            torch.zeros(N_ENVS, device="cuda"),
+            torch.zeros(N_ENVS, device="cuda"),
+        )
+
+    blocking, non_blocking = buffers
+    for name in ("observations", "actions", "rewards", "values", "log_probs"):
+        assert torch.equal(
+            getattr(blocking, name), getattr(non_blocking, name)
+        )
+    assert torch.equal(blocking.advantages, non_blocking.advantages)
+
+
+def test_storage_survives_agent_count_changes():
+    buffer = make_buffer()
+    storage_ptr = buffer.observations.data_ptr()
+
+    for n_envs in (N_ENVS // 2, 3, N_ENVS):
+        buffer.n_envs = n_envs
+        buffer.reset()
+        assert buffer.observations.data_ptr() == storage_ptr
+        assert buffer.observations.shape == (BUFFER_SIZE, n_envs, OBS_DIM)
+        assert buffer.rewards.is_contiguous()
+
+        for _ in range(BUFFER_SIZE):
+            buffer.add(
+                torch.randn(n_envs, OBS_DIM),
+                torch.zeros(n_envs, 1),
+                torch.randn(n_envs),
+                torch.zeros(n_envs),
+                torch.randn(n_envs, 1),
+                torch.randn(n_envs),
+            )
+        buffer.compute_returns_and_advantage(
+            torch.zeros(n_envs), torch.zeros(n_envs)
+        )
+        assert torch.equal(buffer.returns, buffer.advantages + buffer.values)
+        num_samples = sum(len(batch.returns) for batch in buffer.get(7))
+        assert num_samples == BUFFER_SIZE * n_envs
+
+    # More envs than the capacity grow the storage
+    buffer.n_envs = 2 * N_ENVS
+    buffer.reset()
+    assert buffer.max_n_envs == 2 * N_ENVS
+    assert buffer.observations.shape == (BUFFER_SIZE, 2 * N_ENVS, OBS_DIM)
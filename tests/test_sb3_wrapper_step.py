@@ -0,0 +1,221 @@
+from types import SimpleNamespace
+
+import gymnasium as gym
+import numpy as np
+import pytest
+import torch
+
+from algorithms.sb3.rollout_buffer import MaskedRolloutBuffer
+from pygpudrive.env.wrappers.sb3_wrapper import SB3MultiAgentEnv
+
+NUM_WORLDS = 3
+MAX_AGENTS = 4
+OBS_DIM = 5
+INFO_DIM = 5
+EPISODE_LEN = 10
+
+
+class FakeEnv:
+    """Environment stub whose agents finish at scripted steps."""
+
+    def __init__(self, done_steps):
+        self.done_steps = done_steps
+        self.step_count = torch.zeros(
+            NUM_WORLDS, MAX_AGENTS, device=done_steps.device
+        )
+        self.reset_calls = []
+        self.sim = SimpleNamespace(reset=self._reset_worlds)
+
+    def _reset_worlds(self, world_idx):
+        self.reset_calls.append(world_idx)
+        self.step_count[world_idx] = 0
+
+    def step_dynamics(self, actions):
+        self.step_count += 1
+
+    def get_rewards(self):
+        return self.step_count.clone()
+
+    def get_dones(self):
+        return (self.step_count >= self.done_steps).float()
+
+    def get_infos(self):
+        return self.step_count.unsqueeze(-1).expand(-1, -1, INFO_DIM) * 10
+
+    def get_obs(self):
+        return self.step_count.unsqueeze(-1).expand(-1, -1, OBS_DIM) + 0.5
+
+    def reset(self):
+        self.step_count.zero_()
+
+
+def make_env(controlled_agent_mask, done_steps):
+    env = SB3MultiAgentEnv.__new__(SB3MultiAgentEnv)
+    env._env = FakeEnv(done_steps)
+    env.config = SimpleNamespace(episode_len=EPISODE_LEN)
+    env.num_worlds = NUM_WORLDS
+    env.max_agent_count = MAX_AGENTS
+    env.device = done_steps.device
+    env.controlled_agent_mask = controlled_agent_mask
+    env.controlled_agent_idx = env._flat_controlled_agent_idx()
+    env.num_envs = int(controlled_agent_mask.sum())
+    env.action_space = gym.spaces.Discrete(3)
+    env.obs_dim = OBS_DIM
+    env.info_dim = INFO_DIM
+    env.agent_step = torch.zeros(NUM_WORLDS, MAX_AGENTS, device=env.device)
+    env.actions_tensor = torch.zeros(NUM_WORLDS, MAX_AGENTS, device=env.device)
+    env.num_episodes = 0
+    env._allocate_step_buffers()
+    return env
+
+
+def reference_step(controlled, dead, reward, done, info):
+    """Masked outputs as built by the former per-world loop."""
+    rews = torch.where(dead, torch.nan, reward)[controlled]
+    dones = torch.where(dead, torch.nan, done)[controlled]
+    done_worlds = torch.where(
+        (done * controlled).sum(dim=1) == controlled.sum(dim=1)
+    )[0]
+    dead = torch.logical_or(dead, done)
+    for world_idx in done_worlds:
+        dead[world_idx, :] = ~controlled[world_idx, :]
+    return rews, dones, info[controlled], dead, done_worlds.tolist()
+
+
+def test_step_matches_per_world_loop():
+    controlled = torch.tensor(
+        [
+            [True, True, False, False],
+            [True, True, True, False],
+            [False, True, False, True],
+        ]
+    )
+    done_steps = torch.tensor(
+        [[2, 3, 1, 1], [1, 4, 2, 1], [9, 2, 9, 2]], dtype=torch.float
+    )
+    env = make_env(controlled, done_steps)
+    env.reset()
+    dead = ~controlled
+
+    for _ in range(8):
+        fake = env._env
+        fake.step_dynamics(None)
+        reward, done, info = fake.get_rewards(), fake.get_dones(), fake.get_infos()
+        fake.step_count -= 1
+        expected_rews, expected_dones, expected_info, dead, expected_resets = (
+            reference_step(controlled, dead, reward, done, info)
+        )
+        resets_before = len(fake.reset_calls)
+
+        obs, rews, dones, infos = env.step(torch.zeros(env.num_envs))
+
+        assert torch.equal(rews.isnan(), expected_rews.isnan())
+        assert torch.equal(rews.nan_to_num(-1), expected_rews.nan_to_num(-1))
+        assert torch.equal(
+            dones.nan_to_num(-1), expected_dones.nan_to_num(-1)
+        )
+        assert torch.equal(infos, expected_info)
+        assert torch.equal(env.dead_agent_mask, dead)
+        assert torch.equal(obs, fake.get_obs()[controlled])
+        if expected_resets:
+            assert fake.reset_calls[resets_before:] == [expected_resets]
+
+
+def test_step_outputs_alternate_buffers():
+    controlled = torch.ones(NUM_WORLDS, MAX_AGENTS, dtype=torch.bool)
+    env = make_env(controlled, torch.full((NUM_WORLDS, MAX_AGENTS), 100.0))
+    env.reset()
+    actions = torch.zeros(env.num_envs)
+
+    first = env.step(actions)
+    first_obs = first[0].clone()
+    second = env.step(actions)
+
+    # The previous outputs are still valid after the next step
+    assert torch.equal(first[0], first_obs)
+    assert first[0].data_ptr() != second[0].data_ptr()
+
+    third = env.step(actions)
+    assert third[0].data_ptr() == first[0].data_ptr()
+
+    copied = env.step(actions, copy=True)
+    assert copied[0].data_ptr() not in (
+        first[0].data_ptr(),
+        second[0].data_ptr(),
+    )
+
+
+def test_info_dict_and_obs_extrema_stay_on_device():
+    controlled = torch.tensor(
+        [
+            [True, True, False, False],
+            [True, False, True, False],
+            [False, True, False, True],
+        ]
+    )
+    done_steps = torch.tensor(
+        [[1, 1, 5, 5], [3, 9, 3, 9], [9, 2, 9, 5]], dtype=torch.float
+    )
+    env = make_env(controlled, done_steps)
+    env.reset()
+
+    # Only world 0 is done after the first step, its two controlled agents
+    # report an info of 10 in every column
+    env.step(torch.zeros(env.num_envs))
+
+    assert env.info_dict["num_controlled_agents"] == 2
+    for name in [
+        "off_road",
+        "veh_collisions",
+        "non_veh_collision",
+        "goal_achieved",
+    ]:
+        assert isinstance(env.info_dict[name], torch.Tensor)
+        assert env.info_dict[name] == 20
+
+    env.step(torch.zeros(env.num_envs))
+    obs_min, obs_max = env.obs_alive_extrema()
+    assert obs_min == env.obs_alive.min()
+    assert obs_max == env.obs_alive.max()
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="needs CUDA")
+def test_async_transfer_of_alternating_step_buffers():
+    controlled = torch.ones(NUM_WORLDS, MAX_AGENTS, dtype=torch.bool)
+    done_steps = torch.full((NUM_WORLDS, MAX_AGENTS), 3.0)
+    env = make_env(controlled.cuda(), done_steps.cuda())
+    num_steps = 4 * EPISODE_LEN
+    buffer = MaskedRolloutBuffer(
+        num_steps,
+        gym.spaces.Box(-np.inf, np.inf, (OBS_DIM,), np.float32),
+        env.action_space,
+        device="cuda",
+        n_envs=env.num_envs,
+        async_transfer=True,
+    )
+    actions = torch.zeros(env.num_envs, 1, device="cuda")
+    values = torch.zeros(env.num_envs, 1, device="cuda")
+    log_probs = torch.zeros(env.num_envs, device="cuda")
+
+    # As in IPPO.collect_rollouts, the samples of a step are added after
+    # the next step was taken
+    last_obs = env.reset()
+    last_episode_starts = torch.zeros(env.num_envs, device="cuda")
+    expected_obs, expected_episode_starts = [], []
+    for _ in range(num_steps):
+        buffer.wait_for_pending_copies()
+        new_obs, rewards, dones, _ = env.step(actions.flatten())
+        expected_obs.append(last_obs.clone())
+        expected_episode_starts.append(last_episode_starts.clone())
+        # Delay the copies, so they overlap with the next step
+        torch.cuda._sleep(1_000_000)
+        buffer.add(
+            last_obs, actions, rewards, last_episode_starts, values, log_probs
+        )
+        last_obs, last_episode_starts = new_obs, dones
+    buffer.compute_returns_and_advantage(values.flatten(), dones)
+
+    assert torch.equal(buffer.observations, torch.stack(expected_obs).cpu())
+    assert torch.equal(
+        buffer.episode_starts, torch.stack(expected_episode_starts).cpu()
+    )
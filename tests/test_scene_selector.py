@@ -0,0 +1,54 @@
+import pytest
+
+from pygpudrive.env.config import SceneConfig, SelectionDiscipline
+from pygpudrive.env.scene_selector import select_scenes, shard_scenes
+
+NUM_SCENES = 10
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for idx in range(NUM_SCENES):
+        (tmp_path / f"tfrecord-{idx:05d}.json").touch()
+    return tmp_path
+
+
+def test_shards_are_disjoint_and_cover_the_dataset():
+    scenes = [f"scene_{idx}" for idx in range(NUM_SCENES)]
+    shards = [shard_scenes(scenes, idx, 3) for idx in range(3)]
+
+    assert sorted(sum(shards, [])) == sorted(scenes)
+    assert [len(shard) for shard in shards] == [4, 3, 3]
+
+    with pytest.raises(ValueError):
+        shard_scenes(scenes, 3, 3)
+    with pytest.raises(ValueError):
+        shard_scenes(scenes[:2], 0, 3)
+
+
+@pytest.mark.parametrize(
+    "discipline",
+    [SelectionDiscipline.PAD_N, SelectionDiscipline.K_UNIQUE_N],
+)
+def test_ranks_never_select_the_same_scene(data_dir, discipline):
+    num_shards = 4
+    selected = [
+        set(
+            select_scenes(
+                SceneConfig(
+                    path=str(data_dir),
+                    num_scenes=8,
+                    discipline=discipline,
+                    k_unique_scenes=2,
+                    shard_index=shard_index,
+                    num_shards=num_shards,
+                )
+            )
+        )
+        for shard_index in range(num_shards)
+    ]
+
+    for shard_index, scenes in enumerate(selected):
+        assert len(scenes) > 0
+        for other in selected[shard_index + 1 :]:
+            assert scenes.isdisjoint(other)